@@ -1,9 +1,22 @@
-from flask import Flask, render_template, request, jsonify, session
-from chatbot.chat import handle_chat
+from flask import Flask, Response, g, render_template, request, jsonify, session, stream_with_context
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from chatbot.chat import handle_chat, handle_chat_stream
+from chatbot import vector_search, context_assembler
+from chatbot.answer_cache import answer_cache
+from chatbot.conversation import ConversationState
 from dotenv import load_dotenv
-from utils.calendly_client import CalendlyClient
+from utils.calendly_client import calendly_client, CalendlySlotUnavailableError
+from utils.session_store import ServerSideSessionInterface, init_session
+from utils import metrics
+from utils.memory_governor import memory_governor, LEVELS as MEMORY_LEVELS
+from crm.hubspot_client import contact_cache
+from crm.sync_queue import crm_queue
+import time
 import traceback
 import os
+import secrets
+from datetime import timedelta
+import json
 import logging
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -16,18 +29,64 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Load the embedding model and index at import time in preload mode. Under
+# gunicorn --preload this runs once in the master and workers inherit it.
+if vector_search.VECTOR_SEARCH_MODE == "preload":
+    vector_search.preload()
+
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'some_secret_key')
+app.config.update(
+    PERMANENT_SESSION_LIFETIME=timedelta(seconds=int(os.getenv('PERMANENT_SESSION_LIFETIME', '3600'))),
+    SESSION_COOKIE_SECURE=os.getenv('SESSION_COOKIE_SECURE', 'False').lower() == 'true',
+    SESSION_COOKIE_HTTPONLY=os.getenv('SESSION_COOKIE_HTTPONLY', 'True').lower() == 'true'
+)
+
+# Session data lives server-side (SESSION_BACKEND); the cookie only carries its id
+session_store = init_session(app)
+
+# Bearer token required for /metrics; unset turns /metrics off (404)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Chat result fields only sent when the request has an X-Debug-Timings: 1 header
+DEBUG_FIELDS = ("timings", "prompt")
+
+# Registered before the rate limiter's hook, so rejected requests are timed too
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    # For /api/chat/stream this is the time to the first byte, not the whole stream
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - started, endpoint=request.endpoint or "unmatched", status=response.status_code
+        )
+    return response
 
-# Initialize rate limiter
+# Initialize rate limiter (RATELIMIT_ENABLED=False turns it off, e.g. for load tests)
+app.config["RATELIMIT_ENABLED"] = os.getenv("RATELIMIT_ENABLED", "True").lower() == "true"
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"]
 )
 
-# Initialize Calendly client
-calendly_client = CalendlyClient()
+# /api/chat and /api/chat/stream (and asgi.py's /api/chat) share one budget
+CHAT_RATE_LIMIT = "10 per minute"
+chat_limit = limiter.shared_limit(CHAT_RATE_LIMIT, scope="chat")
+
+# With cookie sessions, signs the conversation a streamed turn hands back to the browser,
+# see /api/chat/commit
+history_signer = URLSafeTimedSerializer(app.secret_key, salt="chat-history")
+
+# Fetch Calendly user details and event types in the background (the client is shared with the chat handler)
+calendly_client.start()
+
+# Sample RSS and shrink caches, unload the model or shed chat turns near the memory limit
+memory_governor.start()
 
 # Ordered fields to collect and corresponding questions
 fields = ['name', 'email', 'budget']
@@ -37,100 +96,284 @@ questions = {
     'budget': "What's your budget for finding the perfect property?"
 }
 
+@metrics.register_collector
+def collect_app_metrics():
+    """Cache, model, queue and memory gauges for /metrics."""
+    import psutil
+
+    search = vector_search.get_stats()
+    answers = answer_cache.stats()
+    contacts = contact_cache.stats()
+    availability = calendly_client.availability.stats()
+    context = context_assembler.get_stats()
+    memory = memory_governor.stats()
+    return [
+        ("process_resident_memory_bytes", "Resident memory of this process.", "gauge",
+         [({}, psutil.Process().memory_info().rss)]),
+        ("memory_pressure_level", "Memory governor level: 0 ok, 1 shrink, 2 unload, 3 shed.", "gauge",
+         [({}, MEMORY_LEVELS.index(memory["level"]))]),
+        ("memory_governor_actions_total", "Times the memory governor ran a level's responses.", "counter",
+         [({"level": level}, memory[f"{level}_actions"]) for level in MEMORY_LEVELS[1:]]),
+        ("memory_governor_recycles_total", "Times the memory governor recycled the worker.", "counter",
+         [({}, memory["recycles"])]),
+        ("vector_search_model_loaded", "Whether the embedding model and index are in memory.", "gauge",
+         [({}, search["loaded"])]),
+        ("vector_search_loads_total", "Embedding model loads.", "counter", [({}, search.get("loads"))]),
+        ("cache_hits_total", "Cache hits by cache.", "counter", [
+            ({"cache": "query"}, search["query_cache"].get("hits")),
+            ({"cache": "answer"}, answers["hits"] + answers["semantic_hits"]),
+            ({"cache": "contact"}, contacts["hits"]),
+            ({"cache": "availability"}, availability["hits"])
+        ]),
+        ("cache_misses_total", "Cache misses by cache.", "counter", [
+            ({"cache": "query"}, search["query_cache"].get("misses")),
+            ({"cache": "answer"}, answers["misses"]),
+            ({"cache": "contact"}, contacts["misses"]),
+            ({"cache": "availability"}, availability["fetches"])
+        ]),
+        ("crm_queue_depth", "Queued HubSpot updates by status.", "gauge",
+         [({"status": status}, count) for status, count in crm_queue.depth().items()]),
+        ("context_tokens_saved_total", "Prompt tokens removed by the context assembler.", "counter",
+         [({}, context["tokens_saved"])])
+    ]
+
+def with_debug_fields(result):
+    """The chat result, without timings and the prompt report unless X-Debug-Timings is set."""
+    if request.headers.get("X-Debug-Timings", "").lower() in ("1", "true"):
+        return result
+    return {key: value for key, value in result.items() if key not in DEBUG_FIELDS}
+
+@app.route("/metrics")
+@limiter.exempt
+def metrics_endpoint():
+    """Latency histograms and cache, model, queue and memory gauges in the Prometheus text format."""
+    if not METRICS_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+    if not secrets.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/")
 def index():
     logger.info("Serving index page")
     return render_template("index.html")
 
+EMPTY_MESSAGE_RESPONSE = {
+    "error": "Message cannot be empty.",
+    "answer": "Please type a message to continue.",
+    "lead_score": 0,
+    "lead_status": "Unknown",
+    "crm_status": "Skipped",
+    "crm_response": "No message provided",
+    "raw_llm_reply": ""
+}
+
+CHAT_ERROR_RESPONSE = {
+    "answer": "Oops, something went wrong! Let's try again.",
+    "lead_score": 0,
+    "lead_status": "Unknown",
+    "crm_status": "Error",
+    "crm_response": "CRM update failed.",
+    "raw_llm_reply": ""
+}
+
+def load_conversation():
+    """The session's ConversationState."""
+    return ConversationState.from_dict(session.get('conversation'))
+
+def save_conversation(conversation):
+    session['conversation'] = conversation.to_dict()
+    session.modified = True
+
+def issue_commit_nonce():
+    """Bind the next commit_token to this cookie session: (session id, one-time nonce).
+
+    A new nonce replaces the previous one, so only the latest turn's token
+    can be committed, once.
+    """
+    if 'sid' not in session:
+        session['sid'] = secrets.token_urlsafe(16)
+    session['commit_nonce'] = secrets.token_urlsafe(16)
+    return session['sid'], session['commit_nonce']
+
+def collect_user_info(message):
+    """Initialize the session and handle the name/email/budget questions.
+
+    Returns the response payload while user info is being collected, or
+    None once the message should go to the chatbot.
+    """
+    # Initialize session variables if not present
+    if 'conversation' not in session:
+        session['conversation'] = ConversationState().to_dict()
+        logger.info("Initializing new chat session")
+    if 'user_info' not in session:
+        session['user_info'] = {}
+    if 'awaiting_field' not in session:
+        session['awaiting_field'] = 'name'
+
+    # Get session data
+    user_info = session.get('user_info', {})
+    awaiting_field = session.get('awaiting_field')
+
+    if not awaiting_field:
+        return None
+
+    user_info[awaiting_field] = message
+    session['user_info'] = user_info
+    session.modified = True
+
+    # Determine next field to collect
+    if awaiting_field == 'name':
+        session['awaiting_field'] = 'email'
+        answer = "What's a good email address to reach you at?"
+    elif awaiting_field == 'email':
+        session['awaiting_field'] = 'budget'
+        answer = "What's your budget for finding the perfect property?"
+    else:
+        session['awaiting_field'] = None
+        answer = "Great! Now, how can I help you find the perfect property today?"
+
+    conversation = load_conversation()
+    conversation.add_user(message)
+    conversation.add_bot(answer)
+    save_conversation(conversation)
+
+    return {
+        "answer": answer,
+        "lead_score": 10 * len(user_info),
+        "lead_status": "Collecting Info",
+        "crm_status": "Success",
+        "crm_response": "User info updated",
+        "raw_llm_reply": ""
+    }
+
+def chat_arguments(message):
+    """handle_chat / handle_chat_stream arguments for the current session."""
+    user_info = session.get('user_info', {})
+    return {
+        "name": user_info.get('name', 'Guest User'),
+        "email": user_info.get('email', 'guest@example.com'),
+        "message": message,
+        "conversation": load_conversation(),
+        "budget": user_info.get('budget', '')
+    }
+
 @app.route("/api/chat", methods=["POST"])
-@limiter.limit("10 per minute")
+@chat_limit
 def chat():
     try:
         data = request.get_json(force=True)
         message = data.get("message", "").strip()
 
         if not message:
-            return jsonify({
-                "error": "Message cannot be empty.",
-                "answer": "Please type a message to continue.",
-                "lead_score": 0,
-                "lead_status": "Unknown",
-                "crm_status": "Skipped",
-                "crm_response": "No message provided",
-                "raw_llm_reply": ""
-            }), 400
-
-        # Initialize session variables if not present
-        if 'chat_history' not in session:
-            session['chat_history'] = ""
-            logger.info("Initializing new chat session")
-        if 'user_info' not in session:
-            session['user_info'] = {}
-        if 'awaiting_field' not in session:
-            session['awaiting_field'] = 'name'
-
-        # Get session data
-        user_info = session.get('user_info', {})
-        chat_history = session.get('chat_history', "")
-        awaiting_field = session.get('awaiting_field')
+            return jsonify(EMPTY_MESSAGE_RESPONSE), 400
 
         # Handle user information collection
-        if awaiting_field:
-            user_info[awaiting_field] = message
-            session['user_info'] = user_info
-            session.modified = True
-
-            # Determine next field to collect
-            if awaiting_field == 'name':
-                session['awaiting_field'] = 'email'
-                answer = "What's a good email address to reach you at?"
-            elif awaiting_field == 'email':
-                session['awaiting_field'] = 'budget'
-                answer = "What's your budget for finding the perfect property?"
-            else:
-                session['awaiting_field'] = None
-                answer = "Great! Now, how can I help you find the perfect property today?"
-
-            chat_history += f"\nUser: {message}\nBot: {answer}"
-            session['chat_history'] = chat_history
-            session.modified = True
-
-            return jsonify({
-                "answer": answer,
-                "lead_score": 10 * len(user_info),
-                "lead_status": "Collecting Info",
-                "crm_status": "Success",
-                "crm_response": "User info updated",
-                "raw_llm_reply": ""
-            })
+        info_response = collect_user_info(message)
+        if info_response is not None:
+            return jsonify(info_response)
 
         # Normal conversation flow
-        result = handle_chat(
-            name=user_info.get('name', 'Guest User'),
-            email=user_info.get('email', 'guest@example.com'),
-            message=message,
-            chat_history=chat_history,
-            budget=user_info.get('budget', '')
-        )
+        arguments = chat_arguments(message)
+        result = handle_chat(**arguments)
 
-        # Update session with new chat history
-        session['chat_history'] = result['chat_history']
-        session.modified = True
+        # handle_chat added this turn to the conversation
+        save_conversation(arguments["conversation"])
 
-        return jsonify(result)
+        return jsonify(with_debug_fields(result))
 
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
         logger.error(traceback.format_exc())
-        return jsonify({
-            "error": str(e),
-            "answer": "Oops, something went wrong! Let's try again.",
-            "lead_score": 0,
-            "lead_status": "Unknown",
-            "crm_status": "Error",
-            "crm_response": "CRM update failed.",
-            "raw_llm_reply": ""
-        }), 500
+        return jsonify(dict(CHAT_ERROR_RESPONSE, error=str(e))), 500
+
+def sse_event(event, data):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/api/chat/stream", methods=["POST"])
+@chat_limit
+def chat_stream():
+    """/api/chat as Server-Sent Events.
+
+    "token" events carry answer text as the LLM produces it, with the lead
+    score lines withheld. A final "done" event carries the /api/chat payload.
+    Server-side sessions are saved when the stream ends. Cookie sessions
+    have already been sent by then, so the payload includes a commit_token
+    that the browser posts to /api/chat/commit to save the turn.
+    """
+    try:
+        data = request.get_json(force=True)
+        message = data.get("message", "").strip()
+
+        if not message:
+            return jsonify(EMPTY_MESSAGE_RESPONSE), 400
+
+        info_response = collect_user_info(message)
+        arguments = chat_arguments(message)
+        # Set now: the session cookie goes out with the headers, before the turn ends
+        commit_binding = None
+        if info_response is None and not isinstance(app.session_interface, ServerSideSessionInterface):
+            commit_binding = issue_commit_nonce()
+    except Exception as e:
+        logger.error(f"Error in chat stream endpoint: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify(dict(CHAT_ERROR_RESPONSE, error=str(e))), 500
+
+    def generate():
+        if info_response is not None:
+            yield sse_event("token", {"text": info_response["answer"]})
+            yield sse_event("done", info_response)
+            return
+
+        try:
+            for kind, value in handle_chat_stream(**arguments):
+                if kind == "token":
+                    yield sse_event("token", {"text": value})
+                else:
+                    if isinstance(app.session_interface, ServerSideSessionInterface):
+                        # The cookie only holds the session id, so the turn can be saved directly
+                        save_conversation(arguments["conversation"])
+                        app.session_interface.persist(session, app)
+                    else:
+                        sid, nonce = commit_binding
+                        value["commit_token"] = history_signer.dumps({
+                            "sid": sid,
+                            "nonce": nonce,
+                            "conversation": arguments["conversation"].to_dict()
+                        })
+                    yield sse_event("done", with_debug_fields(value))
+        except Exception as e:
+            logger.error(f"Error in chat stream endpoint: {str(e)}")
+            logger.error(traceback.format_exc())
+            yield sse_event("error", dict(CHAT_ERROR_RESPONSE, error=str(e)))
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/api/chat/commit", methods=["POST"])
+def commit_chat():
+    """Save the conversation from a streamed turn's commit_token into the session."""
+    data = request.get_json(force=True)
+    try:
+        # The browser commits as soon as the stream ends, so tokens are short-lived
+        token = history_signer.loads(data.get("commit_token", ""), max_age=600)
+        sid, nonce, conversation = token["sid"], token["nonce"], token["conversation"]
+    except (BadSignature, TypeError, KeyError):
+        return jsonify({"error": "Invalid commit token"}), 400
+
+    # Only this session's latest turn, and only once
+    if not session.get('sid') or not secrets.compare_digest(sid, session['sid']) \
+            or not session.get('commit_nonce') or not secrets.compare_digest(nonce, session['commit_nonce']):
+        return jsonify({"error": "Commit token is not for this session or was already used"}), 400
+    session.pop('commit_nonce')
+
+    save_conversation(ConversationState.from_dict(conversation))
+    return jsonify({"success": True})
 
 @app.route("/api/schedule", methods=["POST"])
 def schedule_viewing():
@@ -147,12 +390,18 @@ def schedule_viewing():
         if event:
             return jsonify({
                 "success": True,
+                # False: not booked yet, the user completes the booking at booking_url
+                "booked": event.get("booked", False),
                 "booking_url": event.get("booking_url"),
                 "event_id": event.get("uri")
             })
         else:
             return jsonify({"error": "Failed to create event"}), 500
 
+    except CalendlySlotUnavailableError:
+        return jsonify({"error": "That time is not available, please pick another slot"}), 409
+    except ValueError:
+        return jsonify({"error": "Start time must be ISO 8601, e.g. 2024-05-01T09:00:00Z"}), 400
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
@@ -167,11 +416,13 @@ def get_available_times():
             return jsonify({"error": "Start time and end time are required"}), 400
 
         available_times = calendly_client.get_available_times(start_time, end_time)
-        if available_times:
+        if available_times is not None:
             return jsonify(available_times)
         else:
             return jsonify({"error": "Failed to get available times"}), 500
 
+    except ValueError:
+        return jsonify({"error": "Times must be ISO 8601, e.g. 2024-05-01T09:00:00Z"}), 400
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
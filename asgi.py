@@ -0,0 +1,219 @@
+"""
+ASGI entry point: async /api/chat, /api/schedule and /api/available-times.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    gunicorn asgi:app --config gunicorn.conf.py -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:5000
+
+Under the default sync gunicorn worker every chat turn holds the worker for
+the whole Groq round trip. Here the LLM call is awaited on httpx, and
+retrieval, the CRM update and Calendly calls run in worker threads, so one
+worker serves many sessions at once (see benchmarks/concurrency.py).
+
+Everything else (the page, /api/chat/stream, /api/chat/commit) is served
+by the Flask app from app.py, mounted behind the async routes. The async
+routes use that app's sessions, rate limits and error payloads, so both
+paths see the same conversation state.
+"""
+import json
+import time
+import asyncio
+import functools
+import logging
+from contextlib import asynccontextmanager, contextmanager
+
+from limits import parse
+from flask import session
+from flask_limiter.errors import RateLimitExceeded
+from flask_limiter.util import get_remote_address
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.test import EnvironBuilder
+
+from app import (
+    app as flask_app, limiter, calendly_client, CHAT_RATE_LIMIT, EMPTY_MESSAGE_RESPONSE, CHAT_ERROR_RESPONSE,
+    collect_user_info, chat_arguments, save_conversation, handle_ratelimit_error, with_debug_fields
+)
+from utils.calendly_client import CalendlySlotUnavailableError
+from chatbot.chat import handle_chat_async
+from utils.http_client import async_transport
+from utils.metrics import REQUEST_SECONDS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+chat_rate_limit = parse(CHAT_RATE_LIMIT)
+
+@contextmanager
+def flask_context(request, body):
+    """Run code with Flask's request, session and app context for this ASGI request."""
+    environ = EnvironBuilder(
+        path=request.url.path,
+        method=request.method,
+        query_string=request.url.query,
+        headers=list(request.headers.items()),
+        data=body
+    ).get_environ()
+    if request.client:
+        environ["REMOTE_ADDR"] = request.client.host
+
+    ctx = flask_app.request_context(environ)
+    ctx.push()
+    try:
+        yield
+    finally:
+        ctx.pop()
+
+def flask_response(payload, status=200):
+    """A JSON response carrying the Flask session cookie (call inside flask_context)."""
+    response = flask_app.response_class(json.dumps(payload), status=status, mimetype="application/json")
+    flask_app.session_interface.save_session(flask_app, session, response)
+
+    asgi_response = Response(response.get_data(), status_code=status)
+    asgi_response.raw_headers = [
+        (key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in response.headers.items()
+    ]
+    return asgi_response
+
+def rate_limited(chat=False):
+    """The 429 response when this client is over its limits, else None (call inside flask_context).
+
+    Every route gets the default limits; chat=True also charges the shared "chat" budget.
+    """
+    try:
+        # Default limits are applied by the limiter's before_request hook
+        flask_app.preprocess_request()
+        # The same bucket as Flask's shared "chat" limit
+        within_limit = not chat or not limiter.enabled or limiter.limiter.hit(chat_rate_limit, get_remote_address(), "chat")
+    except RateLimitExceeded:
+        within_limit = False
+    if within_limit:
+        return None
+
+    payload, status = handle_ratelimit_error(None)
+    return flask_response(payload.get_json(), status)
+
+def timed_route(endpoint):
+    """Record the route in http_request_seconds under the Flask app's endpoint name."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            finally:
+                REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, status=status)
+        return wrapper
+    return decorator
+
+@timed_route("chat")
+async def chat(request):
+    body = await request.body()
+    with flask_context(request, body):
+        limited = rate_limited(chat=True)
+        if limited is not None:
+            return limited
+
+        try:
+            data = json.loads(body or b"{}")
+            message = data.get("message", "").strip()
+
+            if not message:
+                return flask_response(EMPTY_MESSAGE_RESPONSE, 400)
+
+            # Handle user information collection
+            info_response = collect_user_info(message)
+            if info_response is not None:
+                return flask_response(info_response)
+
+            # Normal conversation flow
+            arguments = chat_arguments(message)
+            result = await handle_chat_async(**arguments)
+
+            # handle_chat_async added this turn to the conversation
+            save_conversation(arguments["conversation"])
+            return flask_response(with_debug_fields(result))
+
+        except Exception as e:
+            logger.exception(f"Error in chat endpoint: {str(e)}")
+            return flask_response(dict(CHAT_ERROR_RESPONSE, error=str(e)), 500)
+
+@timed_route("schedule_viewing")
+async def schedule_viewing(request):
+    body = await request.body()
+    with flask_context(request, body):
+        limited = rate_limited()
+        if limited is not None:
+            return limited
+
+        try:
+            data = json.loads(body or b"{}")
+            user_email = data.get("email")
+            start_time = data.get("start_time")
+
+            if not user_email or not start_time:
+                return flask_response({"error": "Email and start time are required"}, 400)
+
+            # Create Calendly event
+            event = await asyncio.to_thread(calendly_client.create_event, start_time, user_email)
+            if event:
+                return flask_response({
+                    "success": True,
+                    # False: not booked yet, the user completes the booking at booking_url
+                    "booked": event.get("booked", False),
+                    "booking_url": event.get("booking_url"),
+                    "event_id": event.get("uri")
+                })
+            return flask_response({"error": "Failed to create event"}, 500)
+
+        except CalendlySlotUnavailableError:
+            return flask_response({"error": "That time is not available, please pick another slot"}, 409)
+        except ValueError:
+            return flask_response({"error": "Start time must be ISO 8601, e.g. 2024-05-01T09:00:00Z"}, 400)
+        except Exception as e:
+            logger.exception(f"Error in schedule endpoint: {str(e)}")
+            return flask_response({"error": str(e)}, 500)
+
+@timed_route("get_available_times")
+async def get_available_times(request):
+    with flask_context(request, b""):
+        limited = rate_limited()
+        if limited is not None:
+            return limited
+
+        try:
+            start_time = request.query_params.get("start_time")
+            end_time = request.query_params.get("end_time")
+
+            if not start_time or not end_time:
+                return flask_response({"error": "Start time and end time are required"}, 400)
+
+            available_times = await asyncio.to_thread(calendly_client.get_available_times, start_time, end_time)
+            if available_times is not None:
+                return flask_response(available_times)
+            return flask_response({"error": "Failed to get available times"}, 500)
+
+        except ValueError:
+            return flask_response({"error": "Times must be ISO 8601, e.g. 2024-05-01T09:00:00Z"}, 400)
+        except Exception as e:
+            logger.exception(f"Error in available times endpoint: {str(e)}")
+            return flask_response({"error": str(e)}, 500)
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await async_transport.aclose()
+
+app = Starlette(
+    routes=[
+        Route("/api/chat", chat, methods=["POST"]),
+        Route("/api/schedule", schedule_viewing, methods=["POST"]),
+        Route("/api/available-times", get_available_times, methods=["GET"]),
+        Mount("/", app=WSGIMiddleware(flask_app))
+    ],
+    lifespan=lifespan
+)
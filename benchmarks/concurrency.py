@@ -0,0 +1,167 @@
+"""
+Concurrent chat sessions per worker: sync gunicorn (app:app) against uvicorn (asgi:app).
+
+Usage:
+    python -m benchmarks.concurrency
+    python -m benchmarks.concurrency --sessions 1 2 4 8 16 32 --groq-latency-ms 800 --slo-ms 2000
+
+Starts benchmarks/fake_upstreams.py in-process and each server as a
+subprocess with a single worker. For every level in --sessions it runs that
+many simulated users at once, each posting chat turns back to back, and
+reports throughput and latency percentiles. "max_sessions_within_slo" is the
+highest level whose p95 stays under --slo-ms.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import threading
+
+MESSAGES = [
+    "what plots do you have",
+    "Do you have apartments in Miami under 400k?",
+    "How much is the Westside Villa?",
+    "What are your current offers?",
+    "Tell me about property management services"
+]
+
+SERVERS = {
+    "gunicorn_sync": ["gunicorn", "app:app", "--timeout", "120"],
+    "uvicorn_asgi": ["uvicorn", "asgi:app", "--log-level", "warning"]
+}
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    position = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+    return ordered[position]
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_until_up(base_url, process, timeout=60):
+    import requests
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            requests.get(base_url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start within {timeout}s")
+
+def start_server(name, env, workers=1):
+    """Start one server on a free port; returns (process, base_url)."""
+    port = _free_port()
+    command = SERVERS[name] + ["--workers", str(workers)] + (
+        ["--bind", f"127.0.0.1:{port}"] if name.startswith("gunicorn") else ["--host", "127.0.0.1", "--port", str(port)]
+    )
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_until_up(base_url, process)
+    except Exception:
+        process.kill()
+        raise
+    return process, base_url
+
+def simulate_user(base_url, turns, latencies, errors):
+    """One user: answer the intake questions, then ask questions back to back."""
+    import requests
+
+    http = requests.Session()
+    try:
+        for message in ("Benchmark User", f"bench-{threading.get_ident()}@example.com", "500k"):
+            http.post(f"{base_url}/api/chat", json={"message": message}, timeout=120).raise_for_status()
+        for i in range(turns):
+            started = time.perf_counter()
+            response = http.post(f"{base_url}/api/chat", json={"message": MESSAGES[i % len(MESSAGES)]}, timeout=120)
+            if response.status_code == 200:
+                latencies.append(1000 * (time.perf_counter() - started))
+            else:
+                errors.append(response.status_code)
+    except Exception as e:
+        errors.append(str(e))
+
+def run_level(base_url, sessions, turns):
+    latencies, errors = [], []
+    threads = [
+        threading.Thread(target=simulate_user, args=(base_url, turns, latencies, errors))
+        for _ in range(sessions)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = {"sessions": sessions, "turns": len(latencies), "errors": len(errors)}
+    if latencies:
+        result.update({
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(_percentile(latencies, 50), 1),
+            "p95_ms": round(_percentile(latencies, 95), 1)
+        })
+    return result
+
+def run(levels, turns, groq_latency_ms, hubspot_latency_ms, slo_ms, servers):
+    from benchmarks.fake_upstreams import FakeUpstreams
+
+    upstreams = FakeUpstreams(latency_ms={"groq": groq_latency_ms, "hubspot": hubspot_latency_ms}).start()
+    workdir = tempfile.mkdtemp(prefix="chat-concurrency-")
+    env = dict(
+        os.environ,
+        **upstreams.env(),
+        RATELIMIT_ENABLED="False",
+        ENABLE_VECTOR_SEARCH="False",
+        CRM_QUEUE_PATH=os.path.join(workdir, "crm_queue.sqlite3"),
+        SESSION_SQLITE_PATH=os.path.join(workdir, "sessions.sqlite3")
+    )
+
+    results = {"turns_per_session": turns, "groq_latency_ms": groq_latency_ms, "slo_p95_ms": slo_ms}
+    try:
+        for name in servers:
+            process, base_url = start_server(name, env)
+            try:
+                levels_run = [run_level(base_url, sessions, turns) for sessions in levels]
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+            within_slo = [
+                level["sessions"] for level in levels_run
+                if not level["errors"] and level.get("p95_ms", float("inf")) <= slo_ms
+            ]
+            results[name] = {"levels": levels_run, "max_sessions_within_slo": max(within_slo, default=0)}
+    finally:
+        upstreams.stop()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare concurrent chat sessions per worker, sync vs ASGI.")
+    parser.add_argument("--sessions", type=int, nargs="*", default=[1, 2, 4, 8, 16, 32], help="Concurrency levels")
+    parser.add_argument("--turns", type=int, default=5, help="Chat turns per simulated user")
+    parser.add_argument("--groq-latency-ms", type=float, default=800, help="Fake Groq response time")
+    parser.add_argument("--hubspot-latency-ms", type=float, default=100, help="Fake HubSpot response time")
+    parser.add_argument("--slo-ms", type=float, default=2000, help="p95 latency target per turn")
+    parser.add_argument("--servers", nargs="*", default=list(SERVERS), choices=list(SERVERS))
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    results = run(args.sessions, args.turns, args.groq_latency_ms, args.hubspot_latency_ms, args.slo_ms, args.servers)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
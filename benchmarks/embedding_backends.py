@@ -0,0 +1,115 @@
+"""
+Compare embedding backends: import time, resident memory and per-query latency.
+
+Usage:
+    python -m benchmarks.embedding_backends
+    python -m benchmarks.embedding_backends --backends sentence-transformers onnx --queries 500
+
+Each backend is measured in a fresh subprocess so import time and RSS are not
+skewed by modules the other backend already loaded. The ONNX model file is
+taken from ONNX_MODEL_FILE (see chatbot/embedders.py).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+SAMPLE_QUERIES = [
+    "what plots do you have",
+    "current offers",
+    "Do you have apartments in Miami under 400k?",
+    "How much is the Westside Villa?",
+    "I want to buy an open plot in Dubai",
+    "What are your working hours?",
+    "Can you help with a mortgage?",
+    "Tell me about property management services"
+]
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    position = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+    return ordered[position]
+
+def measure(backend, num_queries):
+    """Measure one backend inside the current process."""
+    import psutil
+
+    process = psutil.Process()
+    rss_start = process.memory_info().rss
+
+    started = time.perf_counter()
+    if backend == "onnx":
+        import onnxruntime  # noqa: F401
+        import tokenizers  # noqa: F401
+    else:
+        import sentence_transformers  # noqa: F401
+    import_seconds = time.perf_counter() - started
+
+    from chatbot.embedders import load_embedder
+
+    started = time.perf_counter()
+    embedder = load_embedder(backend)
+    load_seconds = time.perf_counter() - started
+
+    # First query pays for lazy initialization; report it separately
+    started = time.perf_counter()
+    embedder.encode([SAMPLE_QUERIES[0]])
+    first_query_ms = 1000 * (time.perf_counter() - started)
+
+    latencies = []
+    for i in range(num_queries):
+        started = time.perf_counter()
+        embedder.encode([SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]])
+        latencies.append(1000 * (time.perf_counter() - started))
+
+    batch = SAMPLE_QUERIES * 8
+    started = time.perf_counter()
+    embedder.encode(batch, batch_size=len(batch))
+    batch_seconds = time.perf_counter() - started
+
+    return {
+        "backend": backend,
+        "import_seconds": round(import_seconds, 3),
+        "load_seconds": round(load_seconds, 3),
+        "rss_mb": round(process.memory_info().rss / 2**20, 1),
+        "rss_added_mb": round((process.memory_info().rss - rss_start) / 2**20, 1),
+        "first_query_ms": round(first_query_ms, 2),
+        "p50_query_ms": round(_percentile(latencies, 50), 3),
+        "p95_query_ms": round(_percentile(latencies, 95), 3),
+        "batch_queries_per_second": round(len(batch) / batch_seconds, 1)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the query embedding backends.")
+    parser.add_argument("--backends", nargs="+", default=["sentence-transformers", "onnx"])
+    parser.add_argument("--queries", type=int, default=200, help="Single-query encodes per backend")
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.queries)))
+        return 0
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for backend in args.backends:
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.embedding_backends", "--worker", backend, "--queries", str(args.queries)],
+            cwd=root, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            results.append({"backend": backend, "error": completed.stderr.strip().splitlines()[-1:]})
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,422 @@
+"""
+Local stand-ins for the Groq, HubSpot and Calendly APIs.
+
+Each API runs on its own localhost port with configurable latency and error
+rate, so the app can be exercised (and benchmarked) without network access,
+API keys or cost. Point the app at them through the base URL overrides in
+utils/http_client.py:
+
+    python -m benchmarks.fake_upstreams --latency-ms groq=400 hubspot=80 --error-rate groq=0.02 --token-ms 20
+
+prints the environment variables to export, then serves until interrupted.
+In code:
+
+    upstreams = FakeUpstreams(latency_ms={"groq": 400}).start()
+    env = upstreams.env()
+    ...
+    upstreams.stop()
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import itertools
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVICES = ("groq", "hubspot", "calendly")
+
+FAKE_REPLY = (
+    "We have open plots in Dubai and Miami within your budget, with flexible payment plans. "
+    "Would you like details on a specific location?\n"
+    "Lead Score: 65\n"
+    "Qualification: Warm\n"
+    "Schedule Meeting: false"
+)
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """Routes requests to the owning FakeServer's handlers, adding latency and errors."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method):
+        server = self.server
+        path = self.path.split("?", 1)[0]
+        body = self._read_json() if method in ("POST", "PATCH", "PUT") else {}
+
+        server.count(method, path)
+        if server.latency_ms:
+            time.sleep(max(0.0, random.gauss(server.latency_ms, server.latency_ms * 0.1)) / 1000)
+
+        if server.error_rate and random.random() < server.error_rate:
+            status = random.choice([429, 503])
+            self.send_json(status, {"error": "injected failure"}, {"Retry-After": "0"})
+            return
+
+        for route_method, pattern, handler in server.routes:
+            match = pattern.fullmatch(path)
+            if route_method == method and match:
+                handler(self, body, *match.groups())
+                return
+
+        self.send_json(404, {"error": f"No fake route for {method} {path}"})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+class FakeServer(ThreadingHTTPServer):
+    """One fake API with its own routes, latency and error rate."""
+
+    daemon_threads = True
+
+    def __init__(self, routes, latency_ms=0, error_rate=0.0):
+        super().__init__(("127.0.0.1", 0), FakeHandler)
+        self.routes = [(method, re.compile(pattern), handler) for method, pattern, handler in routes]
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    def count(self, method, path):
+        key = method + " " + re.sub(r"/\d+", "/{id}", path)
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+# Groq
+
+def _reply_tokens():
+    return re.findall(r"\S+\s*|\s+", FAKE_REPLY)
+
+def _groq_completion(handler, body, token_ms):
+    # A non-streamed completion arrives only once every token is generated
+    if token_ms:
+        time.sleep(token_ms * (len(_reply_tokens()) - 1) / 1000)
+    handler.send_json(200, {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": FAKE_REPLY}, "finish_reason": "stop"}]
+    })
+
+def _groq_stream(handler, body, token_ms):
+    """Send FAKE_REPLY as chat.completion.chunk events, one word at a time."""
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/event-stream")
+    handler.send_header("Transfer-Encoding", "chunked")
+    handler.end_headers()
+
+    def send(data):
+        event = f"data: {data}\n\n".encode("utf-8")
+        handler.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+        handler.wfile.flush()
+
+    for position, token in enumerate(_reply_tokens()):
+        if position and token_ms:
+            time.sleep(token_ms / 1000)
+        send(json.dumps({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+        }))
+    send("[DONE]")
+    handler.wfile.write(b"0\r\n\r\n")
+
+def groq_routes(token_ms=0):
+    def completion(handler, body):
+        if body.get("stream"):
+            _groq_stream(handler, body, token_ms)
+        else:
+            _groq_completion(handler, body, token_ms)
+
+    return [("POST", r"/openai/v1/chat/completions", completion)]
+
+# HubSpot
+
+class FakeHubSpot:
+    """In-memory contacts keyed by email."""
+
+    def __init__(self):
+        self.contacts = {}
+        self._ids = itertools.count(1001)
+        self._lock = threading.Lock()
+
+    def _contact(self, contact):
+        return {"id": contact["id"], "properties": dict(contact["properties"])}
+
+    def search(self, handler, body):
+        email = body["filterGroups"][0]["filters"][0]["value"]
+        with self._lock:
+            contact = self.contacts.get(email)
+            results = [self._contact(contact)] if contact else []
+        handler.send_json(200, {"total": len(results), "results": results})
+
+    def create(self, handler, body):
+        properties = body.get("properties", {})
+        with self._lock:
+            if properties.get("email") in self.contacts:
+                handler.send_json(409, {"message": "Contact already exists"})
+                return
+            contact = {"id": str(next(self._ids)), "properties": dict(properties)}
+            self.contacts[properties.get("email")] = contact
+            result = self._contact(contact)
+        handler.send_json(201, result)
+
+    def get(self, handler, body, contact_id):
+        with self._lock:
+            contact = next((c for c in self.contacts.values() if c["id"] == contact_id), None)
+            result = self._contact(contact) if contact else None
+        if result is None:
+            handler.send_json(404, {"message": "Contact not found"})
+            return
+        handler.send_json(200, result)
+
+    def update(self, handler, body, contact_id):
+        with self._lock:
+            contact = next((c for c in self.contacts.values() if c["id"] == contact_id), None)
+            if contact is None:
+                handler.send_json(404, {"message": "Contact not found"})
+                return
+            contact["properties"].update(body.get("properties", {}))
+            result = self._contact(contact)
+        handler.send_json(200, result)
+
+    def batch_read(self, handler, body):
+        """Look up contacts by email (idProperty=email); unknown emails become errors."""
+        results, missing = [], []
+        with self._lock:
+            for item in body.get("inputs", []):
+                contact = self.contacts.get(item["id"])
+                if contact:
+                    results.append(self._contact(contact))
+                else:
+                    missing.append(item["id"])
+        response = {"status": "COMPLETE", "results": results}
+        if missing:
+            response["errors"] = [{"status": "error", "category": "OBJECT_NOT_FOUND", "context": {"ids": missing}}]
+        handler.send_json(207 if missing else 200, response)
+
+    def batch_upsert(self, handler, body):
+        """Create or update contacts keyed by email."""
+        results = []
+        with self._lock:
+            for item in body.get("inputs", []):
+                email = item["id"]
+                contact = self.contacts.get(email)
+                new = contact is None
+                if new:
+                    contact = {"id": str(next(self._ids)), "properties": {"email": email}}
+                    self.contacts[email] = contact
+                contact["properties"].update(item.get("properties", {}))
+                results.append(dict(self._contact(contact), new=new))
+        handler.send_json(200, {"status": "COMPLETE", "results": results})
+
+    def properties(self, handler, body):
+        names = ["email", "firstname", "budget", "lead_score", "lead_type", "chat_history"]
+        handler.send_json(200, {"results": [{"name": name} for name in names]})
+
+    def routes(self):
+        return [
+            ("POST", r"/crm/v3/objects/contacts/search", self.search),
+            ("POST", r"/crm/v3/objects/contacts", self.create),
+            ("POST", r"/crm/v3/objects/contacts/batch/read", self.batch_read),
+            ("POST", r"/crm/v3/objects/contacts/batch/upsert", self.batch_upsert),
+            ("GET", r"/crm/v3/objects/contacts/(\d+)", self.get),
+            ("PATCH", r"/crm/v3/objects/contacts/(\d+)", self.update),
+            ("GET", r"/crm/v3/properties/contacts", self.properties)
+        ]
+
+# Calendly
+
+class FakeCalendly:
+    """A single user with one event type, open 09:00-17:00 UTC in 30 minute slots."""
+
+    user_uri = "https://api.calendly.com/users/FAKEUSER"
+    organization = "https://api.calendly.com/organizations/FAKEORG"
+    event_type_uri = "https://api.calendly.com/event_types/FAKEEVENT"
+
+    def me(self, handler, body):
+        handler.send_json(200, {"resource": {
+            "uri": self.user_uri,
+            "name": "XYZ Real Estate",
+            "current_organization": self.organization,
+            "scheduling_url": "https://calendly.com/xyz-real-estate"
+        }})
+
+    def event_types(self, handler, body):
+        handler.send_json(200, {"collection": [{
+            "uri": self.event_type_uri,
+            "name": "Property Consultation",
+            "slug": "property-consultation",
+            "duration": 30,
+            "active": True
+        }]})
+
+    def __init__(self):
+        self.booked = set()
+        self._lock = threading.Lock()
+
+    def available_times(self, handler, body):
+        query = parse_qs(handler.path.split("?", 1)[1] if "?" in handler.path else "")
+        start = datetime.fromisoformat(query["start_time"][0].replace("Z", "+00:00"))
+        end = datetime.fromisoformat(query["end_time"][0].replace("Z", "+00:00"))
+        if end - start > timedelta(days=7) or start < datetime.now(timezone.utc):
+            handler.send_json(400, {"message": "The supplied parameters are invalid."})
+            return
+
+        slots = []
+        slot = start.replace(minute=0 if start.minute == 0 else 30, second=0, microsecond=0)
+        while slot < end:
+            slot_time = slot.strftime("%Y-%m-%dT%H:%M:%S.000000Z")
+            if slot >= start and 9 <= slot.hour < 17 and slot_time not in self.booked:
+                slots.append({
+                    "status": "available",
+                    "invitees_remaining": 1,
+                    "start_time": slot_time,
+                    "scheduling_url": f"https://calendly.com/xyz-real-estate/property-consultation/{slot_time}"
+                })
+            slot += timedelta(minutes=30)
+        handler.send_json(200, {"collection": slots})
+
+    def invitee(self, handler, body):
+        start = datetime.fromisoformat(body["start_time"].replace("Z", "+00:00"))
+        slot_time = start.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000000Z")
+        with self._lock:
+            if slot_time in self.booked:
+                handler.send_json(400, {"message": "The selected time is no longer available."})
+                return
+            self.booked.add(slot_time)
+        event = f"https://api.calendly.com/scheduled_events/FAKE{int(time.time() * 1000)}"
+        handler.send_json(201, {"resource": {
+            "uri": f"{event}/invitees/FAKE",
+            "event": event,
+            "email": body["invitee"]["email"],
+            "name": body["invitee"]["name"]
+        }})
+
+    def routes(self):
+        return [
+            ("GET", r"/users/me", self.me),
+            ("GET", r"/event_types", self.event_types),
+            ("GET", r"/event_type_available_times", self.available_times),
+            ("POST", r"/invitees", self.invitee)
+        ]
+
+class FakeUpstreams:
+    """Runs all three fake APIs on localhost ports."""
+
+    def __init__(self, latency_ms=None, error_rate=None, token_ms=0):
+        self.latency_ms = latency_ms or {}
+        self.error_rate = error_rate or {}
+        self.token_ms = token_ms  # Delay between streamed Groq tokens
+        self.hubspot = FakeHubSpot()
+        self.calendly = FakeCalendly()
+        self.servers = {}
+        self._threads = []
+
+    def start(self):
+        routes = {
+            "groq": groq_routes(self.token_ms),
+            "hubspot": self.hubspot.routes(),
+            "calendly": self.calendly.routes()
+        }
+        for service in SERVICES:
+            server = FakeServer(routes[service], self.latency_ms.get(service, 0), self.error_rate.get(service, 0.0))
+            thread = threading.Thread(target=server.serve_forever, name=f"fake-{service}", daemon=True)
+            thread.start()
+            self.servers[service] = server
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+    def env(self):
+        """Environment variables that point the app at the fakes."""
+        return {
+            "GROQ_API_BASE": f"{self.servers['groq'].url}/openai/v1",
+            "GROQ_API_KEY": "fake-groq-key",
+            "HUBSPOT_API_BASE": self.servers["hubspot"].url,
+            "HUBSPOT_API_KEY": "fake-hubspot-key",
+            "CALENDLY_API_BASE": self.servers["calendly"].url,
+            "CALENDLY_API_KEY": "fake-calendly-key",
+            "CALENDLY_USERNAME": "xyz-real-estate"
+        }
+
+    def request_counts(self):
+        return {service: dict(server.requests) for service, server in self.servers.items()}
+
+def parse_per_service(values, cast):
+    """Parse ["groq=400", "hubspot=80"] (or a bare "100" for all services)."""
+    parsed = {}
+    for value in values or []:
+        service, sep, number = value.partition("=")
+        if not sep:
+            parsed.update({name: cast(service) for name in SERVICES})
+        elif service in SERVICES:
+            parsed[service] = cast(number)
+        else:
+            raise ValueError(f"Unknown service: {service} (expected one of {', '.join(SERVICES)})")
+    return parsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run local fake Groq, HubSpot and Calendly APIs.")
+    parser.add_argument("--latency-ms", nargs="*", help="e.g. 100, or groq=400 hubspot=80")
+    parser.add_argument("--error-rate", nargs="*", help="e.g. 0.01, or groq=0.05")
+    parser.add_argument("--token-ms", type=float, default=0, help="Delay between streamed Groq tokens")
+    args = parser.parse_args(argv)
+
+    upstreams = FakeUpstreams(
+        latency_ms=parse_per_service(args.latency_ms, float),
+        error_rate=parse_per_service(args.error_rate, float),
+        token_ms=args.token_ms
+    ).start()
+
+    for key, value in upstreams.env().items():
+        print(f"export {key}={value}")
+    sys.stdout.flush()
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        upstreams.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+End-to-end load test of the chat app against local fake upstreams.
+
+Usage:
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --sessions 200 --concurrency 20 --workers 2 \\
+        --latency-ms groq=600 hubspot=80 calendly=50 --error-rate groq=0.02 \\
+        --save-baseline benchmarks/baselines/main.json
+    python -m benchmarks.load_test --baseline benchmarks/baselines/main.json --tolerance 0.2
+
+Starts benchmarks/fake_upstreams.py in-process and the app under gunicorn
+(or uvicorn, --server uvicorn_asgi) as a subprocess. Then it runs --sessions
+simulated users, --concurrency at a time. Each user goes through the whole
+flow: the page, name, email, budget, then --turns chat questions.
+
+Reports p50/p95/p99 latency and throughput for the intake and chat steps,
+plus the RSS of every server process, sampled while the load runs.
+--save-baseline writes the results as JSON. --baseline compares against a
+saved run and exits with status 1 if p95/p99 latency or throughput is worse
+by more than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.concurrency import MESSAGES, SERVERS, start_server
+from benchmarks.fake_upstreams import parse_per_service
+
+# (metric, True if higher is better) compared against a baseline
+COMPARED_METRICS = (("p95_ms", False), ("p99_ms", False), ("throughput_rps", True))
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    position = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+    return ordered[position]
+
+def _summary(latencies, errors, elapsed):
+    summary = {"requests": len(latencies), "errors": len(errors)}
+    if latencies:
+        summary.update({
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(_percentile(latencies, 50), 1),
+            "p95_ms": round(_percentile(latencies, 95), 1),
+            "p99_ms": round(_percentile(latencies, 99), 1),
+            "max_ms": round(max(latencies), 1)
+        })
+    return summary
+
+class Recorder:
+    """Latencies and errors per step, from all simulated users."""
+
+    def __init__(self):
+        self.latencies = {"intake": [], "chat": []}
+        self.errors = {"intake": [], "chat": []}
+        self.degraded = 0  # 200 responses carrying an LLM error message
+        self._lock = threading.Lock()
+
+    def record(self, step, started, response=None, error=None):
+        elapsed = 1000 * (time.perf_counter() - started)
+        with self._lock:
+            if error is None and response is not None and response.status_code == 200:
+                self.latencies[step].append(elapsed)
+                if step == "chat" and response.json().get("answer", "").startswith("Error:"):
+                    self.degraded += 1
+            else:
+                self.errors[step].append(error or response.status_code)
+
+def simulate_session(base_url, session_number, turns, recorder):
+    """One user through the page, name, email and budget questions, then the chat."""
+    import requests
+
+    http = requests.Session()
+    http.get(base_url, timeout=120)
+
+    steps = [("intake", "Load Test User"), ("intake", f"load-{session_number}@example.com"), ("intake", "500k")]
+    steps += [("chat", MESSAGES[(session_number + i) % len(MESSAGES)]) for i in range(turns)]
+    for step, message in steps:
+        started = time.perf_counter()
+        try:
+            response = http.post(f"{base_url}/api/chat", json={"message": message}, timeout=120)
+        except requests.RequestException as e:
+            recorder.record(step, started, error=type(e).__name__)
+            return
+        recorder.record(step, started, response)
+
+class RssSampler:
+    """Peak and last RSS of a server and its worker processes, sampled in the background."""
+
+    def __init__(self, pid, interval=0.5):
+        import psutil
+
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.samples = {}  # pid -> (role, peak bytes, last bytes)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        import psutil
+
+        processes = [("master", self.process)]
+        try:
+            processes += [("worker", child) for child in self.process.children(recursive=True)]
+        except psutil.Error:
+            pass
+        for role, process in processes:
+            try:
+                rss = process.memory_info().rss
+            except psutil.Error:
+                continue
+            _, peak, _ = self.samples.get(process.pid, (role, 0, 0))
+            self.samples[process.pid] = (role, max(peak, rss), rss)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        mb = 1024 * 1024
+        return [
+            {"pid": pid, "role": role, "peak_rss_mb": round(peak / mb, 1), "last_rss_mb": round(last / mb, 1)}
+            for pid, (role, peak, last) in sorted(self.samples.items())
+        ]
+
+def run(sessions, concurrency, turns, workers, server, latency_ms, error_rate, vector_search):
+    from benchmarks.fake_upstreams import FakeUpstreams
+
+    upstreams = FakeUpstreams(latency_ms=latency_ms, error_rate=error_rate).start()
+    workdir = tempfile.mkdtemp(prefix="chat-load-test-")
+    env = dict(
+        os.environ,
+        **upstreams.env(),
+        RATELIMIT_ENABLED="False",
+        ENABLE_VECTOR_SEARCH="True" if vector_search else "False",
+        CRM_QUEUE_PATH=os.path.join(workdir, "crm_queue.sqlite3"),
+        SESSION_SQLITE_PATH=os.path.join(workdir, "sessions.sqlite3")
+    )
+
+    recorder = Recorder()
+    try:
+        process, base_url = start_server(server, env, workers=workers)
+        sampler = RssSampler(process.pid).start()
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(lambda n: simulate_session(base_url, n, turns, recorder), range(sessions)))
+            elapsed = time.perf_counter() - started
+        finally:
+            rss = sampler.stop()
+            process.terminate()
+            process.wait(timeout=30)
+        upstream_requests = upstreams.request_counts()
+    finally:
+        upstreams.stop()
+
+    all_latencies = recorder.latencies["intake"] + recorder.latencies["chat"]
+    all_errors = recorder.errors["intake"] + recorder.errors["chat"]
+    return {
+        "config": {
+            "sessions": sessions,
+            "concurrency": concurrency,
+            "turns": turns,
+            "workers": workers,
+            "server": server,
+            "latency_ms": latency_ms,
+            "error_rate": error_rate,
+            "vector_search": vector_search
+        },
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "elapsed_s": round(elapsed, 2),
+        "total": _summary(all_latencies, all_errors, elapsed),
+        "intake": _summary(recorder.latencies["intake"], recorder.errors["intake"], elapsed),
+        "chat": dict(_summary(recorder.latencies["chat"], recorder.errors["chat"], elapsed), degraded=recorder.degraded),
+        "rss": rss,
+        "upstream_requests": upstream_requests
+    }
+
+def compare(results, baseline, tolerance):
+    """Metrics worse than the baseline by more than tolerance (a fraction), as messages."""
+    regressions = []
+    for step in ("total", "chat"):
+        for metric, higher_is_better in COMPARED_METRICS:
+            current, previous = results.get(step, {}).get(metric), baseline.get(step, {}).get(metric)
+            if current is None or not previous:
+                continue
+            change = (current - previous) / previous
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{step} {metric}: {previous} -> {current} ({change:+.0%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the chat app against fake Groq, HubSpot and Calendly.")
+    parser.add_argument("--sessions", type=int, default=50, help="Simulated users in total")
+    parser.add_argument("--concurrency", type=int, default=10, help="Simulated users at a time")
+    parser.add_argument("--turns", type=int, default=5, help="Chat questions per user after the intake")
+    parser.add_argument("--workers", type=int, default=2, help="Server worker processes")
+    parser.add_argument("--server", default="gunicorn_sync", choices=list(SERVERS))
+    parser.add_argument("--latency-ms", nargs="*", default=["groq=400", "hubspot=80", "calendly=50"],
+                        help="e.g. 100, or groq=400 hubspot=80")
+    parser.add_argument("--error-rate", nargs="*", help="e.g. 0.01, or groq=0.05")
+    parser.add_argument("--vector-search", action="store_true", help="Include retrieval in each chat turn")
+    parser.add_argument("--save-baseline", help="Write the results as JSON to this path")
+    parser.add_argument("--baseline", help="Compare against results saved with --save-baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against the baseline")
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.sessions, args.concurrency, args.turns, args.workers, args.server,
+        parse_per_service(args.latency_ms, float), parse_per_service(args.error_rate, float), args.vector_search
+    )
+    print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != results["config"]:
+            print("Warning: the baseline was recorded with a different configuration", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
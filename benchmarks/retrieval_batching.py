@@ -0,0 +1,116 @@
+"""
+Throughput against latency of retrieval with and without micro-batching.
+
+Usage:
+    python -m benchmarks.retrieval_batching
+    python -m benchmarks.retrieval_batching --configs 0:1 2:8 5:16 10:32 --threads 1 4 8 16 32
+
+Each config is EMBED_BATCH_WINDOW_MS:EMBED_MAX_BATCH (0:1 is no batching)
+and runs in a fresh subprocess. For every level in --threads, that many
+threads call vector_search.retrieve_context back to back with distinct
+questions, so the query cache and the keyword fast path never answer them.
+The result is one curve per config: throughput, p50/p95 latency and the
+average batch size at each level.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import threading
+
+from benchmarks.embedding_backends import SAMPLE_QUERIES, _percentile
+
+def run_level(retrieve_context, threads, queries_per_thread):
+    latencies = []
+    lock = threading.Lock()
+
+    def user(number):
+        for i in range(queries_per_thread):
+            # Distinct text per call, so every call encodes and searches
+            question = f"{SAMPLE_QUERIES[(number + i) % len(SAMPLE_QUERIES)]} {number} {i}"
+            started = time.perf_counter()
+            retrieve_context(question)
+            elapsed = 1000 * (time.perf_counter() - started)
+            with lock:
+                latencies.append(elapsed)
+
+    workers = [threading.Thread(target=user, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "threads": threads,
+        "queries": len(latencies),
+        "throughput_qps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2)
+    }
+
+def measure(levels, queries_per_thread):
+    """One curve for the batching config in this process's environment."""
+    from chatbot import vector_search
+
+    vector_search.preload()  # Load the model and index before timing anything
+    curve = []
+    for threads in levels:
+        before = vector_search.get_stats()["batching"]
+        level = run_level(vector_search.retrieve_context, threads, queries_per_thread)
+        after = vector_search.get_stats()["batching"]
+        batches = after["batches"] - before["batches"]
+        level["average_batch"] = round((after["items"] - before["items"]) / batches, 2) if batches else 0.0
+        curve.append(level)
+    return {
+        "window_ms": vector_search.EMBED_BATCH_WINDOW_MS,
+        "max_batch": vector_search.EMBED_MAX_BATCH,
+        "backend": os.getenv("EMBEDDING_BACKEND", "sentence-transformers"),
+        "curve": curve
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark retrieval micro-batching: throughput against latency.")
+    parser.add_argument("--configs", nargs="+", default=["0:1", "2:8", "5:16", "10:32"],
+                        help="EMBED_BATCH_WINDOW_MS:EMBED_MAX_BATCH pairs")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="Concurrency levels")
+    parser.add_argument("--queries", type=int, default=50, help="Queries per thread at each level")
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(measure(args.threads, args.queries)))
+        return 0
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for config in args.configs:
+        window_ms, max_batch = config.split(":")
+        env = dict(
+            os.environ,
+            ENABLE_VECTOR_SEARCH="True",
+            KEYWORD_CONFIDENCE="inf",  # Always go through the model
+            MEMORY_OPTIMIZATION="False",
+            EMBED_BATCH_WINDOW_MS=window_ms,
+            EMBED_MAX_BATCH=max_batch
+        )
+        command = [sys.executable, "-m", "benchmarks.retrieval_batching", "--worker", "--queries", str(args.queries),
+                   "--threads"] + [str(threads) for threads in args.threads]
+        completed = subprocess.run(command, cwd=root, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            results.append({"config": config, "error": completed.stderr.strip().splitlines()[-1:]})
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Time-to-first-token of /api/chat/stream against the blocking /api/chat.
+
+Usage:
+    python -m benchmarks.streaming
+    python -m benchmarks.streaming --turns 20 --groq-latency-ms 300 --token-ms 25 --retrieval
+
+Runs the app in-process on a local port, pointed at benchmarks/fake_upstreams.py,
+and plays the same conversation against both endpoints. For /api/chat the
+first token is the whole response. Retrieval is off unless --retrieval is
+given, so the numbers isolate the LLM round trip.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+MESSAGES = [
+    "what plots do you have",
+    "Do you have apartments in Miami under 400k?",
+    "How much is the Westside Villa?",
+    "What are your current offers?",
+    "Tell me about property management services"
+]
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    position = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+    return ordered[position]
+
+def _summary(values):
+    return {
+        "p50_ms": round(_percentile(values, 50), 1),
+        "p95_ms": round(_percentile(values, 95), 1),
+        "max_ms": round(max(values), 1)
+    }
+
+def _start_session(http, base_url):
+    """Answer the name/email/budget questions so later turns reach the LLM."""
+    for message in ("Benchmark User", "bench@example.com", "500k"):
+        http.post(f"{base_url}/api/chat", json={"message": message}).raise_for_status()
+
+def blocking_turn(http, base_url, message):
+    started = time.perf_counter()
+    response = http.post(f"{base_url}/api/chat", json={"message": message})
+    response.raise_for_status()
+    response.json()
+    elapsed = 1000 * (time.perf_counter() - started)
+    return elapsed, elapsed
+
+def streaming_turn(http, base_url, message):
+    started = time.perf_counter()
+    first_token = None
+    commit_token = None
+    with http.post(f"{base_url}/api/chat/stream", json={"message": message}, stream=True) as response:
+        response.raise_for_status()
+        event = None
+        # Small reads: the development server ends the stream by closing the connection
+        for line in response.iter_lines(chunk_size=16):
+            if line.startswith(b"event:"):
+                event = line[6:].strip().decode()
+            elif line.startswith(b"data:"):
+                if event == "token" and first_token is None:
+                    first_token = 1000 * (time.perf_counter() - started)
+                elif event == "done":
+                    commit_token = json.loads(line[5:]).get("commit_token")
+    total = 1000 * (time.perf_counter() - started)
+
+    if commit_token:
+        http.post(f"{base_url}/api/chat/commit", json={"commit_token": commit_token}).raise_for_status()
+    return first_token if first_token is not None else total, total
+
+def run(turns, groq_latency_ms, token_ms, retrieval):
+    import requests
+    from werkzeug.serving import make_server
+    from benchmarks.fake_upstreams import FakeUpstreams
+
+    upstreams = FakeUpstreams(latency_ms={"groq": groq_latency_ms}, token_ms=token_ms).start()
+    os.environ.update(upstreams.env())
+    os.environ["ENABLE_VECTOR_SEARCH"] = "True" if retrieval else "False"
+
+    # Import after the environment points at the fakes
+    import app as app_module
+
+    app_module.limiter.enabled = False
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    results = {"turns": turns, "groq_latency_ms": groq_latency_ms, "token_ms": token_ms, "retrieval": retrieval}
+    try:
+        for name, turn in (("chat", blocking_turn), ("chat_stream", streaming_turn)):
+            http = requests.Session()
+            _start_session(http, base_url)
+            first_tokens, totals = [], []
+            for i in range(turns):
+                first_token, total = turn(http, base_url, MESSAGES[i % len(MESSAGES)])
+                first_tokens.append(first_token)
+                totals.append(total)
+            results[name] = {"time_to_first_token": _summary(first_tokens), "total": _summary(totals)}
+    finally:
+        server.shutdown()
+        upstreams.stop()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare time-to-first-token of /api/chat and /api/chat/stream.")
+    parser.add_argument("--turns", type=int, default=10, help="Chat turns per endpoint")
+    parser.add_argument("--groq-latency-ms", type=float, default=300, help="Fake Groq delay before the first token")
+    parser.add_argument("--token-ms", type=float, default=20, help="Fake Groq delay between tokens")
+    parser.add_argument("--retrieval", action="store_true", help="Include vector search in each turn")
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    results = run(args.turns, args.groq_latency_ms, args.token_ms, args.retrieval)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Cached LLM answers for FAQ-style questions.
+
+Company, service and offer questions (turns whose retrieved records are all
+INFO, SRV or OFF records) get the same answer for everyone, so the answer
+is reused instead of calling Groq again. Entries are keyed on the normalized
+question plus the retrieved record IDs. A differently worded question with
+the same records is a hit when its query embedding (from the existing
+embedding model, see vector_search.query_embedding) is within
+ANSWER_CACHE_SIMILARITY cosine of a cached one.
+
+Only self-contained questions are cached. A follow-up that refers back to the
+conversation ("and how much does that one cost?") depends on the chat
+history, so it keeps the full prompt and skips the cache. Cacheable turns
+are prompted with the records alone, without the user's name, email, budget
+or chat history, so a cached answer never carries one user's details to
+another.
+
+Entries expire after ANSWER_CACHE_TTL seconds and are dropped when the index
+file changes. Only the answer text is cached; the chat handler still scores
+the lead for every turn.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from chatbot.filters import parse_fields
+from chatbot.query_cache import normalize_query
+from utils.memory_governor import register_response
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ENABLE_ANSWER_CACHE = os.getenv("ENABLE_ANSWER_CACHE", "True").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))  # seconds
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))  # minimum cosine for a semantic hit
+
+# Record ID prefixes whose answers do not depend on the user
+CACHEABLE_PREFIXES = tuple(
+    prefix.strip() for prefix in os.getenv("ANSWER_CACHE_PREFIXES", "INFO,SRV,OFF").split(",") if prefix.strip()
+)
+
+# Words that point back at earlier turns, and openings that continue one
+_REFERENCE = re.compile(
+    r"\b(it|its|that|this|those|these|they|them|their|he|she|him|her|his|one|ones|same|also|too|else|"
+    r"more|another|other|others|above|previous|earlier|mentioned|former|latter|again)\b"
+)
+_CONTINUATION = re.compile(r"^(and|but|or|so|then|what about|how about)\b")
+MIN_QUESTION_WORDS = 3
+
+def is_self_contained(question):
+    """Whether question can be answered without the conversation before it."""
+    normalized = normalize_query(question)
+    return (
+        len(normalized.split()) >= MIN_QUESTION_WORDS
+        and not _CONTINUATION.match(normalized)
+        and not _REFERENCE.search(normalized)
+    )
+
+def cache_key(question, records):
+    """(normalized question, record IDs) for a cacheable turn, else None."""
+    if not ENABLE_ANSWER_CACHE or not records or isinstance(records, str):
+        return None
+    if not is_self_contained(question):
+        return None
+
+    ids = []
+    for record in records:
+        record_id = parse_fields(str(record)).get("ID", "")
+        if not record_id.startswith(CACHEABLE_PREFIXES):
+            return None
+        ids.append(record_id)
+    return normalize_query(question), tuple(ids)
+
+def _cosine(a, b):
+    import numpy as np
+
+    denominator = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(np.dot(a, b)) / denominator if denominator else 0.0
+
+class AnswerCache:
+    """LRU of answers by (question, record IDs), with a semantic fallback among entries for the same records."""
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, similarity=ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()  # key -> (answer, embedding, created_at, index version)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _valid(self, entry, version, now):
+        return entry[3] == version and not (self.ttl and now - entry[2] > self.ttl)
+
+    def get(self, key, embedding=None, version=None):
+        """The cached answer for key, or for a similar question about the same records; None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._valid(entry, version, now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+
+            if embedding is not None:
+                best, best_key = self.similarity, None
+                for other_key, other in self._entries.items():
+                    if other_key[1] != key[1] or other[1] is None or not self._valid(other, version, now):
+                        continue
+                    score = _cosine(embedding, other[1])
+                    if score >= best:
+                        best, best_key = score, other_key
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self._entries[best_key][0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, answer, embedding=None, version=None):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (answer, embedding, time.time(), version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries
+            }
+
+# Shared by all chat turns in this process
+answer_cache = AnswerCache()
+register_response("shrink", answer_cache.clear)
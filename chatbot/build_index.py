@@ -0,0 +1,255 @@
+"""
+Rebuild the knowledge base index from a listings file.
+
+Usage:
+    python -m chatbot.build_index --input listings.csv --index-type ivf-pq
+    python -m chatbot.build_index --input chatbot/embeddings/docs.bin --index-type hnsw
+
+Accepts CSV, JSONL, or an existing docs.bin / metadata.pkl (to re-index the
+current documents), embeds the documents in batches and writes index.faiss
+plus the docs.bin document store, filters.npz columns and keywords.npz BM25
+postings to the output directory. Prints index size, build time and
+recall@k of the chosen index against exact (flat) search.
+"""
+import os
+import csv
+import json
+import math
+import time
+import pickle
+import logging
+import argparse
+from chatbot.doc_store import DocStore, write_doc_store
+from chatbot.filters import FilterIndex
+from chatbot.keyword_index import KeywordIndex
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'embeddings')
+MODEL_NAME = "all-MiniLM-L6-v2"
+INDEX_TYPES = ["flat", "ivf-flat", "ivf-pq", "hnsw"]
+
+# Fields rendered into each document, in the order the chatbot expects them
+DOCUMENT_FIELDS = ["ID", "Description", "Location", "Price", "Status", "Features", "Contact"]
+
+def load_records(path):
+    """Load listing records from a CSV, JSONL, document store or pickled metadata file."""
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == ".bin":
+        # Existing document store: already formatted documents
+        store = DocStore(path)
+        documents = list(store)
+        store.close()
+        return documents
+
+    if extension == ".pkl":
+        # Existing metadata.pkl: already formatted documents
+        with open(path, "rb") as f:
+            return list(pickle.load(f))
+
+    if extension == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+
+    if extension in (".jsonl", ".ndjson"):
+        records = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+        return records
+
+    raise ValueError(f"Unsupported input format: {extension} (expected .csv, .jsonl, .bin or .pkl)")
+
+def format_document(record):
+    """Render a listing record in the same text layout as the existing metadata."""
+    if isinstance(record, str):
+        return record
+
+    fields = {str(key).strip().lower(): value for key, value in record.items()}
+    kind = str(fields.get("type") or "Property").strip().title()
+    name = fields.get("name") or fields.get("title") or ""
+
+    lines = [f"{kind}: {name}"]
+    for field in DOCUMENT_FIELDS:
+        value = fields.get(field.lower())
+        if value is None or value == "":
+            value = "nan"
+        lines.append(f"{field}: {value}")
+
+    indent = "\n        "
+    return indent + indent.join(lines) + indent
+
+def embed_documents(documents, batch_size=64):
+    """Embed documents in batches with the same model the chatbot queries with."""
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(MODEL_NAME, device="cpu")
+    batches = []
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        batches.append(model.encode(batch, batch_size=batch_size, show_progress_bar=False))
+        logger.info(f"Embedded {min(start + batch_size, len(documents))}/{len(documents)} documents")
+
+    return np.vstack(batches).astype("float32")
+
+def default_nlist(count):
+    """Pick an IVF list count: ~4*sqrt(n), but with at least 39 training points per list."""
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+def build_index(embeddings, index_type="flat", nlist=None, nprobe=8, pq_m=48, pq_nbits=8,
+                hnsw_m=32, ef_construction=200, ef_search=64):
+    """Build (and train, where needed) a FAISS index of the requested type."""
+    import faiss
+
+    count, dimension = embeddings.shape
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type in ("ivf-flat", "ivf-pq"):
+        nlist = min(nlist or default_nlist(count), count)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf-flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            if dimension % pq_m:
+                raise ValueError(f"--pq-m must divide the embedding dimension ({dimension})")
+            # Each sub-quantizer needs at least 2**nbits training points
+            nbits = min(pq_nbits, int(math.log2(count)))
+            if nbits != pq_nbits:
+                logger.warning(f"Only {count} documents, reducing PQ bits from {pq_nbits} to {nbits}")
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, nbits)
+        index.train(embeddings)
+        # nprobe is stored in the index file and used at query time
+        index.nprobe = min(nprobe, nlist)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+        # efSearch is stored in the index file and used at query time
+        index.hnsw.efSearch = ef_search
+    else:
+        raise ValueError(f"Unknown index type: {index_type} (expected one of {', '.join(INDEX_TYPES)})")
+
+    index.add(embeddings)
+    if hasattr(index, "make_direct_map"):
+        # IVF indexes can only reconstruct stored vectors (the exact filtered search) with a direct map
+        index.make_direct_map()
+    return index
+
+def evaluate_recall(index, embeddings, k=5, num_queries=200, seed=0):
+    """Measure recall@k and query latency of an index against exact flat search."""
+    import faiss
+    import numpy as np
+
+    k = min(k, len(embeddings))
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(embeddings), size=min(num_queries, len(embeddings)), replace=False)
+    # Perturb the stored vectors slightly so queries are not exact duplicates
+    queries = embeddings[sample] + rng.normal(0, 0.01, size=(len(sample), embeddings.shape[1])).astype("float32")
+
+    exact = faiss.IndexFlatL2(embeddings.shape[1])
+    exact.add(embeddings)
+    _, expected = exact.search(queries, k)
+
+    started = time.time()
+    _, found = index.search(queries, k)
+    elapsed = time.time() - started
+
+    hits = sum(len(set(expected[i]) & set(found[i])) for i in range(len(queries)))
+    return {
+        "k": k,
+        "queries": len(queries),
+        "recall_at_k": round(hits / (len(queries) * k), 4),
+        "avg_query_ms": round(1000 * elapsed / len(queries), 4)
+    }
+
+def _write_atomic(path, write):
+    """Write via a temporary file so a running app never reads a half-written file."""
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def write_outputs(index, documents, output_dir):
+    """Write index.faiss, docs.bin, filters.npz and keywords.npz and return the index size in bytes."""
+    import faiss
+
+    os.makedirs(output_dir, exist_ok=True)
+    index_path = os.path.join(output_dir, "index.faiss")
+
+    write_doc_store(documents, os.path.join(output_dir, "docs.bin"))
+    FilterIndex.from_documents(documents).save(os.path.join(output_dir, "filters.npz"))
+    KeywordIndex.from_documents(documents).save(os.path.join(output_dir, "keywords.npz"))
+    # The index goes last: the app keys its caches on the index file
+    _write_atomic(index_path, lambda path: faiss.write_index(index, path))
+    return os.path.getsize(index_path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the chatbot's FAISS index from a listings file.")
+    parser.add_argument("--input", required=True, help="Listings file (.csv, .jsonl) or an existing docs.bin/metadata.pkl")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Where to write the index, document store and filter/keyword files")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--batch-size", type=int, default=64, help="Documents per embedding batch")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default: ~4*sqrt(n))")
+    parser.add_argument("--nprobe", type=int, default=8, help="IVF lists probed per query")
+    parser.add_argument("--pq-m", type=int, default=48, help="PQ sub-quantizers (must divide 384)")
+    parser.add_argument("--pq-nbits", type=int, default=8, help="Bits per PQ code")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW neighbours per node")
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--k", type=int, default=5, help="k for recall@k")
+    parser.add_argument("--eval-queries", type=int, default=200, help="Queries sampled for the recall check")
+    parser.add_argument("--report", help="Also write the build report as JSON to this path")
+    args = parser.parse_args(argv)
+
+    records = load_records(args.input)
+    if not records:
+        parser.error(f"No records found in {args.input}")
+    documents = [format_document(record) for record in records]
+    logger.info(f"Loaded {len(documents)} documents from {args.input}")
+
+    started = time.time()
+    embeddings = embed_documents(documents, batch_size=args.batch_size)
+    embed_seconds = time.time() - started
+
+    started = time.time()
+    index = build_index(
+        embeddings,
+        index_type=args.index_type,
+        nlist=args.nlist,
+        nprobe=args.nprobe,
+        pq_m=args.pq_m,
+        pq_nbits=args.pq_nbits,
+        hnsw_m=args.hnsw_m,
+        ef_construction=args.ef_construction,
+        ef_search=args.ef_search
+    )
+    build_seconds = time.time() - started
+
+    evaluation = evaluate_recall(index, embeddings, k=args.k, num_queries=args.eval_queries)
+    index_bytes = write_outputs(index, documents, args.output_dir)
+
+    report = {
+        "index_type": args.index_type,
+        "documents": len(documents),
+        "dimension": int(embeddings.shape[1]),
+        "index_bytes": index_bytes,
+        "raw_embedding_bytes": int(embeddings.nbytes),
+        "embed_seconds": round(embed_seconds, 3),
+        "build_seconds": round(build_seconds, 3),
+        **evaluation
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return report
+
+if __name__ == "__main__":
+    main()
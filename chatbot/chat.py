@@ -1,10 +1,19 @@
 import os
+import json
+import asyncio
 import requests
 import logging
 from dotenv import load_dotenv
-from crm.hubspot_client import create_or_update_contact
-from chatbot.vector_search import retrieve_context
-from utils.calendly_client import CalendlyClient, CalendlyError
+from crm.sync_queue import sync_contact, syncs_inline
+from crm.hubspot_client import prefetch_contact
+from chatbot.vector_search import retrieve_context, query_embedding, index_version
+from chatbot.answer_cache import answer_cache, cache_key
+from chatbot.filters import parse_budget
+from chatbot.turn_scheduler import TurnScheduler
+from chatbot.context_assembler import assemble_context
+from utils.calendly_client import calendly_client, CalendlyError
+from utils.http_client import transport, async_transport, GROQ_API_BASE
+from utils.memory_governor import memory_governor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,14 +21,12 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "150"))  # answer plus the three trailer lines
 
 # Check if Groq API key is configured
 if not GROQ_API_KEY:
     logger.warning("Groq API key not found in environment variables. LLM functionality will be limited.")
 
-# Initialize Calendly client
-calendly_client = CalendlyClient()
-
 def calculate_lead_score(user_data):
     """Calculate a lead score based on weighted parameters."""
     score = (
@@ -44,6 +51,10 @@ def classify_lead(score):
     else:
         return "Unqualified", "Minimal contact. Add to long-term CRM campaigns."
 
+SCHEDULING_FALLBACK = "I apologize, but I'm having trouble creating a scheduling link right now. Please try again later."
+
+MEMORY_PRESSURE_REPLY = "I'm handling a lot of conversations right now. Please send your message again in a moment."
+
 def create_scheduling_suggestion(name, email, property_details=None):
     """Create a scheduling suggestion with Calendly link."""
     try:
@@ -64,32 +75,13 @@ def create_scheduling_suggestion(name, email, property_details=None):
 
         return f"I can help you schedule a consultation. Please use this link to book a time that works for you: {booking_link}"
     except CalendlyError as e:
-        return "I apologize, but I'm having trouble creating a scheduling link right now. Please try again later."
-    except Exception as e:
-        return "I apologize, but I'm having trouble creating a scheduling link right now. Please try again later."
-
-def call_groq_llama(context, question, lead_params):
-    """Call Groq's LLaMA API with enhanced prompt."""
-    # Check if Groq API key is configured
-    if not GROQ_API_KEY:
-        logger.warning("Groq API key not found. Using fallback response.")
-        return (
-            "I'm sorry, but I'm currently operating in limited mode. Please contact support for assistance.",
-            50,
-            "Warm Lead",
-            False,
-            "API key not configured"
-        )
-
-    # Run garbage collection before making API call to free up memory
-    try:
-        import gc
-        gc.collect()
-        logger.debug("Garbage collection run before API call")
+        return SCHEDULING_FALLBACK
     except Exception as e:
-        logger.warning(f"Failed to run garbage collection: {str(e)}")
+        return SCHEDULING_FALLBACK
 
-    url = "https://api.groq.com/openai/v1/chat/completions"
+def build_groq_request(context, question, lead_params):
+    """Return the Groq chat completions URL, headers and payload for a chat turn."""
+    url = f"{GROQ_API_BASE}/chat/completions"
     headers = {
         "Authorization": f"Bearer {GROQ_API_KEY}",
         "Content-Type": "application/json"
@@ -150,45 +142,60 @@ Remember to:
             {"role": "user", "content": user_prompt}
         ],
         "temperature": 0.7,
-        "max_tokens": 150,   # Reduced from 300 to 150
+        "max_tokens": LLM_MAX_TOKENS,
         "top_p": 0.9,
         "frequency_penalty": 0.3,
         "presence_penalty": 0.3
     }
+    return url, headers, data
+
+def parse_llm_reply(reply):
+    """Split an LLM reply into the answer and its Lead Score, Qualification and Schedule Meeting lines."""
+    lines = reply.split('\n')
+    short_reply = []
+    lead_score = 50
+    qualification = "Warm"
+    schedule_meeting = False
+
+    for line in lines:
+        if "Lead Score:" in line:
+            try:
+                lead_score = int(line.split(':')[1].strip())
+            except:
+                pass
+        elif "Qualification:" in line:
+            qualification = line.split(':')[1].strip()
+        elif "Schedule Meeting:" in line:
+            schedule_meeting = "true" in line.lower()
+        else:
+            short_reply.append(line)
+
+    short_reply = '\n'.join(short_reply).strip()
+    return short_reply, lead_score, qualification, schedule_meeting
+
+def call_groq_llama(context, question, lead_params):
+    """Call Groq's LLaMA API with enhanced prompt."""
+    # Check if Groq API key is configured
+    if not GROQ_API_KEY:
+        logger.warning("Groq API key not found. Using fallback response.")
+        return (
+            "I'm sorry, but I'm currently operating in limited mode. Please contact support for assistance.",
+            50,
+            "Warm Lead",
+            False,
+            "API key not configured"
+        )
+
+    url, headers, data = build_groq_request(context, question, lead_params)
 
     try:
-        response = requests.post(url, headers=headers, json=data)
+        # Completions have no side effects, so 5xx responses are safe to retry
+        response = transport.post(url, headers=headers, json=data, idempotent=True)
         response.raise_for_status()
         result = response.json()
         reply = result["choices"][0]["message"]["content"]
 
-        lines = reply.split('\n')
-        short_reply = []
-        lead_score = 50
-        qualification = "Warm"
-        schedule_meeting = False
-
-        for line in lines:
-            if "Lead Score:" in line:
-                try:
-                    lead_score = int(line.split(':')[1].strip())
-                except:
-                    pass
-            elif "Qualification:" in line:
-                qualification = line.split(':')[1].strip()
-            elif "Schedule Meeting:" in line:
-                schedule_meeting = "true" in line.lower()
-            else:
-                short_reply.append(line)
-
-        short_reply = '\n'.join(short_reply).strip()
-
-        # Run garbage collection after API call to free up memory
-        try:
-            import gc
-            gc.collect()
-        except Exception:
-            pass
+        short_reply, lead_score, qualification, schedule_meeting = parse_llm_reply(reply)
 
         return short_reply, lead_score, qualification, schedule_meeting, reply
 
@@ -197,52 +204,225 @@ Remember to:
     except Exception as e:
         return f"Error: {str(e)}", 0, "Unknown", False, str(e)
 
-def handle_chat(name, email, message, chat_history, budget):
-    """Handle chat logic with dynamic lead scoring."""
+async def call_groq_llama_async(context, question, lead_params):
+    """call_groq_llama on the async transport, for the ASGI app."""
+    if not GROQ_API_KEY:
+        logger.warning("Groq API key not found. Using fallback response.")
+        return (
+            "I'm sorry, but I'm currently operating in limited mode. Please contact support for assistance.",
+            50,
+            "Warm Lead",
+            False,
+            "API key not configured"
+        )
+
+    url, headers, data = build_groq_request(context, question, lead_params)
+
+    try:
+        response = await async_transport.post(url, headers=headers, json=data, idempotent=True)
+        response.raise_for_status()
+        reply = response.json()["choices"][0]["message"]["content"]
+
+        short_reply, lead_score, qualification, schedule_meeting = parse_llm_reply(reply)
+        return short_reply, lead_score, qualification, schedule_meeting, reply
+    except Exception as e:
+        return f"Error: {str(e)}", 0, "Unknown", False, str(e)
+
+TRAILER_PREFIXES = ("Lead Score:", "Qualification:", "Schedule Meeting:")
+
+class TrailerFilter:
+    """Withholds the Lead Score, Qualification and Schedule Meeting lines from streamed reply text.
+
+    A line is released as soon as it can no longer turn into one of those
+    lines. Blank lines are held back until more visible text follows, so
+    the stream matches parse_llm_reply's stripped answer.
+    """
+
+    def __init__(self):
+        self.line = ""         # Unreleased text of the current line
+        self.visible = False   # The current line has been (partly) released
+        self.pending = ""      # Line breaks and whitespace waiting for visible text
+        self.started = False
+
+    @staticmethod
+    def _label(line):
+        return line.lstrip(" \t*#")
+
+    def _is_trailer(self, line):
+        label = self._label(line)
+        return any(label.startswith(prefix) for prefix in TRAILER_PREFIXES)
+
+    def _may_be_trailer(self, line):
+        label = self._label(line)
+        return any(prefix.startswith(label) or label.startswith(prefix) for prefix in TRAILER_PREFIXES)
+
+    def _release(self, text):
+        if not text.strip():
+            if self.started:
+                self.pending += text
+            return ""
+        if self.started:
+            text = self.pending + text
+        else:
+            text = text.lstrip()
+        self.pending = ""
+        self.started = True
+        return text
+
+    def feed(self, text):
+        """Add streamed text and return the part that can be shown now."""
+        released = []
+        for position, part in enumerate(text.split("\n")):
+            if position:
+                # The previous line is complete
+                if self.visible or not self._is_trailer(self.line):
+                    released.append(self._release(self.line))
+                    self.pending += "\n" if self.started else ""
+                self.line = ""
+                self.visible = False
+
+            self.line += part
+            if self.visible or not self._may_be_trailer(self.line):
+                released.append(self._release(self.line))
+                self.line = ""
+                self.visible = True
+        return "".join(released)
+
+    def flush(self):
+        """Return whatever is left of the last line once the stream has ended."""
+        text = ""
+        if self.visible or not self._is_trailer(self.line):
+            text = self._release(self.line)
+        self.line = ""
+        return text
+
+def stream_groq_llama(context, question, lead_params):
+    """Stream a Groq completion, yielding ("token", text) as visible text arrives.
+
+    Ends with ("reply", (answer, lead_score, qualification, schedule_meeting,
+    full_reply)), the same tuple call_groq_llama returns.
+    """
+    if not GROQ_API_KEY:
+        logger.warning("Groq API key not found. Using fallback response.")
+        answer = "I'm sorry, but I'm currently operating in limited mode. Please contact support for assistance."
+        yield "token", answer
+        yield "reply", (answer, 50, "Warm Lead", False, "API key not configured")
+        return
+
+    url, headers, data = build_groq_request(context, question, lead_params)
+    data["stream"] = True
+
+    trailer = TrailerFilter()
+    parts = []
+    response = None
+    try:
+        response = transport.post(url, headers=headers, json=data, idempotent=True, stream=True)
+        response.raise_for_status()
+
+        # Server-Sent Events: "data: {chunk}" lines, terminated by "data: [DONE]"
+        for line in response.iter_lines(chunk_size=None):
+            if not line.startswith(b"data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == b"[DONE]":
+                break
+            delta = json.loads(payload)["choices"][0].get("delta", {}).get("content")
+            if not delta:
+                continue
+            parts.append(delta)
+            visible = trailer.feed(delta)
+            if visible:
+                yield "token", visible
+
+        visible = trailer.flush()
+        if visible:
+            yield "token", visible
+    except Exception as e:
+        logger.error(f"Error streaming from Groq: {str(e)}")
+        if not parts:
+            yield "reply", (f"Error: {str(e)}", 0, "Unknown", False, str(e))
+            return
+    finally:
+        if response is not None:
+            response.close()
+
+    reply = "".join(parts)
+    short_reply, lead_score, qualification, schedule_meeting = parse_llm_reply(reply)
+    yield "reply", (short_reply, lead_score, qualification, schedule_meeting, reply)
+
+def prepare_chat(name, email, message, conversation, budget, scheduler=None):
+    """Everything in a chat turn before the LLM call.
+
+    Records the user's message in conversation (a ConversationState).
+    Returns (result, None) when the turn is answered without the LLM, and
+    otherwise (None, turn) with the context and lead parameters to send.
+    Retrieval and the HubSpot contact lookup run on the turn scheduler while
+    the prompt is assembled.
+    """
+    scheduler = scheduler or TurnScheduler()
+
     # Check if this is the first message
-    if not chat_history:
-        return {
+    if not conversation:
+        conversation.add_bot("Hello! I'm your real estate assistant. How can I help?")
+        return dict({
             "answer": "Hello! I'm your real estate assistant. How can I help?",
             "lead_score": 0,
             "lead_status": "Collecting Info",
             "crm_status": "Skipped",
             "crm_response": "Initial greeting",
-            "raw_llm_reply": "",
-            "chat_history": "Bot: Hello! I'm your real estate assistant. How can I help?"
-        }
+            "raw_llm_reply": ""
+        }, **scheduler.metadata()), None
 
     # Check for scheduling request
     if any(word in message.lower() for word in ['schedule', 'book', 'appointment', 'meeting', 'call']):
-        scheduling_suggestion = create_scheduling_suggestion(name, email)
-        return {
+        scheduling_suggestion = scheduler.run(
+            "scheduling", create_scheduling_suggestion, name, email, fallback=SCHEDULING_FALLBACK
+        )
+        conversation.add_user(message)
+        conversation.add_bot(scheduling_suggestion)
+        return dict({
             "answer": scheduling_suggestion,
             "lead_score": 80,
             "lead_status": "Hot Lead",
             "crm_status": "Success",
             "crm_response": "Scheduling link provided",
-            "raw_llm_reply": scheduling_suggestion,
-            "chat_history": chat_history + f"\nUser: {message}\nBot: {scheduling_suggestion}"
-        }
-
-    # Maintain more context for better responses
-    chat_lines = chat_history.split('\n')
-    recent_context = '\n'.join(chat_lines[-3:]) if len(chat_lines) > 3 else chat_history
+            "raw_llm_reply": scheduling_suggestion
+        }, **scheduler.metadata()), None
+
+    # Near the worker's memory limit, answer without retrieval or the LLM
+    if memory_governor.shedding():
+        conversation.add_user(message)
+        conversation.add_bot(MEMORY_PRESSURE_REPLY)
+        scheduler.mark_degraded("memory")
+        return dict({
+            "answer": MEMORY_PRESSURE_REPLY,
+            "lead_score": 0,
+            "lead_status": "Unknown",
+            "crm_status": "Skipped",
+            "crm_response": "Server under memory pressure",
+            "raw_llm_reply": ""
+        }, **scheduler.metadata()), None
 
     # Check if vector search is enabled
+    retrieval = None
+    # Only show listings the user can afford
+    max_price = parse_budget(budget)
+    filters = {"max_price": max_price} if max_price else None
     if os.environ.get("ENABLE_VECTOR_SEARCH", "True").lower() == "true":
-        try:
-            vector_context = retrieve_context(message)
-        except Exception as e:
-            logger.error(f"Error retrieving vector context: {str(e)}")
-            vector_context = ["Vector search unavailable."]
-    else:
-        vector_context = ["Vector search disabled."]
+        retrieval = scheduler.start(
+            "retrieval", retrieve_context, message, filters=filters, fallback=["Vector search unavailable."]
+        )
+
+    # An inline CRM update needs the contact id; look it up while retrieval and the LLM run
+    if syncs_inline():
+        scheduler.start("crm_lookup", prefetch_contact, email)
 
-    context = f"User: name={name}, email={email}, budget={budget}\n{vector_context}\nRecent Chat:\n{recent_context}"
-    chat_history += f"\nUser: {message}"
+    # Maintain more context for better responses
+    recent_context = conversation.recent_context(3)
+    conversation.add_user(message)
 
     # Enhanced lead parameters
-    num_messages = len([m for m in chat_history.split('\n') if m.startswith('User:')])
+    num_messages = conversation.user_messages
     lead_params = {
         "interest_level": min(30, num_messages * 5),
         "budget_match": 20 if budget else 0,
@@ -253,39 +433,167 @@ def handle_chat(name, email, message, chat_history, budget):
         "past_interactions": 5 if num_messages > 1 else 0
     }
 
-    # Get response from Groq
-    answer, groq_lead_score, groq_qualification, schedule_meeting, full_reply = call_groq_llama(context, message, lead_params)
+    vector_context = scheduler.wait(retrieval) if retrieval is not None else ["Vector search disabled."]
+    answer_key = cache_key(message, vector_context) if retrieval is not None else None
+    if answer_key is not None:
+        # A self-contained question whose answer may be reused for other users, so the
+        # prompt carries only the records: no name, email, budget or chat history
+        vector_context, prompt_report = assemble_context(vector_context, "")
+        context = vector_context
+    else:
+        # Only the best ranked records that fit the token budget, minus what the chat already says
+        vector_context, prompt_report = assemble_context(vector_context, recent_context)
+        context = f"User: name={name}, email={email}, budget={budget}\n{vector_context}\nRecent Chat:\n{recent_context}"
+
+    return None, {
+        "name": name,
+        "email": email,
+        "message": message,
+        "budget": budget,
+        "conversation": conversation,
+        "context": context,
+        "lead_params": lead_params,
+        "scheduler": scheduler,
+        "prompt_report": prompt_report,
+        "filters": filters,
+        "answer_key": answer_key,
+        "cached": False
+    }
+
+def cached_reply(turn):
+    """This turn's reply from the answer cache, as call_groq_llama returns it, or None on a miss.
+
+    Only the answer text is cached; the lead is scored from this turn's lead parameters.
+    """
+    if turn["answer_key"] is None:
+        return None
+
+    with turn["scheduler"].timed("answer_cache"):
+        turn["query_embedding"] = query_embedding(turn["message"], filters=turn["filters"])
+        answer = answer_cache.get(turn["answer_key"], turn["query_embedding"], index_version())
+    if answer is None:
+        return None
+
+    turn["cached"] = True
+    lead_score = calculate_lead_score(turn["lead_params"])
+    qualification = classify_lead(lead_score)[0].replace(" Lead", "")
+    return answer, lead_score, qualification, False, answer
+
+def remember_reply(turn, llm_reply):
+    """Cache a successful LLM answer for a cacheable turn (prompted without any user details)."""
+    answer = llm_reply[0]
+    if turn["answer_key"] is None or not GROQ_API_KEY or not answer or answer.startswith("Error:"):
+        return
+    answer_cache.put(turn["answer_key"], answer, turn.get("query_embedding"), index_version())
+
+CRM_STATUS = {200: "Success", 201: "Success", 202: "Queued", 204: "Skipped"}
+
+def finish_chat(turn, answer, groq_lead_score, groq_qualification, full_reply):
+    """Everything in a chat turn after the LLM call: repetition check, history and CRM update.
+
+    The CRM update gets CRM_DEADLINE seconds; past that the reply goes out
+    with crm_status "Pending" and the update completes in the background.
+    """
+    conversation = turn["conversation"]
+    scheduler = turn["scheduler"]
 
     # Check for topic repetition
-    if len(chat_lines) > 1:
-        prev_response = chat_lines[-1]
-        if answer.lower() in prev_response.lower():
-            # Modify response to avoid repetition
-            answer = "Let me provide some additional information: " + answer
+    if conversation.last_bot_reply and answer.lower() in conversation.last_bot_reply.lower():
+        # Modify response to avoid repetition
+        answer = "Let me provide some additional information: " + answer
 
-    chat_history += f"\nBot: {answer}"
+    conversation.add_bot(answer)
 
-    # Update CRM
-    try:
-        crm_status_code, crm_response = create_or_update_contact(
-            email=email,
-            name=name,
-            budget=budget,
-            lead_type=groq_qualification,
-            lead_score=groq_lead_score,
-            qualification=groq_qualification,
-            chat_history=chat_history,
-            user_type="User"
-        )
-    except:
-        crm_status_code, crm_response = 500, "CRM update failed"
+    # Update CRM (queued by default, so the reply does not wait for HubSpot)
+    chat_history, lead_status = conversation.transcript(), conversation.lead_status()
 
-    return {
+    def update_crm():
+        try:
+            return sync_contact(
+                email=turn["email"],
+                name=turn["name"],
+                budget=turn["budget"],
+                lead_type=groq_qualification,
+                lead_score=groq_lead_score,
+                qualification=groq_qualification,
+                chat_history=chat_history,
+                user_type="User",
+                lead_status=lead_status
+            )
+        except:
+            return 500, "CRM update failed"
+
+    crm_status_code, crm_response = scheduler.run("crm", update_crm, fallback=(None, "CRM update still running"))
+    if crm_status_code is None:
+        crm_status = "Pending"
+    else:
+        crm_status = CRM_STATUS.get(crm_status_code, f"Error: {crm_status_code}")
+
+    return dict({
         "answer": answer,
         "lead_score": groq_lead_score,
         "lead_status": groq_qualification,
-        "crm_status": "Success" if crm_status_code in [200, 201] else f"Error: {crm_status_code}",
+        "crm_status": crm_status,
         "crm_response": crm_response,
         "raw_llm_reply": full_reply,
-        "chat_history": chat_history
-    }
+        "prompt": turn["prompt_report"],
+        "cached": turn["cached"]
+    }, **scheduler.metadata())
+
+def handle_chat(name, email, message, conversation, budget):
+    """Handle chat logic with dynamic lead scoring; adds the turn to conversation."""
+    result, turn = prepare_chat(name, email, message, conversation, budget)
+    if result is not None:
+        return result
+
+    # FAQ-style questions may already have an answer; otherwise get one from Groq
+    llm_reply = cached_reply(turn)
+    if llm_reply is None:
+        with turn["scheduler"].timed("llm"):
+            llm_reply = call_groq_llama(turn["context"], message, turn["lead_params"])
+        remember_reply(turn, llm_reply)
+
+    answer, groq_lead_score, groq_qualification, schedule_meeting, full_reply = llm_reply
+    return finish_chat(turn, answer, groq_lead_score, groq_qualification, full_reply)
+
+def handle_chat_stream(name, email, message, conversation, budget):
+    """Streaming handle_chat: yields ("token", text) as the answer arrives, then ("done", result)."""
+    result, turn = prepare_chat(name, email, message, conversation, budget)
+    if result is not None:
+        yield "token", result["answer"]
+        yield "done", result
+        return
+
+    llm_reply = cached_reply(turn)
+    if llm_reply is not None:
+        yield "token", llm_reply[0]
+    else:
+        with turn["scheduler"].timed("llm"):
+            for kind, value in stream_groq_llama(turn["context"], message, turn["lead_params"]):
+                if kind == "token":
+                    yield kind, value
+                else:
+                    llm_reply = value
+        remember_reply(turn, llm_reply)
+
+    answer, groq_lead_score, groq_qualification, schedule_meeting, full_reply = llm_reply
+    yield "done", finish_chat(turn, answer, groq_lead_score, groq_qualification, full_reply)
+
+async def handle_chat_async(name, email, message, conversation, budget):
+    """handle_chat for the ASGI app.
+
+    Retrieval and the CRM update run in worker threads and the Groq call is
+    awaited, so the event loop keeps serving other sessions meanwhile.
+    """
+    result, turn = await asyncio.to_thread(prepare_chat, name, email, message, conversation, budget)
+    if result is not None:
+        return result
+
+    llm_reply = await asyncio.to_thread(cached_reply, turn)
+    if llm_reply is None:
+        with turn["scheduler"].timed("llm"):
+            llm_reply = await call_groq_llama_async(turn["context"], message, turn["lead_params"])
+        remember_reply(turn, llm_reply)
+
+    answer, groq_lead_score, groq_qualification, schedule_meeting, full_reply = llm_reply
+    return await asyncio.to_thread(finish_chat, turn, answer, groq_lead_score, groq_qualification, full_reply)
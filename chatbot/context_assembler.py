@@ -0,0 +1,182 @@
+"""
+Token-budgeted retrieval context for the LLM prompt.
+
+retrieve_context returns up to k full knowledge base records, indented and
+including placeholder fields ("Price: nan"). Interpolating that list as-is
+sends every record's whitespace and Python list syntax on every turn.
+assemble_context instead:
+
+    - strips the indentation, blank lines and empty fields from each record
+    - drops records that repeat a higher ranked one, or that the recent chat
+      already contains in full
+    - packs the records in rank order into CONTEXT_TOKEN_BUDGET tokens
+
+Tokens are counted with the tokenizer.json at PROMPT_TOKENIZER (e.g. the
+Llama 3 tokenizer; needs the tokenizers package) or, without one, with a
+local estimate that runs close to BPE counts on English text.
+
+    python -m chatbot.context_assembler report
+
+compares the raw and assembled context size over the sample questions.
+"""
+import os
+import re
+import sys
+import json
+import logging
+import argparse
+import threading
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "400"))  # tokens of retrieved records per prompt
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "")  # path to a tokenizer.json
+
+EMPTY_VALUES = {"", "nan", "none", "n/a"}
+_PIECES = re.compile(r"\w+|[^\w\s]")
+_SPEAKER = re.compile(r"^(user|bot):\s*", re.IGNORECASE)
+
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+_stats = {"turns": 0, "raw_tokens": 0, "context_tokens": 0, "snippets_used": 0, "snippets_dropped": 0}
+_stats_lock = threading.Lock()
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_loaded
+    if _tokenizer_loaded:
+        return _tokenizer
+    with _tokenizer_lock:
+        if not _tokenizer_loaded:
+            if PROMPT_TOKENIZER:
+                try:
+                    from tokenizers import Tokenizer
+
+                    _tokenizer = Tokenizer.from_file(PROMPT_TOKENIZER)
+                except Exception as e:
+                    logger.warning(f"Could not load {PROMPT_TOKENIZER}, estimating token counts: {str(e)}")
+            _tokenizer_loaded = True
+    return _tokenizer
+
+def count_tokens(text):
+    """Tokens in text, by PROMPT_TOKENIZER or estimated (a piece per word or symbol, a token per 4 letters)."""
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return sum((len(piece) + 3) // 4 for piece in _PIECES.findall(text))
+
+def compact_record(record):
+    """A knowledge base record without indentation, blank lines or empty "Key: nan" fields."""
+    lines = []
+    for line in str(record).splitlines():
+        line = " ".join(line.split())
+        if not line:
+            continue
+        key, sep, value = line.partition(":")
+        if sep and value.strip().lower() in EMPTY_VALUES:
+            continue
+        lines.append(line)
+    return "\n".join(lines)
+
+def assemble_context(snippets, recent_chat="", budget=CONTEXT_TOKEN_BUDGET):
+    """Pack ranked snippets into budget tokens; returns (context text, report).
+
+    Records are kept or left out whole: a repeat of a higher ranked record,
+    or one whose every line is already in recent_chat, is skipped. Fields
+    shared with other records (prices, statuses) always stay with their own
+    record. A snippet that does not fit is skipped in favour of smaller,
+    lower ranked ones.
+    """
+    if isinstance(snippets, str):
+        snippets = [snippets]
+
+    # Chat lines without their "User: " / "Bot: " prefix, to compare with record lines
+    chat_lines = {
+        _SPEAKER.sub("", " ".join(line.split())).lower() for line in recent_chat.splitlines() if line.strip()
+    }
+    seen_records = set()
+    packed, used_tokens, dropped = [], 0, 0
+    for snippet in snippets:
+        text = compact_record(snippet)
+        lines = {line.lower() for line in text.splitlines()}
+        if not text or text.lower() in seen_records or lines <= chat_lines:
+            dropped += 1
+            continue
+        seen_records.add(text.lower())
+
+        tokens = count_tokens(text)
+        if used_tokens + tokens > budget:
+            dropped += 1
+            continue
+        packed.append(text)
+        used_tokens += tokens
+
+    context = "\n\n".join(packed)
+    raw_tokens, context_tokens = count_tokens(str(list(snippets))), count_tokens(context)
+    report = {
+        "raw_tokens": raw_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": max(0, raw_tokens - context_tokens),
+        "snippets_used": len(packed),
+        "snippets_dropped": dropped
+    }
+
+    with _stats_lock:
+        _stats["turns"] += 1
+        _stats["raw_tokens"] += report["raw_tokens"]
+        _stats["context_tokens"] += report["context_tokens"]
+        _stats["snippets_used"] += report["snippets_used"]
+        _stats["snippets_dropped"] += report["snippets_dropped"]
+    return context, report
+
+def get_stats():
+    """Totals across the turns assembled by this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["tokens_saved"] = max(0, stats["raw_tokens"] - stats["context_tokens"])
+    stats["tokenizer"] = PROMPT_TOKENIZER if _get_tokenizer() is not None else "estimate"
+    return stats
+
+def report(questions, budget=CONTEXT_TOKEN_BUDGET, k=5):
+    """Raw against assembled context tokens for each question, with the full prompt's size."""
+    from chatbot.vector_search import retrieve_context
+    from chatbot.chat import build_groq_request
+
+    lead_params = dict.fromkeys(
+        ("interest_level", "budget_match", "engagement_time", "follow_up", "offer_response", "appointment",
+         "past_interactions"), 0
+    )
+    rows = []
+    for question in questions:
+        snippets = retrieve_context(question, k=k)
+        context, turn_report = assemble_context(snippets, budget=budget)
+
+        raw_prompt = build_groq_request(str(snippets), question, lead_params)[2]["messages"]
+        prompt = build_groq_request(context, question, lead_params)[2]["messages"]
+        turn_report["question"] = question
+        turn_report["raw_prompt_tokens"] = sum(count_tokens(message["content"]) for message in raw_prompt)
+        turn_report["prompt_tokens"] = sum(count_tokens(message["content"]) for message in prompt)
+        rows.append(turn_report)
+    return {"budget": budget, "turns": rows, "totals": get_stats()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Token-budgeted retrieval context.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="Compare raw and assembled context sizes")
+    report_parser.add_argument("questions", nargs="*", default=[
+        "what plots do you have",
+        "Do you have apartments in Miami under 400k?",
+        "How much is the Westside Villa?",
+        "What are your current offers?",
+        "Tell me about property management services"
+    ])
+    report_parser.add_argument("--budget", type=int, default=CONTEXT_TOKEN_BUDGET)
+    args = parser.parse_args(argv)
+
+    print(json.dumps(report(args.questions, budget=args.budget), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
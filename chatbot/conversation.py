@@ -0,0 +1,93 @@
+"""
+Per-session conversation state.
+
+Turns are kept as a bounded list of {"role": "user" | "bot", "text": ...}
+next to counters and flags that are updated as each turn is added, so a chat
+turn never has to re-split or re-scan the whole transcript. The transcript
+text HubSpot stores is rendered from the bounded turns only when a CRM
+update is made.
+"""
+import os
+
+MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "20"))  # user and bot messages kept per session
+
+# hs_lead_status keywords, in order of precedence (matched anywhere in the conversation)
+LEAD_STATUS_KEYWORDS = (
+    ("New", ("looking", "searching")),
+    ("In Progress", ("price", "cost")),
+    ("Open Deal", ("buy", "purchase"))
+)
+
+class ConversationState:
+    """Recent turns plus running totals for one chat session."""
+
+    def __init__(self, turns=None, user_messages=0, lead_flags=None, last_bot_reply=""):
+        self.turns = list(turns or [])[-MAX_TURNS:]
+        self.user_messages = user_messages
+        self.lead_flags = set(lead_flags or ())
+        self.last_bot_reply = last_bot_reply
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restore the state saved in the session (None starts a new conversation)."""
+        if not data:
+            return cls()
+        return cls(
+            turns=data.get("turns"),
+            user_messages=data.get("user_messages", 0),
+            lead_flags=data.get("lead_flags"),
+            last_bot_reply=data.get("last_bot_reply", "")
+        )
+
+    def to_dict(self):
+        return {
+            "turns": self.turns,
+            "user_messages": self.user_messages,
+            "lead_flags": sorted(self.lead_flags),
+            "last_bot_reply": self.last_bot_reply
+        }
+
+    def __bool__(self):
+        return bool(self.turns)
+
+    def _add(self, role, text):
+        self.turns.append({"role": role, "text": text})
+        if len(self.turns) > MAX_TURNS:
+            del self.turns[0]
+
+        lowered = text.lower()
+        for status, keywords in LEAD_STATUS_KEYWORDS:
+            if status not in self.lead_flags and any(keyword in lowered for keyword in keywords):
+                self.lead_flags.add(status)
+
+    def add_user(self, text):
+        self._add("user", text)
+        self.user_messages += 1
+
+    def add_bot(self, text):
+        self._add("bot", text)
+        self.last_bot_reply = text
+
+    def lead_status(self):
+        """hs_lead_status for HubSpot, or None if no keyword has come up yet."""
+        for status, _ in LEAD_STATUS_KEYWORDS:
+            if status in self.lead_flags:
+                return status
+        return None
+
+    def recent_context(self, lines=3):
+        """The last few transcript lines, as the LLM prompt's "Recent Chat"."""
+        recent = []
+        for turn in reversed(self.turns):
+            recent[:0] = self._render(turn).split("\n")
+            if len(recent) >= lines:
+                break
+        return "\n".join(recent[-lines:])
+
+    @staticmethod
+    def _render(turn):
+        return ("User: " if turn["role"] == "user" else "Bot: ") + turn["text"]
+
+    def transcript(self):
+        """The recent turns as a "User: ... / Bot: ..." transcript."""
+        return "\n".join(self._render(turn) for turn in self.turns)
@@ -0,0 +1,102 @@
+"""
+Memory-mapped document store for the knowledge base.
+
+Layout of docs.bin (all integers little-endian uint64):
+
+    magic (8 bytes) | count | offsets[count + 1] | UTF-8 blob
+
+Document i is blob[offsets[i]:offsets[i + 1]]. The file is mapped read-only,
+so opening it costs the same regardless of catalog size, documents are only
+decoded when looked up, and the pages live in the OS page cache shared by all
+workers rather than in each worker's heap.
+
+Convert an existing pickled metadata list with:
+    python -m chatbot.doc_store chatbot/embeddings/metadata.pkl
+"""
+import os
+import sys
+import mmap
+import struct
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MAGIC = b"XYZDOCS1"
+_HEADER = struct.Struct("<8sQ")
+_OFFSET = struct.Struct("<Q")
+_OFFSET_PAIR = struct.Struct("<QQ")
+
+class DocStore:
+    """Read-only, memory-mapped list of documents addressed by FAISS id."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self._count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a document store")
+
+        self._offsets_start = _HEADER.size
+        self._blob_start = self._offsets_start + _OFFSET.size * (self._count + 1)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("document id out of range")
+
+        start, end = _OFFSET_PAIR.unpack_from(self._mmap, self._offsets_start + _OFFSET.size * i)
+        return self._mmap[self._blob_start + start:self._blob_start + end].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def close(self):
+        self._mmap.close()
+
+def write_doc_store(documents, path):
+    """Write documents to a new store, replacing any existing file atomically."""
+    encoded = [document.encode("utf-8") for document in documents]
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(encoded)))
+        offset = 0
+        f.write(_OFFSET.pack(offset))
+        for data in encoded:
+            offset += len(data)
+            f.write(_OFFSET.pack(offset))
+        for data in encoded:
+            f.write(data)
+    os.replace(tmp_path, path)
+
+def main(argv=None):
+    """Convert a pickled metadata list into docs.bin alongside it."""
+    import pickle
+
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) not in (1, 2):
+        print("Usage: python -m chatbot.doc_store METADATA_PKL [DOCS_BIN]")
+        return 1
+
+    source = argv[0]
+    target = argv[1] if len(argv) == 2 else os.path.join(os.path.dirname(source), "docs.bin")
+
+    with open(source, "rb") as f:
+        documents = pickle.load(f)
+
+    write_doc_store(documents, target)
+    logger.info(f"Wrote {len(documents)} documents to {target}")
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
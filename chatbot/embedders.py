@@ -0,0 +1,212 @@
+"""
+Query embedding backends.
+
+EMBEDDING_BACKEND selects how queries are embedded:
+
+    sentence-transformers  all-MiniLM-L6-v2 through sentence-transformers/torch (default)
+    onnx                   the same model exported to ONNX and run with onnxruntime,
+                           without importing torch or transformers
+
+The ONNX backend reads ONNX_MODEL_DIR (model.onnx / model-int8.onnx plus
+tokenizer.json). Create and check it with:
+
+    python -m chatbot.embedders export            # writes model.onnx and model-int8.onnx
+    python -m chatbot.embedders verify --model-file model-int8.onnx
+
+verify compares the ONNX embeddings against sentence-transformers on the
+knowledge base documents. Both exports must stay within the cosine tolerances
+below, which keeps them compatible with the existing FAISS index.
+"""
+import os
+import sys
+import logging
+import argparse
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+MAX_SEQ_LENGTH = 256  # sentence-transformers' max_seq_length for this model
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers").lower()
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(os.path.dirname(__file__), 'embeddings/onnx'))
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE", "model-int8.onnx")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "1"))
+
+# Minimum cosine similarity to the sentence-transformers embedding of the same text
+COSINE_TOLERANCE = {
+    "model.onnx": 0.9999,
+    "model-int8.onnx": 0.98
+}
+
+class SentenceTransformerEmbedder:
+    """The reference backend: sentence-transformers on torch."""
+
+    name = "sentence-transformers"
+
+    def __init__(self):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(MODEL_NAME, device="cpu")
+
+    def encode(self, texts, batch_size=32):
+        return self.model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+
+class OnnxEmbedder:
+    """MiniLM exported to ONNX: WordPiece tokenization, mean pooling and L2 normalization in NumPy."""
+
+    name = "onnx"
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, model_file=ONNX_MODEL_FILE):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = ONNX_THREADS
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size=32):
+        import numpy as np
+
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(list(texts[start:start + batch_size]))
+            input_ids = np.array([e.ids for e in encodings], dtype="int64")
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype="int64")
+
+            inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                inputs["token_type_ids"] = np.zeros_like(input_ids)
+
+            token_embeddings = self.session.run(None, inputs)[0]
+
+            # Mean pooling over real tokens, then L2 normalization, as sentence-transformers does
+            mask = attention_mask[..., None].astype("float32")
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype("float32"))
+
+        return np.vstack(batches)
+
+BACKENDS = {
+    "sentence-transformers": SentenceTransformerEmbedder,
+    "onnx": OnnxEmbedder
+}
+
+def load_embedder(backend=None):
+    """Create the configured embedding backend."""
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend} (expected one of {', '.join(BACKENDS)})")
+
+    logger.info(f"Loading {backend} embedding backend...")
+    return BACKENDS[backend]()
+
+def export_onnx(output_dir=ONNX_MODEL_DIR, quantize=True):
+    """Export MiniLM to ONNX (plus a dynamically quantized int8 copy) with its tokenizer."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    repo = f"sentence-transformers/{MODEL_NAME}"
+    tokenizer = AutoTokenizer.from_pretrained(repo)
+    model = AutoModel.from_pretrained(repo)
+    model.eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    model_path = os.path.join(output_dir, "model.onnx")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ("input_ids", "attention_mask", "token_type_ids")}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            model_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+    tokenizer.save_pretrained(output_dir)
+    logger.info(f"Exported {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(output_dir, "model-int8.onnx")
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        logger.info(f"Quantized {quantized_path}")
+
+def verify(model_dir=ONNX_MODEL_DIR, model_file=ONNX_MODEL_FILE, min_cosine=None, limit=None):
+    """Compare ONNX embeddings of the knowledge base documents against sentence-transformers."""
+    import numpy as np
+    from chatbot.doc_store import DocStore
+    from chatbot.vector_search import DOCS_PATH
+
+    if min_cosine is None:
+        min_cosine = COSINE_TOLERANCE.get(model_file, 0.98)
+
+    store = DocStore(DOCS_PATH)
+    texts = list(store)[:limit] + [
+        "what plots do you have",
+        "current offers",
+        "Do you have apartments in Miami under 400k?"
+    ]
+    store.close()
+
+    reference = SentenceTransformerEmbedder().encode(texts)
+    candidate = OnnxEmbedder(model_dir, model_file).encode(texts)
+    cosine = (reference * candidate).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    )
+
+    report = {
+        "model_file": model_file,
+        "texts": len(texts),
+        "min_cosine": round(float(cosine.min()), 6),
+        "mean_cosine": round(float(cosine.mean()), 6),
+        "tolerance": min_cosine,
+        "passed": bool(cosine.min() >= min_cosine)
+    }
+    return report
+
+def main(argv=None):
+    import json
+
+    parser = argparse.ArgumentParser(description="Export and verify the ONNX embedding backend.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export MiniLM to ONNX and int8 ONNX")
+    export_parser.add_argument("--output-dir", default=ONNX_MODEL_DIR)
+    export_parser.add_argument("--no-quantize", action="store_true")
+
+    verify_parser = subparsers.add_parser("verify", help="Check ONNX embeddings against sentence-transformers")
+    verify_parser.add_argument("--model-dir", default=ONNX_MODEL_DIR)
+    verify_parser.add_argument("--model-file", default=ONNX_MODEL_FILE)
+    verify_parser.add_argument("--min-cosine", type=float, default=None)
+    verify_parser.add_argument("--limit", type=int, default=None, help="Only compare the first N documents")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export_onnx(args.output_dir, quantize=not args.no_quantize)
+        return 0
+
+    report = verify(args.model_dir, args.model_file, args.min_cosine, args.limit)
+    print(json.dumps(report, indent=2))
+    return 0 if report["passed"] else 1
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
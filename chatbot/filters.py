@@ -0,0 +1,239 @@
+"""
+Structured metadata filters for vector retrieval.
+
+Listing documents carry Location, Price and Status fields. FilterIndex keeps
+them as per-field columns (a sorted price array plus location and status
+codes) so a filter such as {"max_price": 300000, "location": "Miami"} turns
+into a bitmap of candidate FAISS ids without touching the documents.
+
+Filters only narrow listings ("Property:" records); company, service and
+offer records always remain candidates.
+
+Precompute filters.npz for an existing document store with:
+    python -m chatbot.filters chatbot/embeddings/docs.bin
+"""
+import os
+import re
+import sys
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+FILTER_KEYS = ("max_price", "min_price", "location", "status")
+
+_NUMBER = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*([kKmM]\b|million\b|thousand\b)?")
+_MULTIPLIERS = {"k": 1e3, "thousand": 1e3, "m": 1e6, "million": 1e6}
+
+# Amounts in free-text budgets: a number counts only with a currency or a unit
+_BUDGET_AMOUNT = re.compile(
+    r"(?P<currency>[$€£₹]|\b(?:usd|aed|eur|gbp|inr|rs)\.?)?\s*"
+    r"(?P<number>\d[\d,]*(?:\.\d+)?)\s*"
+    r"(?P<unit>k|thousand|mn|m|million|lakhs?|lacs?|crores?|cr)?\b",
+    re.IGNORECASE
+)
+_BUDGET_UNITS = {
+    "k": 1e3, "thousand": 1e3, "m": 1e6, "mn": 1e6, "million": 1e6,
+    "lakh": 1e5, "lakhs": 1e5, "lac": 1e5, "lacs": 1e5, "crore": 1e7, "crores": 1e7, "cr": 1e7
+}
+_RANGE_SEPARATOR = re.compile(r"^\s*(?:-|–|to|and)\s*$", re.IGNORECASE)
+MIN_BUDGET = 1000  # smaller amounts are bedroom counts, years or typos, not prices
+
+def parse_price(text):
+    """Parse the first amount in a price or budget string ("$350000", "500k", "1.2 million")."""
+    if text is None:
+        return None
+
+    match = _NUMBER.search(str(text))
+    if not match:
+        return None
+
+    value = float(match.group(1).replace(",", ""))
+    unit = (match.group(2) or "").lower()
+    return value * _MULTIPLIERS.get(unit, 1)
+
+def parse_budget(text):
+    """The most a user can spend, from a free-text budget ("under 300k", "between 200k and 500k", "3-4 lakhs").
+
+    Numbers need a currency or a unit, except when the budget is just a number
+    ("500000"); the upper bound of a range is used. Returns None when there is
+    no such amount or it is below MIN_BUDGET, so no price filter is applied.
+    """
+    if text is None:
+        return None
+    text = str(text).strip()
+
+    matches = list(_BUDGET_AMOUNT.finditer(text))
+    amounts = []
+    for i, match in enumerate(matches):
+        unit = (match.group("unit") or "").lower()
+        has_context = bool(unit or match.group("currency"))
+        if not unit and i + 1 < len(matches) and matches[i + 1].group("unit"):
+            # "3-4 lakhs", "200 to 500k": the lower bound shares the upper bound's unit
+            if _RANGE_SEPARATOR.match(text[match.end():matches[i + 1].start()]):
+                unit, has_context = matches[i + 1].group("unit").lower(), True
+        if not has_context and match.group(0).strip() != text:
+            continue
+        amounts.append(float(match.group("number").replace(",", "")) * _BUDGET_UNITS.get(unit, 1))
+
+    if not amounts or max(amounts) < MIN_BUDGET:
+        return None
+    return max(amounts)
+
+def parse_fields(document):
+    """Extract the "Key: value" fields (and the record type) from a document."""
+    fields = {}
+    for i, line in enumerate(document.strip().splitlines()):
+        key, sep, value = line.strip().partition(":")
+        if not sep:
+            continue
+        if i == 0:
+            fields["Type"] = key.strip()
+            fields["Name"] = value.strip()
+        else:
+            fields.setdefault(key.strip(), value.strip())
+    return fields
+
+def normalize_filters(filters):
+    """Drop empty values and unknown keys, returning None when nothing is left."""
+    if not filters:
+        return None
+
+    cleaned = {key: value for key, value in filters.items() if key in FILTER_KEYS and value not in (None, "")}
+    return cleaned or None
+
+class FilterIndex:
+    """Per-field columns over the document store, answering filters with id bitmaps."""
+
+    def __init__(self, prices, is_listing, location_codes, location_vocab, status_codes, status_vocab):
+        import numpy as np
+
+        self.prices = prices
+        self.is_listing = is_listing
+        self.location_codes = location_codes
+        self.location_vocab = [str(v) for v in location_vocab]
+        self.status_codes = status_codes
+        self.status_vocab = [str(v) for v in status_vocab]
+
+        # Listing ids ordered by price (unpriced listings excluded) for range queries
+        priced = np.flatnonzero(is_listing & ~np.isnan(prices))
+        order = np.argsort(prices[priced], kind="stable")
+        self.price_order = priced[order]
+        self.sorted_prices = prices[self.price_order]
+
+    def __len__(self):
+        return len(self.prices)
+
+    @classmethod
+    def from_documents(cls, documents):
+        """Parse the fields of every document into columns."""
+        import numpy as np
+
+        prices, is_listing, locations, statuses = [], [], [], []
+        for document in documents:
+            fields = parse_fields(document)
+            prices.append(parse_price(fields.get("Price")))
+            is_listing.append(fields.get("Type", "").lower() == "property")
+            locations.append(fields.get("Location", "").lower())
+            statuses.append(fields.get("Status", "").lower())
+
+        location_vocab = sorted(set(locations))
+        status_vocab = sorted(set(statuses))
+        location_lookup = {value: code for code, value in enumerate(location_vocab)}
+        status_lookup = {value: code for code, value in enumerate(status_vocab)}
+
+        return cls(
+            prices=np.array([np.nan if p is None else p for p in prices], dtype="float64"),
+            is_listing=np.array(is_listing, dtype=bool),
+            location_codes=np.array([location_lookup[v] for v in locations], dtype="int32"),
+            location_vocab=location_vocab,
+            status_codes=np.array([status_lookup[v] for v in statuses], dtype="int32"),
+            status_vocab=status_vocab
+        )
+
+    @classmethod
+    def load(cls, path):
+        import numpy as np
+
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                prices=data["prices"],
+                is_listing=data["is_listing"],
+                location_codes=data["location_codes"],
+                location_vocab=data["location_vocab"].tolist(),
+                status_codes=data["status_codes"],
+                status_vocab=data["status_vocab"].tolist()
+            )
+
+    def save(self, path):
+        """Write the columns to an .npz file, replacing any existing file atomically."""
+        import numpy as np
+
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            prices=self.prices,
+            is_listing=self.is_listing,
+            location_codes=self.location_codes,
+            location_vocab=np.array(self.location_vocab, dtype=str),
+            status_codes=self.status_codes,
+            status_vocab=np.array(self.status_vocab, dtype=str)
+        )
+        os.replace(tmp_path, path)
+
+    def _codes_matching(self, vocab, value):
+        """Vocabulary codes whose value contains the (case-insensitive) filter value."""
+        value = str(value).strip().lower()
+        return [code for code, entry in enumerate(vocab) if value in entry]
+
+    def candidates(self, filters):
+        """Return a boolean bitmap of candidate ids, or None if no filter applies."""
+        import numpy as np
+
+        filters = normalize_filters(filters)
+        if not filters:
+            return None
+
+        listing_mask = self.is_listing.copy()
+
+        if "max_price" in filters or "min_price" in filters:
+            low = parse_price(filters.get("min_price"))
+            high = parse_price(filters.get("max_price"))
+            start = 0 if low is None else np.searchsorted(self.sorted_prices, low, side="left")
+            end = len(self.sorted_prices) if high is None else np.searchsorted(self.sorted_prices, high, side="right")
+            in_range = np.zeros(len(self.prices), dtype=bool)
+            in_range[self.price_order[start:end]] = True
+            listing_mask &= in_range
+
+        if "location" in filters:
+            codes = self._codes_matching(self.location_vocab, filters["location"])
+            listing_mask &= np.isin(self.location_codes, codes)
+
+        if "status" in filters:
+            codes = self._codes_matching(self.status_vocab, filters["status"])
+            listing_mask &= np.isin(self.status_codes, codes)
+
+        # Non-listing records are never filtered out
+        return listing_mask | ~self.is_listing
+
+def main(argv=None):
+    """Precompute filters.npz alongside a document store."""
+    from chatbot.doc_store import DocStore
+
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) not in (1, 2):
+        print("Usage: python -m chatbot.filters DOCS_BIN [FILTERS_NPZ]")
+        return 1
+
+    source = argv[0]
+    target = argv[1] if len(argv) == 2 else os.path.join(os.path.dirname(source), "filters.npz")
+
+    store = DocStore(source)
+    FilterIndex.from_documents(store).save(target)
+    logger.info(f"Wrote filter columns for {len(store)} documents to {target}")
+    store.close()
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""
+BM25 keyword index over the knowledge base documents.
+
+Postings are stored CSR-style in keywords.npz (a sorted term list, row
+pointers, doc ids and term frequencies), built next to the FAISS index. A
+lookup touches only the postings of the query terms, so exact IDs and place
+names ("PLOT003", "Dubai") are answered in microseconds without loading the
+embedding model.
+
+Precompute keywords.npz for an existing document store with:
+    python -m chatbot.keyword_index chatbot/embeddings/docs.bin
+"""
+import os
+import re
+import sys
+import math
+import logging
+from collections import Counter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Common words plus the field labels present in every document
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from have how i in is it me my of on or show
+tell that the there this to what when where which who with you your any some about
+id description location price status features contact property service company offer nan
+""".split())
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens without stopwords, with plurals folded ("plots" -> "plot")."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+def is_identifier(token):
+    """IDs such as "plot003" or "srv12" mix letters and digits."""
+    return any(c.isdigit() for c in token) and any(c.isalpha() for c in token)
+
+class KeywordIndex:
+    """BM25 scoring over CSR postings."""
+
+    def __init__(self, terms, indptr, doc_ids, term_freqs, doc_lengths):
+        import numpy as np
+
+        self.terms = [str(term) for term in terms]
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.num_docs = len(doc_lengths)
+        self.avg_length = float(doc_lengths.mean()) if self.num_docs else 0.0
+        self._rows = {term: row for row, term in enumerate(self.terms)}
+
+        doc_freqs = np.diff(indptr).astype("float32")
+        self.idf = np.log1p((self.num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        # Weight of a query term that appears in no document
+        self.unknown_idf = math.log1p((self.num_docs + 0.5) / 0.5)
+
+    def __len__(self):
+        return self.num_docs
+
+    @classmethod
+    def from_documents(cls, documents):
+        """Tokenize every document and build the postings."""
+        import numpy as np
+
+        postings = {}
+        doc_lengths = []
+        for doc_id, document in enumerate(documents):
+            tokens = tokenize(document)
+            doc_lengths.append(len(tokens))
+            for term, freq in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_id, freq))
+
+        terms = sorted(postings)
+        indptr = [0]
+        doc_ids, term_freqs = [], []
+        for term in terms:
+            for doc_id, freq in postings[term]:
+                doc_ids.append(doc_id)
+                term_freqs.append(freq)
+            indptr.append(len(doc_ids))
+
+        return cls(
+            terms=terms,
+            indptr=np.array(indptr, dtype="int64"),
+            doc_ids=np.array(doc_ids, dtype="int32"),
+            term_freqs=np.array(term_freqs, dtype="float32"),
+            doc_lengths=np.array(doc_lengths, dtype="float32")
+        )
+
+    @classmethod
+    def load(cls, path):
+        import numpy as np
+
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                terms=data["terms"].tolist(),
+                indptr=data["indptr"],
+                doc_ids=data["doc_ids"],
+                term_freqs=data["term_freqs"],
+                doc_lengths=data["doc_lengths"]
+            )
+
+    def save(self, path):
+        """Write the postings to an .npz file, replacing any existing file atomically."""
+        import numpy as np
+
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            terms=np.array(self.terms, dtype=str),
+            indptr=self.indptr,
+            doc_ids=self.doc_ids,
+            term_freqs=self.term_freqs,
+            doc_lengths=self.doc_lengths
+        )
+        os.replace(tmp_path, path)
+
+    def _postings(self, term):
+        row = self._rows.get(term)
+        if row is None:
+            return None, None, 0.0
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.doc_ids[start:end], self.term_freqs[start:end], self.idf[row]
+
+    def search(self, query, k=5, candidates=None):
+        """Return up to k (doc_id, score) pairs and a 0-1 confidence for the ranking.
+
+        Confidence is the share of the query's IDF weight matched by the top
+        document (1.0 if it matches an ID in the query), scaled down when more
+        than k documents match equally well, since their order is then
+        arbitrary.
+        """
+        import numpy as np
+
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.num_docs:
+            return [], 0.0
+
+        scores = np.zeros(self.num_docs, dtype="float32")
+        for term in terms:
+            ids, freqs, idf = self._postings(term)
+            if ids is None:
+                continue
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[ids] / self.avg_length)
+            scores[ids] += idf * freqs * (BM25_K1 + 1) / (freqs + norm)
+
+        if candidates is not None:
+            scores[~candidates] = 0
+
+        k = min(k, self.num_docs)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        results = [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+        if not results:
+            return [], 0.0
+
+        return results, self._confidence(terms, results[0][0], k)
+
+    def _confidence(self, terms, doc_id, k):
+        """Share of the query's IDF weight present in a document, penalized for ties."""
+        import numpy as np
+
+        total = matched = 0.0
+        tied = None  # Documents containing every term the top document matched
+        for term in terms:
+            ids, _, idf = self._postings(term)
+            if ids is None:
+                total += self.unknown_idf
+                continue
+            total += idf
+            position = np.searchsorted(ids, doc_id)
+            if position < len(ids) and ids[position] == doc_id:
+                if is_identifier(term):
+                    return 1.0
+                matched += idf
+                tied = ids if tied is None else np.intersect1d(tied, ids, assume_unique=True)
+
+        if not total or tied is None:
+            return 0.0
+        return (matched / total) * min(1.0, k / len(tied))
+
+def reciprocal_rank_fusion(rankings, k=5, constant=60):
+    """Merge several ranked id lists, scoring each id by sum(1 / (constant + rank))."""
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (constant + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)[:k]
+
+def main(argv=None):
+    """Precompute keywords.npz alongside a document store."""
+    from chatbot.doc_store import DocStore
+
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) not in (1, 2):
+        print("Usage: python -m chatbot.keyword_index DOCS_BIN [KEYWORDS_NPZ]")
+        return 1
+
+    source = argv[0]
+    target = argv[1] if len(argv) == 2 else os.path.join(os.path.dirname(source), "keywords.npz")
+
+    store = DocStore(source)
+    KeywordIndex.from_documents(store).save(target)
+    logger.info(f"Wrote keyword index for {len(store)} documents to {target}")
+    store.close()
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
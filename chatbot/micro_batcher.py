@@ -0,0 +1,114 @@
+"""
+Groups concurrent calls into batches for one worker thread.
+
+Callers block in submit(item) while a background thread collects the items
+that are waiting, plus any that arrive within window_ms, up to max_batch.
+It then passes them to process(items) in one call and hands each caller its
+own result. The window is skipped when the batch already holds every waiting
+caller and the previous batch was a single item, so serial traffic is not
+delayed.
+
+vector_search uses this so that queries from concurrent chat turns share one
+model.encode call and one FAISS search over a query matrix, instead of each
+thread encoding a batch of one. With max_batch <= 1, submit calls process
+directly in the calling thread.
+"""
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+class MicroBatcher:
+    """Runs process(list of items) -> list of results on batches of concurrently submitted items."""
+
+    def __init__(self, process, window_ms=5, max_batch=16, name="micro-batcher"):
+        self.process = process
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None  # Process the worker thread was started in
+        self._in_flight = 0  # Callers waiting in submit
+        self._last_batch = 0
+        self._stats = {"batches": 0, "items": 0, "largest_batch": 0}
+
+    def _start(self):
+        """Start the worker once per process (threads do not survive a fork)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Items queued before a fork belong to the parent's callers
+            self._queue = queue.Queue()
+
+        threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def submit(self, item):
+        """process([item])[0], batched with whatever other callers submit at the same time."""
+        if self.max_batch <= 1:
+            self._record(1)
+            return self.process([item])[0]
+
+        self._start()
+        future = Future()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            self._queue.put((item, future))
+            return future.result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                # Take everything already waiting, then wait out the rest of the window
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            with self._lock:
+                alone = self._in_flight <= len(batch) and self._last_batch <= 1
+            if alone:
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self._last_batch = len(batch)
+            self._record(len(batch))
+            try:
+                results = self.process([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _record(self, size):
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["items"] += size
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], size)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["average_batch"] = round(stats["items"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["window_ms"] = round(self.window * 1000, 3)
+        stats["max_batch"] = self.max_batch
+        return stats
@@ -0,0 +1,113 @@
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "512"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "3600"))  # seconds
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(2 * 1024 * 1024)))  # 2 MB
+
+_PUNCTUATION = re.compile(r"[^\w\s$]")
+
+def normalize_query(text):
+    """Normalize a message so trivially different phrasings share a cache entry."""
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+class QueryCache:
+    """LRU cache of query embeddings and top-k result ids, bounded by entries, bytes and age."""
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE, max_bytes=QUERY_CACHE_MAX_BYTES, ttl=QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(key, embedding, ids):
+        """Approximate the memory held by one entry."""
+        size = sys.getsizeof(key) + sys.getsizeof(ids) + 8 * len(ids)
+        size += getattr(embedding, "nbytes", 0) + 112  # ndarray header
+        return size
+
+    def get(self, key):
+        """Return (embedding, ids) for a key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            embedding, ids, created_at, size = entry
+            if self.ttl and time.time() - created_at > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding, ids
+
+    def peek(self, key):
+        """get() without counting a hit or miss or refreshing the entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or (self.ttl and time.time() - entry[2] > self.ttl):
+            return None
+        return entry[0], entry[1]
+
+    def put(self, key, embedding, ids):
+        """Store an embedding and its result ids, evicting the oldest entries if over budget."""
+        if self.max_entries <= 0 or self.max_bytes <= 0:
+            return
+
+        ids = tuple(int(i) for i in ids)
+        size = self._entry_size(key, embedding, ids)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (embedding, ids, time.time(), size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[3]
+
+    def clear(self):
+        """Drop every entry, keeping the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes
+            }
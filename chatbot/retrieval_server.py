@@ -0,0 +1,246 @@
+"""
+Local retrieval server: one process owns the embedding model and index.
+
+With RETRIEVAL_MODE=server, vector_search.retrieve_context, query_embedding
+and get_stats in the web workers forward to this server over a Unix socket
+(or localhost TCP). The workers then never import torch, sentence-transformers
+or FAISS. The server's query cache and micro-batching cover requests from
+every worker. RETRIEVAL_MODE=inprocess (the default) keeps everything in the
+worker as before.
+
+    python -m chatbot.retrieval_server                       # RETRIEVAL_SERVER_ADDRESS
+    python -m chatbot.retrieval_server --address 127.0.0.1:8765
+
+RETRIEVAL_SERVER_ADDRESS is "unix:/path/to.sock" or "host:port". gunicorn.conf.py
+starts the server itself when RETRIEVAL_MODE=server, unless
+RETRIEVAL_SERVER_SPAWN=False (e.g. when it runs as its own service).
+
+Each message is a 4-byte big-endian length followed by a JSON object:
+{"method": ..., "args": [...]} in, {"result": ...} or {"error": ...} out.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import struct
+import logging
+import argparse
+import threading
+import socketserver
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "inprocess").lower()
+RETRIEVAL_SERVER_ADDRESS = os.getenv("RETRIEVAL_SERVER_ADDRESS", "unix:/tmp/chatbot-retrieval.sock")
+RETRIEVAL_SERVER_TIMEOUT = float(os.getenv("RETRIEVAL_SERVER_TIMEOUT", "5"))  # seconds per call
+
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+_HEADER = struct.Struct(">I")
+
+class RetrievalServerError(Exception):
+    """The retrieval server could not be reached or failed the call."""
+
+def parse_address(address):
+    """(socket family, address) for "unix:/path" or "host:port"."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+def send_message(sock, message):
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def recv_message(sock):
+    """The next message, or None if the peer closed the connection between messages."""
+    header = sock.recv(_HEADER.size, socket.MSG_WAITALL)
+    if not header:
+        return None
+    if len(header) < _HEADER.size:
+        header += _recv_exactly(sock, _HEADER.size - len(header))
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_MESSAGE_BYTES:
+        raise ConnectionError(f"Message of {size} bytes is too large")
+    return json.loads(_recv_exactly(sock, size).decode("utf-8"))
+
+class RetrievalClient:
+    """Calls the retrieval server; each thread keeps its own connection."""
+
+    def __init__(self, address=RETRIEVAL_SERVER_ADDRESS, timeout=RETRIEVAL_SERVER_TIMEOUT):
+        self.family, self.address = parse_address(address)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        # Connections made before a gunicorn fork belong to the master
+        if getattr(self._local, "pid", None) == os.getpid() and self._local.sock is not None:
+            return self._local.sock, True
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address)
+        except OSError:
+            sock.close()
+            raise
+        self._local.sock, self._local.pid = sock, os.getpid()
+        return sock, False
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def call(self, method, *args):
+        """Run method(*args) on the server; raises RetrievalServerError if it cannot."""
+        for attempt in range(2):
+            reused = False
+            try:
+                sock, reused = self._connection()
+                send_message(sock, {"method": method, "args": list(args)})
+                response = recv_message(sock)
+                if response is None:
+                    raise ConnectionError("Connection closed")
+                break
+            except (OSError, ValueError) as e:
+                self._close()
+                # A kept-alive connection may have been closed by a server restart;
+                # lookups have no side effects, so try once more on a fresh one
+                if attempt == 0 and reused and not isinstance(e, socket.timeout):
+                    continue
+                raise RetrievalServerError(f"{method} failed: {str(e)}") from e
+        if "error" in response:
+            raise RetrievalServerError(f"{method} failed on the server: {response['error']}")
+        return response.get("result")
+
+# Shared by all threads in this process
+retrieval_client = RetrievalClient()
+
+def _handle(vector_search, method, args):
+    if method == "retrieve_context":
+        return vector_search.retrieve_context(*args)
+    if method == "query_embedding":
+        embedding = vector_search.query_embedding(*args)
+        return None if embedding is None else embedding.tolist()
+    if method == "get_stats":
+        return vector_search.get_stats()
+    if method == "ping":
+        return "pong"
+    raise ValueError(f"Unknown method {method}")
+
+class RetrievalRequestHandler(socketserver.BaseRequestHandler):
+    """Serves calls from one client connection until it closes."""
+
+    def handle(self):
+        from chatbot import vector_search
+
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Dropping retrieval client connection: {str(e)}")
+                return
+            if message is None:
+                return
+            try:
+                response = {"result": _handle(vector_search, message.get("method"), message.get("args", []))}
+            except Exception as e:
+                logger.error(f"Retrieval call {message.get('method')} failed: {str(e)}")
+                response = {"error": str(e)}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+class ThreadingUnixRetrievalServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class ThreadingTCPRetrievalServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def create_server(address=RETRIEVAL_SERVER_ADDRESS):
+    family, bind_address = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(bind_address):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(bind_address)
+            except OSError:
+                # Left behind by a server that did not shut down cleanly
+                os.unlink(bind_address)
+            else:
+                raise RuntimeError(f"A retrieval server is already listening on {address}")
+            finally:
+                probe.close()
+        return ThreadingUnixRetrievalServer(bind_address, RetrievalRequestHandler)
+    return ThreadingTCPRetrievalServer(bind_address, RetrievalRequestHandler)
+
+def serve(address=RETRIEVAL_SERVER_ADDRESS, preload=True):
+    """Run the retrieval server in this process until interrupted."""
+    from chatbot import vector_search
+    from utils.memory_governor import memory_governor
+
+    # This process is the one that searches, whatever RETRIEVAL_MODE the web workers use
+    vector_search.RETRIEVAL_MODE = "inprocess"
+    memory_governor.start()
+
+    server = create_server(address)
+    # gunicorn stops the server with SIGTERM; exit through the cleanup below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info(f"Retrieval server listening on {address} (pid {os.getpid()})")
+    if preload:
+        # Listen first so clients connecting during the load wait on it instead of failing
+        threading.Thread(target=vector_search.preload, name="retrieval-preload", daemon=True).start()
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        if server.address_family == socket.AF_UNIX:
+            try:
+                os.unlink(server.server_address)
+            except OSError:
+                pass
+
+def wait_until_up(client=None, timeout=30):
+    """Block until the server answers a ping; returns False if it did not within timeout."""
+    client = client or retrieval_client
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            client.call("ping")
+            return True
+        except RetrievalServerError:
+            time.sleep(0.2)
+    return False
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve vector search to the web workers over a local socket.")
+    parser.add_argument("--address", default=RETRIEVAL_SERVER_ADDRESS, help='"unix:/path/to.sock" or "host:port"')
+    parser.add_argument("--no-preload", action="store_true", help="Load the model on the first query instead")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    serve(args.address, preload=not args.no_preload)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Runs the independent stages of a chat turn concurrently.
+
+Stages go to a thread pool shared by every turn in the process. A turn
+waits for a stage only up to that stage's deadline. After that it uses the
+stage's fallback (a degraded result) and lets the stage finish in the
+background. Each turn records how long every stage took, and the chat
+result carries that as "timings" and "degraded".
+
+Deadlines are in seconds and come from the environment, e.g.
+RETRIEVAL_DEADLINE=1.5.
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from utils.metrics import CHAT_STAGE_SECONDS, CHAT_STAGE_DEGRADED
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TURN_POOL_WORKERS = int(os.getenv("TURN_POOL_WORKERS", "8"))
+
+STAGE_DEADLINES = {
+    "retrieval": float(os.getenv("RETRIEVAL_DEADLINE", "2.0")),
+    "scheduling": float(os.getenv("SCHEDULING_DEADLINE", "3.0")),
+    "crm": float(os.getenv("CRM_DEADLINE", "1.0"))
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """The shared stage pool, created on first use (so after a gunicorn fork)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=TURN_POOL_WORKERS, thread_name_prefix="turn-stage")
+        return _executor
+
+class Stage:
+    """A stage submitted to the pool: its future, deadline and fallback."""
+
+    def __init__(self, name, future, deadline, fallback, started):
+        self.name = name
+        self.future = future
+        self.deadline = deadline
+        self.fallback = fallback
+        self.started = started
+
+class TurnScheduler:
+    """Starts, awaits and times the stages of one chat turn."""
+
+    def __init__(self, executor=None):
+        self.executor = executor or get_executor()
+        self.timings = {}
+        self.degraded = []
+        self._lock = threading.Lock()
+
+    def _record(self, name, started):
+        elapsed = time.perf_counter() - started
+        CHAT_STAGE_SECONDS.observe(elapsed, stage=name)
+        with self._lock:
+            self.timings[name] = round(1000 * elapsed, 1)
+
+    def start(self, name, function, *args, deadline=None, fallback=None, **kwargs):
+        """Submit a stage; the deadline (seconds, default STAGE_DEADLINES[name]) counts from now."""
+        started = time.perf_counter()
+
+        def run():
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._record(name, started)
+
+        if deadline is None:
+            deadline = STAGE_DEADLINES.get(name)
+        return Stage(name, self.executor.submit(run), deadline, fallback, started)
+
+    def wait(self, stage):
+        """The stage's result, or its fallback if it failed or missed its deadline."""
+        timeout = None
+        if stage.deadline is not None:
+            timeout = max(0.0, stage.deadline - (time.perf_counter() - stage.started))
+        try:
+            return stage.future.result(timeout=timeout)
+        except FutureTimeoutError:
+            logger.warning(f"Stage {stage.name} missed its {stage.deadline}s deadline, continuing without it")
+        except Exception as e:
+            logger.error(f"Stage {stage.name} failed: {str(e)}")
+        self.mark_degraded(stage.name)
+        return stage.fallback
+
+    def mark_degraded(self, name):
+        """Record that the turn went without a stage (or part of one)."""
+        CHAT_STAGE_DEGRADED.inc(stage=name)
+        with self._lock:
+            self.degraded.append(name)
+
+    def run(self, name, function, *args, deadline=None, fallback=None, **kwargs):
+        """start() and wait() in one call."""
+        return self.wait(self.start(name, function, *args, deadline=deadline, fallback=fallback, **kwargs))
+
+    @contextmanager
+    def timed(self, name):
+        """Time a stage that runs in the calling thread (e.g. the LLM call)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, started)
+
+    def metadata(self):
+        """Per-stage timings in milliseconds and the stages that fell back."""
+        with self._lock:
+            return {"timings": dict(self.timings), "degraded": list(self.degraded)}
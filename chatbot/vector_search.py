@@ -2,105 +2,588 @@ import os
 import logging
 import gc  # Garbage collection
 import time
+import threading
+from chatbot.query_cache import QueryCache, normalize_query
+from chatbot.doc_store import DocStore
+from chatbot.filters import FilterIndex, normalize_filters
+from chatbot.keyword_index import KeywordIndex, reciprocal_rank_fusion
+from chatbot.embedders import load_embedder
+from chatbot.micro_batcher import MicroBatcher
+from chatbot.retrieval_server import RETRIEVAL_MODE, RetrievalServerError, retrieval_client
+from utils.metrics import VECTOR_SEARCH_SECONDS, VECTOR_SEARCH_BATCH_SIZE
+from utils.memory_governor import memory_governor, register_response
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 EMBEDDING_PATH = os.path.join(os.path.dirname(__file__), 'embeddings/index.faiss')
+DOCS_PATH = os.path.join(os.path.dirname(__file__), 'embeddings/docs.bin')
+# Legacy pickled metadata list, only read when docs.bin has not been built
 METADATA_PATH = os.path.join(os.path.dirname(__file__), 'embeddings/metadata.pkl')
+FILTERS_PATH = os.path.join(os.path.dirname(__file__), 'embeddings/filters.npz')
+KEYWORDS_PATH = os.path.join(os.path.dirname(__file__), 'embeddings/keywords.npz')
+
+# "lazy" loads on the first request in each worker, "preload" loads once in the
+# gunicorn master so forked workers share the pages copy-on-write
+VECTOR_SEARCH_MODE = os.getenv("VECTOR_SEARCH_MODE", "lazy").lower()
+
+# Optional query-time overrides for IVF/HNSW indexes built by chatbot.build_index
+# (the values chosen at build time are stored in the index file)
+VECTOR_NPROBE = os.getenv("VECTOR_NPROBE")
+VECTOR_EF_SEARCH = os.getenv("VECTOR_EF_SEARCH")
+
+# Filtered searches with at most this many candidates fall back to an exact
+# scan when the approximate index returns too few of them
+FILTER_EXACT_LIMIT = int(os.getenv("VECTOR_FILTER_EXACT_LIMIT", "4096"))
+
+# Combine BM25 keyword results with vector results, and answer confident
+# keyword matches (exact IDs, place names) without loading the model at all
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "True").lower() == "true"
+KEYWORD_CONFIDENCE = float(os.getenv("KEYWORD_CONFIDENCE", "0.8"))
+
+# Queries from concurrent requests arriving within EMBED_BATCH_WINDOW_MS of
+# each other share one encode and one index search (EMBED_MAX_BATCH=1 turns
+# batching off)
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "16"))
+
+# Unload the model after this many idle seconds (0 disables unloading); independent of
+# the memory governor's GC_INTERVAL
+IDLE_TIMEOUT = int(os.getenv("VECTOR_IDLE_TIMEOUT", "300"))
 
 # Initialize variables
 model = None
 metadata = None
+filter_index = None
+keyword_index = None
 index = None
 vector_search_enabled = True
 _is_initialized = False
 _last_used = 0  # Timestamp when the model was last used
+_index_version = None  # (mtime, size) of the loaded index file
+
+# Guards loading and unloading so a request never sees a half-unloaded model
+_lock = threading.RLock()
+_reaper_pid = None  # Process the reaper thread was started in
+_loading = False  # A background load is running
+_loading_lock = threading.Lock()  # Not _lock, which the load itself holds
+
+# Load/unload bookkeeping for tuning IDLE_TIMEOUT
+_stats = {
+    "loads": 0,
+    "unloads": 0,
+    "load_seconds_total": 0.0,
+    "last_load_seconds": 0.0,
+    "keyword_fast_path": 0
+}
+
+# Query embeddings and top-k ids for repeated questions
+query_cache = QueryCache()
 
 def _lazy_load():
     """Lazy load the model and embeddings only when needed"""
-    global model, metadata, index, vector_search_enabled, _is_initialized, _last_used
+    global model, index, vector_search_enabled, _is_initialized, _last_used
+
+    with _lock:
+        # If already initialized and used recently, just update the timestamp
+        if _is_initialized and model is not None:
+            _last_used = time.time()
+            return
+
+        # If we're reinitializing after unloading, force garbage collection first
+        if _is_initialized and model is None:
+            gc.collect()
+
+        started = time.time()
+        try:
+            # Import heavy modules only when needed
+            import faiss
+
+            # Load the configured embedding backend (sentence-transformers or ONNX)
+            model = load_embedder()
+
+            # Check if embedding files exist
+            if os.path.exists(EMBEDDING_PATH) and _documents_exist():
+                # Load FAISS index
+                index = faiss.read_index(EMBEDDING_PATH)
+                _apply_search_params(index)
+
+                # Cached result ids and documents are only valid for the index they came from
+                if _refresh_index_version() or metadata is None:
+                    _load_document_indexes()
+
+                logger.info("Vector search initialized successfully")
+            else:
+                logger.warning(f"Embedding files not found at {EMBEDDING_PATH} or {DOCS_PATH}")
+                vector_search_enabled = False
+        except Exception as e:
+            logger.error(f"Error initializing vector search: {str(e)}")
+            vector_search_enabled = False
+
+        elapsed = time.time() - started
+        if model is not None:
+            VECTOR_SEARCH_SECONDS.observe(elapsed, step="load")
+            _stats["loads"] += 1
+            _stats["load_seconds_total"] += elapsed
+            _stats["last_load_seconds"] = elapsed
+            logger.info(f"Vector search loaded in {elapsed:.2f}s (load #{_stats['loads']})")
+
+        _is_initialized = True
+        _last_used = time.time()
+
+    # Preloaded weights are shared with the master, so unloading them in a
+    # worker would not give any memory back
+    if VECTOR_SEARCH_MODE != "preload":
+        _start_reaper()
+
+def _load_in_background():
+    """Load the model and index in a background thread, unless a load is already running.
+
+    Requests keep to keyword results meanwhile, so a cold start (first use or
+    after the reaper unloaded the model) never counts against the retrieval
+    deadline.
+    """
+    global _loading
+
+    with _loading_lock:
+        if _loading or model is not None:
+            return
+        _loading = True
+
+    def run():
+        global _loading
+        try:
+            _lazy_load()
+        except Exception as e:
+            logger.error(f"Error loading vector search in the background: {str(e)}")
+        finally:
+            with _loading_lock:
+                _loading = False
+
+    threading.Thread(target=run, name="vector-search-load", daemon=True).start()
+
+def preload():
+    """Load the model and index up front, e.g. in the gunicorn master before forking"""
+    if os.environ.get("ENABLE_VECTOR_SEARCH", "True").lower() != "true":
+        logger.info("Vector search is disabled, skipping preload")
+        return
+    if RETRIEVAL_MODE == "server":
+        logger.info("Vector search runs in the retrieval server, skipping preload")
+        return
+
+    started = time.time()
+    _lazy_load()
+    logger.info(f"Vector search preloaded in {time.time() - started:.2f}s (pid {os.getpid()})")
+
+    # Move everything loaded so far into the permanent generation so the
+    # collector in forked workers never writes to (and un-shares) those pages
+    gc.collect()
+    gc.freeze()
+
+def after_fork():
+    """Warm up a preloaded model inside a freshly forked worker"""
+    global _last_used
+
+    if model is None:
+        return
 
-    # If already initialized and used recently, just update the timestamp
-    if _is_initialized and model is not None:
+    # The first encode allocates inference buffers and thread pools; do it at
+    # worker boot instead of on the first user request. This is deliberately
+    # not done in the master, since those thread pools are not fork-safe.
+    try:
+        model.encode(["warm up"])
         _last_used = time.time()
+    except Exception as e:
+        logger.warning(f"Model warm-up failed: {str(e)}")
+
+def _documents_exist():
+    return os.path.exists(DOCS_PATH) or os.path.exists(METADATA_PATH)
+
+def _load_document_indexes():
+    """Load the documents with their filter columns and keyword index (no model needed)"""
+    global metadata, filter_index, keyword_index
+
+    with _lock:
+        # Map the document store (or fall back to the legacy pickle)
+        metadata = _load_documents()
+        filter_index = _load_filters(metadata)
+        keyword_index = _load_keywords(metadata)
+
+def _ensure_documents():
+    """Load the documents on first use without touching the embedding model"""
+    if metadata is not None or not _documents_exist():
         return
 
-    # If we're reinitializing after unloading, force garbage collection first
-    if _is_initialized and model is None:
-        gc.collect()
+    with _lock:
+        if metadata is None:
+            try:
+                _load_document_indexes()
+            except Exception as e:
+                logger.error(f"Error loading documents: {str(e)}")
+
+def _load_documents():
+    """Open the memory-mapped document store, or unpickle a legacy metadata list"""
+    if os.path.exists(DOCS_PATH):
+        return DocStore(DOCS_PATH)
+
+    import pickle
+
+    logger.warning(f"{DOCS_PATH} not found, loading legacy {METADATA_PATH} "
+                   "(convert it with: python -m chatbot.doc_store)")
+    with open(METADATA_PATH, "rb") as f:
+        return pickle.load(f)
+
+def _load_filters(documents):
+    """Load the precomputed filter columns, or derive them from the documents"""
+    try:
+        if os.path.exists(FILTERS_PATH):
+            loaded = FilterIndex.load(FILTERS_PATH)
+            if len(loaded) == len(documents):
+                return loaded
+            logger.warning(f"{FILTERS_PATH} does not match the document store, rebuilding it in memory")
+        return FilterIndex.from_documents(documents)
+    except Exception as e:
+        logger.error(f"Error loading metadata filters: {str(e)}")
+        return None
+
+def _load_keywords(documents):
+    """Load the precomputed BM25 postings, or build them from the documents"""
+    if not HYBRID_SEARCH:
+        return None
 
     try:
-        # Import heavy modules only when needed
+        if os.path.exists(KEYWORDS_PATH):
+            loaded = KeywordIndex.load(KEYWORDS_PATH)
+            if len(loaded) == len(documents):
+                return loaded
+            logger.warning(f"{KEYWORDS_PATH} does not match the document store, rebuilding it in memory")
+        return KeywordIndex.from_documents(documents)
+    except Exception as e:
+        logger.error(f"Error loading keyword index: {str(e)}")
+        return None
+
+def _apply_search_params(loaded_index):
+    """Apply query-time nprobe/efSearch overrides to approximate indexes, and let IVF ones reconstruct vectors"""
+    if VECTOR_NPROBE and hasattr(loaded_index, "nprobe"):
+        loaded_index.nprobe = int(VECTOR_NPROBE)
+    if VECTOR_EF_SEARCH and hasattr(loaded_index, "hnsw"):
+        loaded_index.hnsw.efSearch = int(VECTOR_EF_SEARCH)
+    # _exact_search reconstructs vectors, which IVF indexes only allow with a direct map
+    # (indexes from older builds were written without one)
+    if hasattr(loaded_index, "make_direct_map"):
         import faiss
-        import pickle
-        import numpy as np
-        from sentence_transformers import SentenceTransformer
 
-        # Load the model with minimal memory footprint
-        logger.info("Loading sentence transformer model...")
-        model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+        if loaded_index.direct_map.type == faiss.DirectMap.NoMap:
+            loaded_index.make_direct_map()
 
-        # Check if embedding files exist
-        if os.path.exists(METADATA_PATH) and os.path.exists(EMBEDDING_PATH):
-            # Load metadata
-            with open(METADATA_PATH, "rb") as f:
-                metadata = pickle.load(f)
+def _refresh_index_version():
+    """Clear the query cache if the index file changed since it was last loaded
 
-            # Load FAISS index
-            index = faiss.read_index(EMBEDDING_PATH)
+    Returns True when it changed, so the documents get reloaded with it.
+    """
+    global _index_version
 
-            logger.info("Vector search initialized successfully")
-        else:
-            logger.warning(f"Embedding files not found at {EMBEDDING_PATH} or {METADATA_PATH}")
-            vector_search_enabled = False
-    except Exception as e:
-        logger.error(f"Error initializing vector search: {str(e)}")
-        vector_search_enabled = False
+    stat = os.stat(EMBEDDING_PATH)
+    version = (stat.st_mtime, stat.st_size)
+    changed = _index_version is not None and version != _index_version
+    if changed:
+        logger.info("Index file changed, clearing query cache")
+        query_cache.clear()
+    _index_version = version
+    return changed
+
+def _unload_model(idle_timeout=None):
+    """Unload the model to free up memory once it has been idle long enough"""
+    global model, index
 
-    _is_initialized = True
-    _last_used = time.time()
+    if idle_timeout is None:
+        idle_timeout = IDLE_TIMEOUT
 
-def _unload_model():
-    """Unload the model to free up memory"""
-    global model, index, _last_used
+    with _lock:
+        if model is None or time.time() - _last_used < idle_timeout:
+            return False
 
-    # Only unload if it's been more than 5 minutes since last use
-    if model is not None and time.time() - _last_used > 300:  # 5 minutes
         logger.info("Unloading vector search model to free memory...")
         model = None
         index = None
-        gc.collect()  # Force garbage collection
+        _stats["unloads"] += 1
+
+    # Requests already holding references finish normally; the memory is
+    # released once they drop them
+    gc.collect()  # Force garbage collection
+    return True
+
+def _unload_under_pressure():
+    """Memory governor response: unload the model now, however recently it was used"""
+    # Preloaded weights are shared with the master, so unloading them frees nothing
+    if VECTOR_SEARCH_MODE != "preload":
+        _unload_model(idle_timeout=0)
+
+register_response("shrink", query_cache.clear)
+register_response("unload", _unload_under_pressure)
+
+def _reaper_loop():
+    """Periodically unload the model once it has been idle for IDLE_TIMEOUT seconds"""
+    interval = min(60, max(5, IDLE_TIMEOUT // 4))
+    while True:
+        time.sleep(interval)
+        try:
+            _unload_model()
+        except Exception as e:
+            logger.error(f"Error unloading vector search model: {str(e)}")
+
+def _start_reaper():
+    """Start the idle reaper once per process (threads do not survive a fork)"""
+    global _reaper_pid
+
+    if IDLE_TIMEOUT <= 0 or _reaper_pid == os.getpid():
+        return
+
+    with _lock:
+        if _reaper_pid == os.getpid():
+            return
+        _reaper_pid = os.getpid()
+
+    thread = threading.Thread(target=_reaper_loop, name="vector-search-reaper", daemon=True)
+    thread.start()
+    logger.info(f"Vector search idle reaper started (timeout {IDLE_TIMEOUT}s)")
+
+def get_stats():
+    """Return load state, load/unload counts and reload time for monitoring"""
+    if RETRIEVAL_MODE == "server":
+        try:
+            return dict(retrieval_client.call("get_stats"), retrieval_mode="server")
+        except RetrievalServerError as e:
+            logger.warning(f"Could not get retrieval server stats: {str(e)}")
+
+    with _lock:
+        stats = dict(_stats)
+        stats["loaded"] = model is not None
+        stats["mode"] = VECTOR_SEARCH_MODE
+        stats["idle_timeout"] = IDLE_TIMEOUT
+        stats["idle_seconds"] = round(time.time() - _last_used, 1) if _last_used else None
+    stats["query_cache"] = query_cache.stats()
+    stats["batching"] = _batcher.stats()
+    stats["retrieval_mode"] = RETRIEVAL_MODE
+    return stats
+
+def _search_params(search_index, selector):
+    """Build the FAISS search parameters that restrict a search to a selector"""
+    import faiss
+
+    if hasattr(search_index, "nprobe"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=search_index.nprobe)
+    if hasattr(search_index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=search_index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def _exact_search(search_index, query, k, candidate_ids):
+    """Exact L2 search over a small candidate set, using the vectors stored in the index"""
+    import numpy as np
+
+    vectors = search_index.reconstruct_batch(candidate_ids)
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    top = np.argsort(distances)[:k]
+    return candidate_ids[top]
+
+def _filtered_search(search_index, query, k, candidates):
+    """Search only the candidate ids marked in a boolean bitmap"""
+    import faiss
+    import numpy as np
+
+    candidate_ids = np.flatnonzero(candidates).astype("int64")
+    if len(candidate_ids) == 0:
+        return []
+
+    bits = np.packbits(candidates, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(candidates), faiss.swig_ptr(bits))
+    distances, indices = search_index.search(query, k, params=_search_params(search_index, selector))
+    ids = [int(i) for i in indices[0] if i >= 0]
+
+    # Graph and IVF indexes can miss most of a very selective candidate set
+    expected = min(k, len(candidate_ids))
+    if len(ids) < expected and len(candidate_ids) <= FILTER_EXACT_LIMIT:
+        try:
+            ids = [int(i) for i in _exact_search(search_index, query, k, candidate_ids)]
+        except Exception as e:
+            logger.warning(f"Exact filtered search unavailable: {str(e)}")
+    return ids
+
+def _encode_and_search(batch):
+    """Embed a batch of (model, index, text, k, candidates) queries and search for each.
+
+    Queries for the same model and index share one encode call, and unfiltered
+    ones with the same k share one search over the query matrix. Filtered
+    queries each need their own selector, so they are searched one by one.
+    Returns (embedding, vector ids) per query.
+    """
+    import numpy as np
+
+    VECTOR_SEARCH_BATCH_SIZE.observe(len(batch))
+    results = [None] * len(batch)
+    groups = {}
+    for position, (current_model, current_index, _, _, _) in enumerate(batch):
+        groups.setdefault((id(current_model), id(current_index)), []).append(position)
+
+    for positions in groups.values():
+        current_model, current_index = batch[positions[0]][:2]
+        with VECTOR_SEARCH_SECONDS.time(step="encode"):
+            embeddings = current_model.encode([batch[p][2] for p in positions], batch_size=len(positions))
+        embeddings = np.asarray(embeddings, dtype="float32")
+
+        with VECTOR_SEARCH_SECONDS.time(step="search"):
+            by_k = {}
+            for row, position in enumerate(positions):
+                _, _, _, k, candidates = batch[position]
+                if candidates is not None:
+                    results[position] = (embeddings[row].copy(), _filtered_search(current_index, embeddings[row:row + 1], k, candidates))
+                else:
+                    by_k.setdefault(k, []).append(row)
+            for k, rows in by_k.items():
+                distances, indices = current_index.search(embeddings[rows], k)
+                for row, found in zip(rows, indices):
+                    # Drop the -1 padding FAISS returns when k exceeds the index size
+                    results[positions[row]] = (embeddings[row].copy(), [int(i) for i in found if i >= 0])
+    return results
+
+# Shared by all requests in this process
+_batcher = MicroBatcher(
+    _encode_and_search, window_ms=EMBED_BATCH_WINDOW_MS, max_batch=EMBED_MAX_BATCH, name="vector-search-batcher"
+)
+
+def _cache_key(user_input, k, filters):
+    filter_key = tuple(sorted((key, str(value).lower()) for key, value in filters.items())) if filters else None
+    return normalize_query(user_input), k, filter_key
+
+def index_version():
+    """(mtime, size) of the index file on disk; changes whenever the index is rebuilt"""
+    try:
+        stat = os.stat(EMBEDDING_PATH)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+def query_embedding(user_input, k=5, filters=None):
+    """The query embedding retrieve_context cached for these arguments, else one from the
+    loaded model; None if the model is not loaded (this never loads it)"""
+    if RETRIEVAL_MODE == "server":
+        try:
+            embedding = retrieval_client.call("query_embedding", user_input, k, filters)
+        except RetrievalServerError as e:
+            logger.warning(f"Query embedding unavailable: {str(e)}")
+            return None
+        if embedding is None:
+            return None
+        import numpy as np
+
+        return np.asarray(embedding, dtype="float32")
+
+    cached = query_cache.peek(_cache_key(user_input, k, normalize_filters(filters)))
+    if cached is not None and cached[0] is not None:
+        return cached[0]
+
+    current_model = model
+    if current_model is None:
+        return None
+    try:
+        import numpy as np
+
+        return np.asarray(current_model.encode([user_input])[0], dtype="float32")
+    except Exception as e:
+        logger.error(f"Error embedding query: {str(e)}")
+        return None
+
+def retrieve_context(user_input, k=5, filters=None):
+    """Retrieve context based on user input using vector search.
+
+    filters narrows listings before the search, e.g.
+    {"max_price": 300000, "location": "Miami", "status": "Available"}.
+    """
+    global _last_used
 
-def retrieve_context(user_input, k=5):
-    """Retrieve context based on user input using vector search."""
     # Check if ENABLE_VECTOR_SEARCH is set to False in environment variables
     if os.environ.get("ENABLE_VECTOR_SEARCH", "True").lower() != "true":
         logger.info("Vector search is disabled by environment variable")
         return ["Vector search is disabled."]
 
-    # Lazy load the model and embeddings
+    # The model and index live in the retrieval server process
+    if RETRIEVAL_MODE == "server":
+        try:
+            return retrieval_client.call("retrieve_context", user_input, k, filters)
+        except RetrievalServerError as e:
+            logger.error(f"Error in vector search: {str(e)}")
+            return ["Vector search is currently unavailable."]
+
+    filters = normalize_filters(filters)
+    cache_key = _cache_key(user_input, k, filters)
+
+    # Repeated questions skip both the model and the FAISS search
+    cached = query_cache.get(cache_key)
+    if cached is not None and metadata is not None:
+        return [metadata[i] for i in cached[1]]
+
     try:
-        _lazy_load()
+        # Documents, filters and the keyword index load without the model
+        _ensure_documents()
+        current_metadata, current_filters, current_keywords = metadata, filter_index, keyword_index
+        if current_metadata is None:
+            return ["Vector search is currently unavailable."]
+
+        # Restrict the search to listings matching the filters
+        candidates = current_filters.candidates(filters) if filters and current_filters is not None else None
+
+        # Keyword path: a confident match (exact ID, place name) skips the model entirely
+        keyword_ids = []
+        if current_keywords is not None:
+            hits, confidence = current_keywords.search(user_input, k, candidates)
+            keyword_ids = [doc_id for doc_id, _ in hits]
+            if keyword_ids and confidence >= KEYWORD_CONFIDENCE:
+                _stats["keyword_fast_path"] += 1
+                query_cache.put(cache_key, None, keyword_ids)
+                return [current_metadata[i] for i in keyword_ids]
+
+        # Loading the model now could push the worker over its memory limit
+        if model is None and memory_governor.at_least("unload"):
+            logger.warning("Memory pressure, searching without the embedding model")
+            if keyword_ids:
+                return [current_metadata[i] for i in keyword_ids]
+            return ["Vector search is currently unavailable."]
+
+        # A cold model loads in the background; this request makes do with keyword results
+        if model is None or _loading:
+            if vector_search_enabled:
+                _load_in_background()
+            if keyword_ids:
+                return [current_metadata[i] for i in keyword_ids]
+            return ["Vector search is currently unavailable."]
+
+        # Take local references while holding the lock, so a concurrent unload
+        # cannot pull the model or index out from under this request
+        with _lock:
+            _lazy_load()
+            current_model, current_index = model, index
+            if metadata is not current_metadata:
+                # The index was rebuilt on disk and the documents reloaded with it
+                current_metadata, current_filters, keyword_ids = metadata, filter_index, []
+                candidates = current_filters.candidates(filters) if filters and current_filters is not None else None
 
         # Check if vector search is enabled and properly initialized
-        if not vector_search_enabled or model is None or index is None or metadata is None:
+        if not vector_search_enabled or current_model is None or current_index is None:
+            if keyword_ids:
+                return [current_metadata[i] for i in keyword_ids]
             logger.warning("Vector search is disabled or not properly initialized")
             return ["Vector search is currently unavailable."]
 
-        # Import necessary modules here to avoid loading them at module level
-        import numpy as np
-
-        # Encode the user input
-        embedding = model.encode([user_input])
+        # Encode and search, batched with queries from concurrent requests
+        embedding, vector_ids = _batcher.submit((current_model, current_index, user_input, k, candidates))
 
-        # Search for similar vectors
-        distances, indices = index.search(np.array(embedding).astype("float32"), k)
+        # Merge the keyword and vector rankings
+        ids = reciprocal_rank_fusion([vector_ids, keyword_ids], k) if keyword_ids else vector_ids
 
-        # Get results
-        results = [metadata[i] for i in indices[0]]
+        results = [current_metadata[i] for i in ids]
+        query_cache.put(cache_key, embedding, ids)
 
-        # Schedule unloading of model after use
+        # Mark the model as used so the reaper keeps it loaded
         _last_used = time.time()
 
         return results
@@ -1,9 +1,13 @@
 import requests
 import os
 import json
+import time
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from dotenv import load_dotenv
+from utils.http_client import transport, HUBSPOT_API_BASE
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -17,19 +21,83 @@ HUBSPOT_API_KEY = os.getenv('HUBSPOT_API_KEY')
 if not HUBSPOT_API_KEY:
     logger.warning("HubSpot API key not found in environment variables. HubSpot integration will be disabled.")
 
-def create_or_update_contact(email, name, budget, lead_type, lead_score, qualification, chat_history, user_type):
-    """Create or update a contact in HubSpot CRM with enhanced error handling and response formatting."""
-    # Check if HubSpot API key is available
-    if not HUBSPOT_API_KEY:
-        logger.warning("Skipping HubSpot CRM update: API key not configured")
-        return 503, {"error": "HubSpot API key not configured", "message": "CRM integration disabled"}
+HUBSPOT_ID_CACHE_TTL = float(os.getenv("HUBSPOT_ID_CACHE_TTL", "3600"))  # seconds
+HUBSPOT_ID_CACHE_SIZE = int(os.getenv("HUBSPOT_ID_CACHE_SIZE", "10000"))
+HUBSPOT_BATCH_SIZE = 100  # HubSpot's limit for batch endpoints
 
-    url = "https://api.hubapi.com/crm/v3/objects/contacts"
-    headers = {
+CONTACTS_URL = f"{HUBSPOT_API_BASE}/crm/v3/objects/contacts"
+
+class ContactIdCache:
+    """email -> contact id, with a TTL and LRU eviction.
+
+    Saves the /contacts/search HubSpot would otherwise need to find a contact
+    before writing it. Entries are dropped when HubSpot answers 404 for the id.
+    Only the id is cached: lead_score is read from HubSpot before every write,
+    since other workers (or HubSpot users) may have raised it since.
+    """
+
+    def __init__(self, max_entries=HUBSPOT_ID_CACHE_SIZE, ttl=HUBSPOT_ID_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, email):
+        key = email.lower()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, email, contact_id):
+        key = email.lower()
+        with self._lock:
+            self._entries[key] = (str(contact_id), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, email):
+        with self._lock:
+            self._entries.pop(email.lower(), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+contact_cache = ContactIdCache()
+
+def _score(value):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def _headers():
+    return {
         "Authorization": f"Bearer {HUBSPOT_API_KEY}",
         "Content-Type": "application/json"
     }
 
+def build_contact_properties(email, name, budget, lead_type, lead_score, qualification, chat_history, user_type,
+                             lead_status=None):
+    """HubSpot contact properties for a chat turn.
+
+    lead_status is the hs_lead_status already worked out by the caller
+    (ConversationState.lead_status); without it the transcript is scanned.
+    """
     # Ensure all values are strings and truncate long values
     properties = {
         "email": email,
@@ -45,74 +113,198 @@ def create_or_update_contact(email, name, budget, lead_type, lead_score, qualifi
     }
 
     # Add additional useful properties
-    if "looking" in chat_history.lower() or "searching" in chat_history.lower():
+    chat_history = chat_history or ""
+    if lead_status:
+        properties["hs_lead_status"] = lead_status
+    elif "looking" in chat_history.lower() or "searching" in chat_history.lower():
         properties["hs_lead_status"] = "New"
     elif "price" in chat_history.lower() or "cost" in chat_history.lower():
         properties["hs_lead_status"] = "In Progress"
     elif "buy" in chat_history.lower() or "purchase" in chat_history.lower():
         properties["hs_lead_status"] = "Open Deal"
 
-    # Search for existing contact
-    search_url = "https://api.hubapi.com/crm/v3/objects/contacts/search"
-    search_payload = {
-        "filterGroups": [{"filters": [{"propertyName": "email", "operator": "EQ", "value": email}]}]
-    }
+    return properties
 
-    logger.info(f"Searching for contact with email: {email}")
+def _chunks(items, size=HUBSPOT_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
-    try:
-        # Search for existing contact
-        search_response = requests.post(search_url, headers=headers, json=search_payload)
-        search_response.raise_for_status()
-        results = search_response.json().get("results", [])
-
-        # Format response data
-        response_data = {}
-
-        if results:
-            # Update existing contact
-            contact_id = results[0]["id"]
-            existing_properties = results[0].get("properties", {})
-            logger.info(f"Found existing contact with ID: {contact_id}")
-
-            # Merge with existing properties to preserve history
-            if "lead_score" in existing_properties and existing_properties.get("lead_score"):
-                old_score = int(existing_properties.get("lead_score", "0"))
-                new_score = int(properties.get("lead_score", "0"))
-                # Use the higher score
-                properties["lead_score"] = str(max(old_score, new_score))
-
-            update_url = f"{url}/{contact_id}"
-            response = requests.patch(update_url, headers=headers, json={"properties": properties})
-            response.raise_for_status()
+def read_contacts(emails):
+    """Look up contacts by email with the batch read API; returns {email: (id, lead_score)}.
 
-            response_data = {
-                "id": contact_id,
-                "action": "updated",
-                "properties": response.json().get("properties", {}),
-                "message": "Contact updated successfully"
-            }
-        else:
-            # Create new contact
-            logger.info(f"Creating new contact with email: {email}")
-            response = requests.post(url, headers=headers, json={"properties": properties})
+    Found contacts are added to contact_cache. Emails without a contact are
+    simply absent from the result.
+    """
+    found = {}
+    for chunk in _chunks(list(dict.fromkeys(email.lower() for email in emails))):
+        payload = {
+            "idProperty": "email",
+            "properties": ["email", "lead_score"],
+            "inputs": [{"id": email} for email in chunk]
+        }
+        response = transport.post(f"{CONTACTS_URL}/batch/read", headers=_headers(), json=payload, idempotent=True)
+        # 207 Multi-Status: some emails have no contact
+        if response.status_code not in (200, 207):
             response.raise_for_status()
+        for result in response.json().get("results", []):
+            properties = result.get("properties", {})
+            email = (properties.get("email") or "").lower()
+            if email:
+                found[email] = (str(result["id"]), _score(properties.get("lead_score")))
+                contact_cache.put(email, result["id"])
+    return found
 
-            contact_id = response.json().get("id")
-            response_data = {
-                "id": contact_id,
-                "action": "created",
-                "properties": response.json().get("properties", {}),
-                "message": "Contact created successfully"
-            }
+def _post_upsert(inputs):
+    """POST one batch/upsert request; returns {email: result}."""
+    response = transport.post(
+        f"{CONTACTS_URL}/batch/upsert",
+        headers=_headers(),
+        json={"inputs": inputs},
+        idempotent=True  # Upserting by email can be repeated safely
+    )
+    response.raise_for_status()
+    results = {}
+    for result in response.json().get("results", []):
+        properties = result.get("properties", {})
+        email = (properties.get("email") or "").lower()
+        if email:
+            results[email] = result
+    return results
 
-        logger.info(f"HubSpot operation successful: {response_data['action']} contact {contact_id}")
-        return response.status_code, response_data
+def upsert_contacts(contacts):
+    """Create or update many contacts with HubSpot's batch APIs.
+
+    contacts are dicts with create_or_update_contact's arguments. Their
+    current lead_score is read with one batch read per 100 contacts, so the
+    score only ever increases, then all contacts are written with batch
+    upsert (by email). Returns a (status_code, response) pair per contact,
+    in order.
+    """
+    if not HUBSPOT_API_KEY:
+        logger.warning("Skipping HubSpot CRM update: API key not configured")
+        return [(503, {"error": "HubSpot API key not configured", "message": "CRM integration disabled"})] * len(contacts)
+
+    outcomes = [None] * len(contacts)
+    try:
+        # Always the live score: a cached one may be older than another worker's write
+        known = read_contacts([contact["email"] for contact in contacts])
     except requests.RequestException as e:
-        logger.error(f"HubSpot API error: {str(e)}")
-        if hasattr(e, 'response') and e.response:
-            logger.error(f"Response: {e.response.text}")
-        return 500, {"error": str(e)}
+        logger.error(f"HubSpot batch read error: {str(e)}")
+        return [(500, {"error": str(e)})] * len(contacts)
+
+    inputs = []
+    for contact in contacts:
+        properties = build_contact_properties(**contact)
+        existing = known.get(contact["email"].lower())
+        if existing:
+            # Use the higher score
+            properties["lead_score"] = str(max(existing[1], _score(properties["lead_score"])))
+        inputs.append({"idProperty": "email", "id": contact["email"], "properties": properties})
+
+    for chunk_start in range(0, len(inputs), HUBSPOT_BATCH_SIZE):
+        chunk = inputs[chunk_start:chunk_start + HUBSPOT_BATCH_SIZE]
+        try:
+            try:
+                results = _post_upsert(chunk)
+            except requests.HTTPError as e:
+                # One invalid contact rejects the whole batch; write them one by one instead
+                if len(chunk) == 1 or e.response is None or e.response.status_code != 400:
+                    raise
+                logger.warning(f"HubSpot rejected a batch of {len(chunk)} contacts, retrying individually")
+                results = {}
+                for item in chunk:
+                    try:
+                        results.update(_post_upsert([item]))
+                    except requests.HTTPError as item_error:
+                        results[item["id"].lower()] = item_error
+        except requests.RequestException as e:
+            logger.error(f"HubSpot API error: {str(e)}")
+            for offset in range(len(chunk)):
+                outcomes[chunk_start + offset] = (500, {"error": str(e)})
+            continue
+
+        for offset, item in enumerate(chunk):
+            result = results.get(item["id"].lower())
+            if isinstance(result, Exception):
+                outcomes[chunk_start + offset] = (500, {"error": str(result)})
+            elif result is None:
+                outcomes[chunk_start + offset] = (500, {"error": "Contact missing from batch upsert response"})
+            else:
+                contact_cache.put(item["id"], result["id"])
+                action = "created" if result.get("new") else "updated"
+                outcomes[chunk_start + offset] = (201 if result.get("new") else 200, {
+                    "id": result["id"],
+                    "action": action,
+                    "properties": result.get("properties", {}),
+                    "message": f"Contact {action} successfully"
+                })
+
+    return outcomes
+
+def prefetch_contact(email):
+    """Make sure contact_cache knows email's contact id, so a following write needs no lookup."""
+    if not HUBSPOT_API_KEY or contact_cache.get(email) is not None:
+        return
+    try:
+        read_contacts([email])
+    except requests.RequestException as e:
+        logger.warning(f"HubSpot contact lookup failed: {str(e)}")
+
+def create_or_update_contact(email, name, budget, lead_type, lead_score, qualification, chat_history, user_type,
+                             lead_status=None):
+    """Create or update a contact in HubSpot CRM with enhanced error handling and response formatting."""
+    # Check if HubSpot API key is available
+    if not HUBSPOT_API_KEY:
+        logger.warning("Skipping HubSpot CRM update: API key not configured")
+        return 503, {"error": "HubSpot API key not configured", "message": "CRM integration disabled"}
+
+    properties = build_contact_properties(
+        email, name, budget, lead_type, lead_score, qualification, chat_history, user_type, lead_status
+    )
+
+    # A cached id lets us read the contact and PATCH it directly, without searching first
+    contact_id = contact_cache.get(email)
+    if contact_id is not None:
+        try:
+            response = transport.get(f"{CONTACTS_URL}/{contact_id}", headers=_headers(), params={"properties": "lead_score"})
+            if response.status_code != 404:
+                response.raise_for_status()
+                old_score = _score(response.json().get("properties", {}).get("lead_score"))
+                properties["lead_score"] = str(max(old_score, _score(properties["lead_score"])))
+                response = transport.patch(f"{CONTACTS_URL}/{contact_id}", headers=_headers(), json={"properties": properties}, idempotent=True)
+            if response.status_code == 404:
+                # Deleted or merged in HubSpot; resolve the email again below
+                logger.info(f"Cached contact {contact_id} for {email} no longer exists")
+                contact_cache.invalidate(email)
+            else:
+                response.raise_for_status()
+                logger.info(f"HubSpot operation successful: updated contact {contact_id}")
+                return response.status_code, {
+                    "id": contact_id,
+                    "action": "updated",
+                    "properties": response.json().get("properties", {}),
+                    "message": "Contact updated successfully"
+                }
+        except requests.RequestException as e:
+            logger.error(f"HubSpot API error: {str(e)}")
+            if hasattr(e, 'response') and e.response:
+                logger.error(f"Response: {e.response.text}")
+            return 500, {"error": str(e)}
+
+    status_code, response_data = upsert_contacts([{
+        "email": email,
+        "name": name,
+        "budget": budget,
+        "lead_type": lead_type,
+        "lead_score": lead_score,
+        "qualification": qualification,
+        "chat_history": chat_history,
+        "user_type": user_type,
+        "lead_status": lead_status
+    }])[0]
+    if status_code in (200, 201):
+        logger.info(f"HubSpot operation successful: {response_data['action']} contact {response_data['id']}")
+    return status_code, response_data
 
 def test_hubspot_connection():
     """Test the HubSpot API connection with the provided API key."""
@@ -125,7 +317,7 @@ def test_hubspot_connection():
             "api_key_used": "None"
         }
 
-    url = "https://api.hubapi.com/crm/v3/properties/contacts"
+    url = f"{HUBSPOT_API_BASE}/crm/v3/properties/contacts"
     headers = {
         "Authorization": f"Bearer {HUBSPOT_API_KEY}",
         "Content-Type": "application/json"
@@ -133,7 +325,7 @@ def test_hubspot_connection():
 
     try:
         logger.info("Testing HubSpot API connection...")
-        response = requests.get(url, headers=headers)
+        response = transport.get(url, headers=headers)
         response.raise_for_status()
 
         # Get the first few properties to verify data access
@@ -0,0 +1,340 @@
+"""
+Write-behind queue for HubSpot contact updates.
+
+Chat turns record the latest contact state in a local SQLite table and return
+immediately; a background thread pushes it to HubSpot in batch upserts
+(crm.hubspot_client.upsert_contacts). The table has one row per email, so
+several turns between flushes coalesce into a single write: the latest state
+wins, except lead_score, which keeps the highest value seen.
+
+Rows are claimed with a lease before they are synced, so gunicorn workers
+sharing the database never sync the same contact concurrently, and a row
+claimed by a worker that died is picked up again once its lease expires.
+Failed writes are retried with exponential backoff until CRM_SYNC_MAX_ATTEMPTS,
+after which the row is kept with status "failed" for inspection.
+
+CRM_SYNC_MODE=sync restores the old behaviour of updating HubSpot inline.
+
+    python -m crm.sync_queue           # queue statistics
+    python -m crm.sync_queue flush     # sync everything that is due now
+"""
+import os
+import sys
+import time
+import json
+import random
+import sqlite3
+import logging
+import threading
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+ENABLE_CRM_SYNC = os.getenv("ENABLE_CRM_SYNC", "True").lower() == "true"
+CRM_SYNC_MODE = os.getenv("CRM_SYNC_MODE", "queue").lower()  # "queue" or "sync"
+CRM_QUEUE_PATH = os.getenv(
+    "CRM_QUEUE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "crm_queue.sqlite3")
+)
+CRM_SYNC_INTERVAL = float(os.getenv("CRM_SYNC_INTERVAL", "5"))  # seconds between flushes
+CRM_SYNC_BATCH_SIZE = int(os.getenv("CRM_SYNC_BATCH_SIZE", "100"))  # one HubSpot batch request
+CRM_SYNC_MAX_ATTEMPTS = int(os.getenv("CRM_SYNC_MAX_ATTEMPTS", "8"))
+CRM_SYNC_BACKOFF_BASE = float(os.getenv("CRM_SYNC_BACKOFF_BASE", "5"))  # seconds
+CRM_SYNC_BACKOFF_MAX = float(os.getenv("CRM_SYNC_BACKOFF_MAX", "600"))  # seconds
+CRM_SYNC_LEASE = float(os.getenv("CRM_SYNC_LEASE", "120"))  # seconds a claimed row stays locked
+
+CONTACT_FIELDS = ("name", "budget", "lead_type", "lead_score", "qualification", "chat_history", "user_type",
+                  "lead_status")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contact_updates (
+    email TEXT PRIMARY KEY,
+    name TEXT,
+    budget TEXT,
+    lead_type TEXT,
+    lead_score INTEGER,
+    qualification TEXT,
+    chat_history TEXT,
+    user_type TEXT,
+    lead_status TEXT,
+    version INTEGER NOT NULL DEFAULT 1,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS contact_updates_due ON contact_updates (status, next_attempt);
+"""
+
+# Later turns overwrite the row, keeping the highest lead score. A new update
+# also revives a row that had given up ("failed").
+UPSERT = """
+INSERT INTO contact_updates (email, name, budget, lead_type, lead_score, qualification, chat_history,
+                             user_type, lead_status, next_attempt, updated_at)
+VALUES (:email, :name, :budget, :lead_type, :lead_score, :qualification, :chat_history,
+        :user_type, :lead_status, :now, :now)
+ON CONFLICT (email) DO UPDATE SET
+    name = excluded.name,
+    budget = excluded.budget,
+    lead_type = excluded.lead_type,
+    lead_score = MAX(COALESCE(contact_updates.lead_score, 0), COALESCE(excluded.lead_score, 0)),
+    qualification = excluded.qualification,
+    chat_history = excluded.chat_history,
+    user_type = excluded.user_type,
+    lead_status = excluded.lead_status,
+    version = contact_updates.version + 1,
+    status = 'pending',
+    attempts = CASE WHEN contact_updates.status = 'failed' THEN 0 ELSE contact_updates.attempts END,
+    next_attempt = CASE WHEN contact_updates.status = 'failed' THEN excluded.next_attempt
+                        ELSE contact_updates.next_attempt END,
+    updated_at = excluded.updated_at
+RETURNING version
+"""
+
+class CrmSyncQueue:
+    """Durable, coalescing queue of HubSpot contact updates with a background flusher."""
+
+    def __init__(self, path=CRM_QUEUE_PATH, interval=CRM_SYNC_INTERVAL, batch_size=CRM_SYNC_BATCH_SIZE,
+                 max_attempts=CRM_SYNC_MAX_ATTEMPTS, sync_function=None):
+        # sync_function(contacts) -> [(status_code, response)], hubspot_client.upsert_contacts by default
+        self.path = path
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.sync_function = sync_function
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._worker = None
+        self._worker_pid = None
+        self._schema_ready = False
+        self._stats = {"enqueued": 0, "coalesced": 0, "synced": 0, "retried": 0, "failed": 0, "flushes": 0}
+
+    def _connect(self):
+        """One connection per thread (and per process after a fork)."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        if not self._schema_ready:
+            connection.executescript(SCHEMA)
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(contact_updates)")}
+            if "lead_status" not in columns:
+                # Queues created before lead_status was tracked
+                connection.execute("ALTER TABLE contact_updates ADD COLUMN lead_status TEXT")
+            self._schema_ready = True
+        return connection
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def enqueue(self, email, name, budget, lead_type, lead_score, qualification, chat_history, user_type,
+                lead_status=None):
+        """Record the latest state of a contact; returns the row's version."""
+        try:
+            lead_score = int(lead_score or 0)
+        except (TypeError, ValueError):
+            lead_score = 0
+
+        row = self._connect().execute(UPSERT, {
+            "email": email,
+            "name": name,
+            "budget": str(budget) if budget else "",
+            "lead_type": lead_type,
+            "lead_score": lead_score,
+            "qualification": qualification,
+            "chat_history": chat_history,
+            "user_type": user_type,
+            "lead_status": lead_status,
+            "now": time.time()
+        }).fetchone()
+
+        version = row["version"]
+        self._count("enqueued")
+        if version > 1:
+            self._count("coalesced")
+        self.start()
+        return version
+
+    def _claim(self, limit):
+        """Lease up to limit due rows to this process."""
+        now = time.time()
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT * FROM contact_updates WHERE status = 'pending' AND next_attempt <= ? AND lease_until < ? "
+                "ORDER BY next_attempt LIMIT ?",
+                (now, now, limit)
+            ).fetchall()
+            connection.executemany(
+                "UPDATE contact_updates SET lease_until = ? WHERE email = ?",
+                [(now + CRM_SYNC_LEASE, row["email"]) for row in rows]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _sync_batch(self, rows):
+        """Push a batch of contacts to HubSpot; returns (ok, error) per row."""
+        sync_function = self.sync_function
+        if sync_function is None:
+            from crm.hubspot_client import upsert_contacts
+            sync_function = upsert_contacts
+
+        contacts = [dict({field: row[field] for field in CONTACT_FIELDS}, email=row["email"]) for row in rows]
+        try:
+            outcomes = sync_function(contacts)
+        except Exception as e:
+            return [(False, str(e))] * len(rows)
+
+        results = []
+        for status_code, response in outcomes:
+            if status_code in (200, 201):
+                results.append((True, None))
+            else:
+                results.append((False, f"{status_code}: {json.dumps(response)[:500]}"))
+        return results
+
+    def _backoff(self, attempts):
+        return random.uniform(0.5, 1.0) * min(CRM_SYNC_BACKOFF_MAX, CRM_SYNC_BACKOFF_BASE * 2 ** attempts)
+
+    def flush(self, limit=None):
+        """Sync every due row in batches; returns the number of rows attempted."""
+        attempted = 0
+        while limit is None or attempted < limit:
+            batch_size = self.batch_size if limit is None else min(self.batch_size, limit - attempted)
+            rows = self._claim(batch_size)
+            if not rows:
+                break
+            self._count("flushes")
+
+            connection = self._connect()
+            for row, (ok, error) in zip(rows, self._sync_batch(rows)):
+                if ok:
+                    # A turn that arrived during the sync bumped the version; keep that row
+                    connection.execute(
+                        "DELETE FROM contact_updates WHERE email = ? AND version = ?",
+                        (row["email"], row["version"])
+                    )
+                    connection.execute("UPDATE contact_updates SET lease_until = 0 WHERE email = ?", (row["email"],))
+                    self._count("synced")
+                    continue
+
+                attempts = row["attempts"] + 1
+                if attempts >= self.max_attempts:
+                    logger.error(f"Giving up on CRM sync for {row['email']} after {attempts} attempts: {error}")
+                    status, next_attempt = "failed", time.time()
+                    self._count("failed")
+                else:
+                    logger.warning(f"CRM sync for {row['email']} failed (attempt {attempts}): {error}")
+                    status, next_attempt = "pending", time.time() + self._backoff(attempts)
+                    self._count("retried")
+                # As above: a newer version was not part of this attempt, so it stays pending as it is
+                connection.execute(
+                    "UPDATE contact_updates SET status = ?, attempts = ?, next_attempt = ?, lease_until = 0, "
+                    "last_error = ? WHERE email = ? AND version = ?",
+                    (status, attempts, next_attempt, error, row["email"], row["version"])
+                )
+                connection.execute("UPDATE contact_updates SET lease_until = 0 WHERE email = ?", (row["email"],))
+            attempted += len(rows)
+        return attempted
+
+    def _run(self):
+        while not self._stopping.is_set():
+            # Waiting out the interval lets consecutive turns coalesce
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"CRM sync flush failed: {str(e)}")
+
+    def start(self):
+        """Start the background flusher in this process, if it is not running."""
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            self._stopping.clear()
+            self._worker = threading.Thread(target=self._run, name="crm-sync", daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def stop(self, flush=True):
+        """Stop the flusher, optionally syncing what is due first."""
+        self._stopping.set()
+        self._wake.set()
+        if self._worker is not None and self._worker_pid == os.getpid():
+            self._worker.join(timeout=self.interval + 5)
+        if flush:
+            self.flush()
+
+    def depth(self):
+        """Number of queued rows by status."""
+        rows = self._connect().execute("SELECT status, COUNT(*) AS count FROM contact_updates GROUP BY status")
+        return {row["status"]: row["count"] for row in rows}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["depth"] = self.depth()
+        return stats
+
+# Shared by all chat turns in this process
+crm_queue = CrmSyncQueue()
+
+def syncs_inline():
+    """Whether sync_contact talks to HubSpot during the chat turn."""
+    return ENABLE_CRM_SYNC and CRM_SYNC_MODE == "sync"
+
+def sync_contact(email, name, budget, lead_type, lead_score, qualification, chat_history, user_type, lead_status=None):
+    """Update the HubSpot contact, queued or inline depending on CRM_SYNC_MODE.
+
+    Returns (status_code, response) like create_or_update_contact, with 202
+    when the update was queued and 204 when CRM sync is disabled.
+    """
+    if not ENABLE_CRM_SYNC:
+        return 204, {"message": "CRM sync disabled"}
+
+    from crm.hubspot_client import HUBSPOT_API_KEY, create_or_update_contact
+
+    if CRM_SYNC_MODE == "sync" or not HUBSPOT_API_KEY:
+        # Without an API key create_or_update_contact reports the problem immediately
+        return create_or_update_contact(
+            email, name, budget, lead_type, lead_score, qualification, chat_history, user_type, lead_status
+        )
+
+    try:
+        version = crm_queue.enqueue(
+            email, name, budget, lead_type, lead_score, qualification, chat_history, user_type, lead_status
+        )
+    except sqlite3.Error as e:
+        logger.error(f"Could not queue CRM update, syncing inline: {str(e)}")
+        return create_or_update_contact(
+            email, name, budget, lead_type, lead_score, qualification, chat_history, user_type, lead_status
+        )
+    return 202, {"message": "Contact update queued", "email": email, "version": version}
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["flush"]:
+        print(json.dumps({"attempted": crm_queue.flush()}))
+    print(json.dumps(crm_queue.stats(), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import os
+
+# Gunicorn configuration, picked up automatically from the working directory.
+# With VECTOR_SEARCH_MODE=preload the app (and with it the embedding model,
+# FAISS index and metadata) is imported once in the master, and forked
+# workers share those pages copy-on-write instead of each loading a copy.
+preload_app = os.getenv("VECTOR_SEARCH_MODE", "lazy").lower() == "preload"
+
+# With RETRIEVAL_MODE=server the model and index live in one retrieval server
+# process (chatbot/retrieval_server.py) that gunicorn starts and stops here
+spawn_retrieval_server = (
+    os.getenv("RETRIEVAL_MODE", "inprocess").lower() == "server"
+    and os.getenv("RETRIEVAL_SERVER_SPAWN", "True").lower() == "true"
+)
+retrieval_server = None
+
+def on_starting(server):
+    """Start the retrieval server before any worker needs it"""
+    global retrieval_server
+
+    if not spawn_retrieval_server:
+        return
+
+    import sys
+    import subprocess
+    from chatbot.retrieval_server import wait_until_up
+
+    retrieval_server = subprocess.Popen([sys.executable, "-m", "chatbot.retrieval_server"])
+    if wait_until_up(timeout=30):
+        server.log.info(f"Retrieval server {retrieval_server.pid} is up")
+    else:
+        server.log.warning("Retrieval server is not answering yet; chat turns go without retrieval until it does")
+
+def on_exit(server):
+    if retrieval_server is not None:
+        retrieval_server.terminate()
+        try:
+            retrieval_server.wait(timeout=10)
+        except Exception:
+            retrieval_server.kill()
+
+def post_fork(server, worker):
+    """Let the memory governor recycle the worker, and warm up the inherited model in it"""
+    import signal
+    from utils.memory_governor import memory_governor
+
+    # A graceful exit: the worker finishes its requests and gunicorn starts a fresh one
+    memory_governor.recycle = lambda: os.kill(os.getpid(), signal.SIGTERM)
+
+    if not preload_app:
+        return
+
+    from chatbot import vector_search
+    vector_search.after_fork()
+    # The master's sampling thread did not survive the fork
+    memory_governor.start()
+    server.log.info(f"Worker {worker.pid} ready with preloaded vector search")
+
+def worker_exit(server, worker):
+    """Push queued CRM updates before the worker goes away (Render disks do not survive a deploy)"""
+    import sys
+
+    sync_queue = sys.modules.get("crm.sync_queue")
+    if sync_queue is None:
+        return
+    try:
+        sync_queue.crm_queue.stop(flush=True)
+    except Exception as e:
+        server.log.warning(f"Could not flush CRM queue on exit: {e}")
@@ -0,0 +1,165 @@
+"""
+In-memory Calendly availability.
+
+Calendly answers availability one event type and at most seven days at a
+time. The engine fetches whole UTC days once and remembers which time ranges
+it has fetched (sorted, non-overlapping intervals) and the available slots in
+them (sorted by start time). Any start_time/end_time query over ranges it
+already holds is answered from memory. Only the missing days are fetched,
+so a calendar widget polling the same week costs no Calendly calls.
+
+A booking invalidates its day, and fetched ranges expire after
+AVAILABILITY_CACHE_TTL seconds, which picks up bookings made directly on
+Calendly.
+"""
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+AVAILABILITY_CACHE_TTL = int(os.getenv("AVAILABILITY_CACHE_TTL", "300"))  # seconds
+
+DAY = 24 * 3600
+MAX_FETCH_RANGE = 7 * DAY  # Calendly's limit per availability request
+# Calendly rejects a start_time in the past, and format_time drops the fraction
+# of a second, so fetches start this far ahead of now
+FETCH_START_MARGIN = 60  # seconds
+
+def parse_time(value):
+    """An ISO 8601 time ("2024-05-01T09:00:00Z", with or without an offset) as a UTC timestamp."""
+    parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000000Z")
+
+class AvailabilityEngine:
+    """Fetched availability ranges and their slots, queried by time range.
+
+    fetch(start_time, end_time) returns the available slots (dicts with a
+    "start_time") in a range of at most seven days.
+    """
+
+    def __init__(self, fetch, ttl=AVAILABILITY_CACHE_TTL):
+        self.fetch = fetch
+        self.ttl = ttl
+        self._covered = []     # sorted, disjoint (start, end, fetched_at)
+        self._slot_times = []  # sorted slot start timestamps
+        self._slots = {}       # slot start timestamp -> slot
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()  # one fetch at a time, so concurrent polls share it
+        self.hits = 0
+        self.fetches = 0
+
+    def _gaps(self, start, end, now):
+        """The parts of [start, end) not covered by a fresh fetched range (call with the lock held)."""
+        gaps = []
+        cursor = start
+        for range_start, range_end, fetched_at in self._covered:
+            if range_start >= end:
+                break
+            if range_end <= cursor or now - fetched_at > self.ttl:
+                continue
+            if range_start > cursor:
+                gaps.append((cursor, range_start))
+            cursor = max(cursor, range_end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def _remove(self, start, end):
+        """Forget coverage and slots in [start, end) (call with the lock held)."""
+        covered = []
+        for range_start, range_end, fetched_at in self._covered:
+            if range_end <= start or range_start >= end:
+                covered.append((range_start, range_end, fetched_at))
+                continue
+            if range_start < start:
+                covered.append((range_start, start, fetched_at))
+            if range_end > end:
+                covered.append((end, range_end, fetched_at))
+        self._covered = covered
+
+        low, high = bisect_left(self._slot_times, start), bisect_left(self._slot_times, end)
+        for slot_time in self._slot_times[low:high]:
+            del self._slots[slot_time]
+        del self._slot_times[low:high]
+
+    def _store(self, start, end, slots, fetched_at):
+        with self._lock:
+            self._remove(start, end)
+            insort(self._covered, (start, end, fetched_at))
+            for slot in slots:
+                slot_time = parse_time(slot["start_time"])
+                if start <= slot_time < end and slot_time not in self._slots:
+                    insort(self._slot_times, slot_time)
+                    self._slots[slot_time] = slot
+
+    def _load(self, start, end):
+        """Fetch [start, end) in chunks Calendly accepts."""
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(end, chunk_start + MAX_FETCH_RANGE)
+            fetched_at = time.time()
+            slots = self.fetch(format_time(chunk_start), format_time(chunk_end))
+            self.fetches += 1
+            self._store(chunk_start, chunk_end, slots, fetched_at)
+            chunk_start = chunk_end
+
+    def available_times(self, start_time, end_time):
+        """Available slots starting in [start_time, end_time), fetching only days not held in memory."""
+        now = time.time()
+        # Calendly only has availability from now on (and nothing bookable in the next margin)
+        start, end = max(parse_time(start_time), now + FETCH_START_MARGIN), parse_time(end_time)
+        if end <= start:
+            return []
+
+        with self._lock:
+            gaps = self._gaps(start, end, now)
+        if gaps:
+            with self._fetch_lock:
+                # Another request may have fetched these while this one waited
+                with self._lock:
+                    gaps = self._gaps(start, end, time.time())
+                for gap_start, gap_end in gaps:
+                    # Whole days, so a polling window that slides by a few seconds stays covered
+                    self._load(max(gap_start - gap_start % DAY, time.time() + FETCH_START_MARGIN),
+                               gap_end - gap_end % DAY + DAY)
+        else:
+            self.hits += 1
+
+        with self._lock:
+            low, high = bisect_left(self._slot_times, start), bisect_left(self._slot_times, end)
+            return [self._slots[slot_time] for slot_time in self._slot_times[low:high]]
+
+    def slot_at(self, start_time):
+        """The cached slot starting at start_time, if any."""
+        with self._lock:
+            return self._slots.get(parse_time(start_time))
+
+    def invalidate(self, start_time, end_time=None):
+        """Forget [start_time, end_time), by default the UTC day of start_time (e.g. after a booking)."""
+        start = parse_time(start_time)
+        if end_time is None:
+            start -= start % DAY
+            end = start + DAY
+        else:
+            end = parse_time(end_time)
+        with self._lock:
+            self._remove(start, end)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ranges": len(self._covered),
+                "slots": len(self._slot_times),
+                "hits": self.hits,
+                "fetches": self.fetches
+            }
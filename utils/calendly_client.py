@@ -1,10 +1,14 @@
 import os
+import time
 import requests
+import threading
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import urllib.parse
 import logging
 from typing import Dict, List, Optional, Union, Tuple
+from utils.http_client import transport, CALENDLY_API_BASE
+from utils.availability import AvailabilityEngine, parse_time, format_time
 
 # Configure logging
 logging.basicConfig(
@@ -17,6 +21,8 @@ load_dotenv()
 
 CALENDLY_API_KEY = os.getenv("CALENDLY_API_KEY")
 CALENDLY_USERNAME = os.getenv("CALENDLY_USERNAME")
+CALENDLY_CACHE_TTL = int(os.getenv("CALENDLY_CACHE_TTL", "3600"))  # seconds; refreshed in the background at half this
+CALENDLY_RETRY_INTERVAL = 60  # seconds between background refreshes after a failure
 
 class CalendlyError(Exception):
     """Base exception for Calendly client errors"""
@@ -30,12 +36,27 @@ class CalendlyAPIError(CalendlyError):
     """API related errors"""
     pass
 
+class CalendlySlotUnavailableError(CalendlyError):
+    """The requested start time is not an available slot"""
+    pass
+
 class CalendlyClient:
     def __init__(self):
-        """Initialize Calendly client with API credentials"""
+        """Initialize Calendly client with API credentials.
+
+        Makes no network calls: user details and event types are fetched by
+        a background thread (see start) and reused for CALENDLY_CACHE_TTL.
+        """
         self.enabled = True
-        self.base_url = "https://api.calendly.com"
+        self.base_url = CALENDLY_API_BASE
         self.user_details = None
+        self.event_types = []
+        self._fetched_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._refresher = None
+        self._refresher_pid = None
+        self.availability = AvailabilityEngine(self._fetch_available_times)
 
         # Check if Calendly is configured
         if not CALENDLY_API_KEY or not CALENDLY_USERNAME:
@@ -48,22 +69,10 @@ class CalendlyClient:
             "Content-Type": "application/json"
         }
 
-        try:
-            self.user_details = self._get_user_details()
-            if not self.user_details:
-                logger.warning("Failed to authenticate with Calendly")
-                self.enabled = False
-        except CalendlyAuthError as e:
-            logger.error(f"Authentication error: {str(e)}")
-            self.enabled = False
-        except Exception as e:
-            logger.error(f"Unexpected error during initialization: {str(e)}")
-            self.enabled = False
-
     def _get_user_details(self) -> Dict[str, str]:
         """Get user details including organization and user URI"""
         try:
-            response = requests.get(f"{self.base_url}/users/me", headers=self.headers)
+            response = transport.get(f"{self.base_url}/users/me", headers=self.headers)
             response.raise_for_status()
             user_data = response.json()
 
@@ -83,25 +92,80 @@ class CalendlyClient:
             logger.error(f"Unexpected error: {str(e)}")
             raise CalendlyError(f"Unexpected error: {str(e)}")
 
-    def get_available_slots(self, days_ahead: int = 7) -> List[Dict]:
-        """Get available scheduling slots for the next X days"""
-        if not self.enabled or not self.user_details:
-            logger.warning("Calendly integration is disabled")
-            return []
-
+    def _get_event_types(self, organization: str) -> List[Dict]:
+        """Get the organization's event types"""
         try:
-            event_types_url = f"{self.base_url}/event_types"
-            response = requests.get(
-                event_types_url,
+            response = transport.get(
+                f"{self.base_url}/event_types",
                 headers=self.headers,
-                params={"organization": self.user_details["organization"]}
+                params={"organization": organization}
             )
             response.raise_for_status()
             return response.json().get("collection", [])
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 401:
+                raise CalendlyAuthError("Invalid or expired API key")
+            raise CalendlyAPIError(f"HTTP error: {str(e)}")
         except Exception as e:
-            logger.error(f"Error getting available slots: {str(e)}")
+            raise CalendlyError(f"Unexpected error: {str(e)}")
+
+    def _is_fresh(self) -> bool:
+        return self.user_details is not None and time.time() - self._fetched_at < CALENDLY_CACHE_TTL
+
+    def refresh(self, force: bool = True) -> bool:
+        """Fetch user details and event types; an authentication error disables the client"""
+        if not self.enabled:
+            return False
+
+        with self._refresh_lock:
+            if not force and self._is_fresh():
+                return True
+            try:
+                user_details = self._get_user_details()
+                event_types = self._get_event_types(user_details["organization"])
+                self.user_details, self.event_types = user_details, event_types
+                self._fetched_at = time.time()
+                return True
+            except CalendlyAuthError as e:
+                logger.error(f"Authentication error: {str(e)}")
+                self.enabled = False
+            except Exception as e:
+                logger.error(f"Could not refresh Calendly data: {str(e)}")
+            return False
+
+    def _refresh_loop(self):
+        while self.enabled:
+            refreshed = self.refresh()
+            time.sleep(CALENDLY_CACHE_TTL / 2 if refreshed else CALENDLY_RETRY_INTERVAL)
+
+    def start(self):
+        """Start the background refresh in this process (again after a fork); does not block"""
+        if not self.enabled:
+            return
+
+        with self._start_lock:
+            pid = os.getpid()
+            if self._refresher is not None and self._refresher_pid == pid and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name="calendly-refresh", daemon=True)
+            self._refresher_pid = pid
+            self._refresher.start()
+
+    def get_available_slots(self, days_ahead: int = 7) -> List[Dict]:
+        """Get the event types to schedule, from the cache when it is fresh"""
+        if not self.enabled:
+            logger.warning("Calendly integration is disabled")
             return []
 
+        self.start()
+        # Only a cold or expired cache (e.g. the refresher keeps failing) costs a round trip here
+        if not self._is_fresh():
+            self.refresh(force=False)
+        if not self.user_details:
+            logger.warning("Calendly user details are unavailable")
+            return []
+        return self.event_types
+
     def create_scheduling_link(self, name: str, email: str, event_type_uri: Optional[str] = None) -> Dict[str, str]:
         """Create a scheduling link with prefilled information"""
         if not self.enabled:
@@ -144,7 +208,7 @@ class CalendlyClient:
             return {"status": "error", "message": str(e)}
 
     def schedule_meeting(self, name: str, email: str, start_time: str, event_type_uri: Optional[str] = None) -> Dict[str, str]:
-        """Schedule a meeting directly"""
+        """Book start_time for an invitee through Calendly's scheduling API (POST /invitees)"""
         if not self.enabled:
             logger.warning("Calendly integration is disabled")
             return {"status": "error", "message": "Calendly integration is disabled"}
@@ -157,28 +221,92 @@ class CalendlyClient:
                 event_type_uri = event_types[0]["uri"]
 
             data = {
-                "start_time": start_time,
                 "event_type": event_type_uri,
-                "invitees": [{"email": email, "name": name}]
+                "start_time": start_time,
+                "invitee": {"name": name, "email": email, "timezone": "UTC"}
             }
 
-            response = requests.post(
-                f"{self.base_url}/scheduled_events",
+            response = transport.post(
+                f"{self.base_url}/invitees",
                 headers=self.headers,
                 json=data
             )
             response.raise_for_status()
-            event_data = response.json()["resource"]
+            invitee = response.json()["resource"]
 
             return {
                 "status": "success",
-                "event_uri": event_data["uri"],
+                "event_uri": invitee.get("event", invitee["uri"]),
                 "start_time": start_time
             }
         except Exception as e:
             logger.error(f"Error scheduling meeting: {str(e)}")
             return {"status": "error", "message": str(e)}
 
+    def _fetch_available_times(self, start_time: str, end_time: str) -> List[Dict]:
+        """Available slots of the default event type in a range of at most seven days"""
+        event_types = self.get_available_slots()
+        if not event_types:
+            raise CalendlyError("No event types found")
+
+        response = transport.get(
+            f"{self.base_url}/event_type_available_times",
+            headers=self.headers,
+            params={"event_type": event_types[0]["uri"], "start_time": start_time, "end_time": end_time}
+        )
+        response.raise_for_status()
+        return [slot for slot in response.json().get("collection", []) if slot.get("status") == "available"]
+
+    def get_available_times(self, start_time: str, end_time: str) -> Optional[List[Dict]]:
+        """Available slots between two ISO 8601 times, from the availability cache where possible.
+
+        Raises ValueError for malformed times; returns None if Calendly could not be reached.
+        """
+        if not self.enabled:
+            logger.warning("Calendly integration is disabled")
+            return None
+
+        try:
+            return self.availability.available_times(start_time, end_time)
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error getting available times: {str(e)}")
+            return None
+
+    def create_event(self, start_time: str, email: str, name: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """Book start_time for email; None if Calendly is disabled.
+
+        Raises CalendlySlotUnavailableError if start_time is not an available slot.
+
+        Returns the event uri, booked=True and the slot's booking_url. If Calendly
+        refuses the booking (the scheduling API needs a paid plan), returns
+        booked=False with the slot's scheduling_url for the invitee to book it.
+        """
+        if not self.enabled:
+            logger.warning("Calendly integration is disabled")
+            return None
+
+        slot = self.availability.slot_at(start_time)
+        if slot is None:
+            # Not cached yet: load the slot's day, raising ValueError for a malformed time
+            self.availability.available_times(start_time, format_time(parse_time(start_time) + 1))
+            slot = self.availability.slot_at(start_time)
+        if slot is None:
+            raise CalendlySlotUnavailableError(f"{start_time} is not an available slot")
+
+        booking_url = slot.get("scheduling_url")
+        if not booking_url and self.user_details:
+            booking_url = self.user_details.get("scheduling_url")
+
+        result = self.schedule_meeting(name or email.split("@")[0], email, start_time)
+        if result["status"] != "success":
+            return {"uri": None, "booked": False, "booking_url": booking_url, "start_time": start_time}
+
+        # The booking changes availability around it; the next query refetches that day
+        self.availability.invalidate(start_time)
+        return {"uri": result["event_uri"], "booked": True, "booking_url": booking_url, "start_time": start_time}
+
     def create_property_consultation_link(self, property_details: Dict, invitee_name: str, invitee_email: str) -> str:
         """Create a scheduling link for property consultation"""
         if not self.enabled:
@@ -204,4 +332,7 @@ class CalendlyClient:
             return final_url
         except Exception as e:
             logger.error(f"Error creating property consultation link: {str(e)}")
-            return f"Error creating scheduling link: {str(e)}"
\ No newline at end of file
+            return f"Error creating scheduling link: {str(e)}"
+
+# Shared by the app and the chat handler
+calendly_client = CalendlyClient()
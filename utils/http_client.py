@@ -0,0 +1,279 @@
+"""
+Shared HTTP transport for the Groq, HubSpot and Calendly integrations.
+
+One requests.Session per upstream host keeps TCP+TLS connections alive
+between chat turns. Every call gets connect/read timeouts, 429 and 5xx
+responses are retried a bounded number of times with jittered exponential
+backoff (honouring Retry-After), and per-host latency is recorded.
+
+AsyncHttpTransport does the same on httpx.AsyncClient for the ASGI app
+(asgi.py); its per-host stats are kept separately.
+
+Upstream base URLs can be overridden (GROQ_API_BASE, HUBSPOT_API_BASE,
+CALENDLY_API_BASE) so local fake servers can stand in for the real APIs,
+see benchmarks/fake_upstreams.py.
+"""
+import os
+import time
+import asyncio
+import random
+import logging
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import UPSTREAM_SECONDS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+GROQ_API_BASE = os.getenv("GROQ_API_BASE", "https://api.groq.com/openai/v1").rstrip("/")
+HUBSPOT_API_BASE = os.getenv("HUBSPOT_API_BASE", "https://api.hubapi.com").rstrip("/")
+CALENDLY_API_BASE = os.getenv("CALENDLY_API_BASE", "https://api.calendly.com").rstrip("/")
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))  # seconds
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))  # seconds
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))  # keep-alive connections per host
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+class HostStats:
+    """Request counts and latency for one upstream host."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.statuses = {}
+
+    def record(self, elapsed, status=None):
+        self.requests += 1
+        self.total_seconds += elapsed
+        self.max_seconds = max(self.max_seconds, elapsed)
+        if status is None:
+            self.errors += 1
+        else:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status >= 500:
+                self.errors += 1
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": round(1000 * self.total_seconds / self.requests, 2) if self.requests else 0.0,
+            "max_ms": round(1000 * self.max_seconds, 2),
+            "statuses": dict(self.statuses)
+        }
+
+class HttpTransport:
+    """Per-host keep-alive pools with timeouts, bounded retries and latency metrics."""
+
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 max_retries=HTTP_MAX_RETRIES, pool_size=HTTP_POOL_SIZE):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self._sessions = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _session(self, host):
+        with self._lock:
+            # Pooled sockets must not be shared with a forked child
+            if self._pid != os.getpid():
+                self._sessions = {}
+                self._stats = {}
+                self._pid = os.getpid()
+
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+                self._stats[host] = HostStats()
+            return session, self._stats[host]
+
+    @staticmethod
+    def _backoff(attempt, response=None):
+        """Jittered exponential backoff, or the server's Retry-After if it sent one."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), HTTP_BACKOFF_MAX)
+        return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+    def request(self, method, url, idempotent=None, timeout=None, **kwargs):
+        """Send a request, retrying 429/5xx and connection failures where it is safe.
+
+        429 is always retried (the request was not processed). 5xx responses
+        and connection errors are only retried for idempotent requests; pass
+        idempotent=True for POSTs that are safe to repeat, such as searches.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+
+        host = urlparse(url).netloc
+        session, stats = self._session(host)
+        timeout = timeout or self.timeout
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                elapsed = time.perf_counter() - started
+                stats.record(elapsed)
+                UPSTREAM_SECONDS.observe(elapsed, host=host, method=method, status="error")
+                # A failed connect never reached the server, so it is always safe to retry
+                safe = idempotent or isinstance(e, requests.exceptions.ConnectTimeout)
+                if not safe or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"{method} {host} failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+            else:
+                elapsed = time.perf_counter() - started
+                status = response.status_code
+                stats.record(elapsed, status)
+                UPSTREAM_SECONDS.observe(elapsed, host=host, method=method, status=status)
+                retryable = status == 429 or (status in RETRY_STATUSES and idempotent)
+                if not retryable or attempt >= self.max_retries:
+                    return response
+                delay = self._backoff(attempt, response)
+                logger.warning(f"{method} {host} returned {status}, retrying in {delay:.2f}s")
+                response.close()
+
+            stats.retries += 1
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def stats(self):
+        """Per-host request counts and latency."""
+        with self._lock:
+            return {host: host_stats.to_dict() for host, host_stats in self._stats.items()}
+
+class AsyncHttpTransport:
+    """HttpTransport for asyncio: one httpx.AsyncClient per event loop, same timeouts, retries and metrics."""
+
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 max_retries=HTTP_MAX_RETRIES, pool_size=HTTP_POOL_SIZE):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self._client = None
+        self._loop = None
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            # Connections belong to the loop that opened them
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                # pool_size keep-alive connections for each of the three upstream hosts
+                limits=httpx.Limits(max_keepalive_connections=self.pool_size * 3, max_connections=None)
+            )
+            self._loop = loop
+        return self._client
+
+    def _host_stats(self, host):
+        with self._lock:
+            if host not in self._stats:
+                self._stats[host] = HostStats()
+            return self._stats[host]
+
+    async def request(self, method, url, idempotent=None, timeout=None, **kwargs):
+        """Async HttpTransport.request: same retry rules, returns an httpx.Response."""
+        import httpx
+
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+
+        host = urlparse(url).netloc
+        client = self._get_client()
+        stats = self._host_stats(host)
+        if timeout is not None and isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                elapsed = time.perf_counter() - started
+                stats.record(elapsed)
+                UPSTREAM_SECONDS.observe(elapsed, host=host, method=method, status="error")
+                # A failed connect never reached the server, so it is always safe to retry
+                safe = idempotent or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not safe or attempt >= self.max_retries:
+                    raise
+                delay = HttpTransport._backoff(attempt)
+                logger.warning(f"{method} {host} failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+            else:
+                elapsed = time.perf_counter() - started
+                status = response.status_code
+                stats.record(elapsed, status)
+                UPSTREAM_SECONDS.observe(elapsed, host=host, method=method, status=status)
+                retryable = status == 429 or (status in RETRY_STATUSES and idempotent)
+                if not retryable or attempt >= self.max_retries:
+                    return response
+                delay = HttpTransport._backoff(attempt, response)
+                logger.warning(f"{method} {host} returned {status}, retrying in {delay:.2f}s")
+
+            stats.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def patch(self, url, **kwargs):
+        return await self.request("PATCH", url, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self):
+        """Per-host request counts and latency."""
+        with self._lock:
+            return {host: host_stats.to_dict() for host, host_stats in self._stats.items()}
+
+# Shared by all integrations in this process
+transport = HttpTransport()
+async_transport = AsyncHttpTransport()
@@ -1,8 +1,8 @@
 # utils/llm.py
 
 import os
-import requests
 from dotenv import load_dotenv
+from utils.http_client import transport, GROQ_API_BASE
 
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -11,7 +11,7 @@ def call_groq_llama(context, question):
     """
     Sends context + question to Groq LLaMA API and returns the response.
     """
-    url = "https://api.groq.com/openai/v1/chat/completions"
+    url = f"{GROQ_API_BASE}/chat/completions"
     headers = {
         "Authorization": f"Bearer {GROQ_API_KEY}",
         "Content-Type": "application/json"
@@ -33,7 +33,7 @@ def call_groq_llama(context, question):
     }
 
     try:
-        response = requests.post(url, headers=headers, json=data)
+        response = transport.post(url, headers=headers, json=data, idempotent=True)
         result = response.json()
         return result['choices'][0]['message']['content']
     except Exception as e:
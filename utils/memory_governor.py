@@ -0,0 +1,205 @@
+"""
+Keeps a worker under its memory limit by watching its RSS.
+
+A background thread samples the process RSS with psutil every
+MEMORY_CHECK_INTERVAL seconds and compares it with MEMORY_LIMIT_MB (512 on
+Render's free plan). Each threshold above the previous one adds a response:
+
+    shrink  (MEMORY_SHRINK_AT, default 75%)  drop caches and collect garbage
+    unload  (MEMORY_UNLOAD_AT, default 85%)  also unload the embedding model
+    shed    (MEMORY_SHED_AT, default 95%)    also answer chat turns without
+                                             retrieval or the LLM
+
+Modules register what to do at each level with register_response, e.g.
+vector_search unloads its model at "unload". A level's responses run once
+when RSS crosses its threshold. The level is left only when RSS falls
+MEMORY_RECOVER_MARGIN below the threshold, and entering it again runs the
+responses again. So the model reloads and chat turns are answered normally
+once memory recovers.
+
+If RSS stays at "unload" or above for MEMORY_RECYCLE_AFTER seconds, the
+responses have not freed enough (e.g. memory the allocator will not return).
+The governor then calls its recycle hook, which gunicorn.conf.py sets to a
+graceful exit so gunicorn replaces the worker with a fresh one.
+
+The same thread runs a full garbage collection every GC_INTERVAL seconds,
+off the request path. MEMORY_OPTIMIZATION=False turns all of this off.
+"""
+import os
+import gc
+import time
+import logging
+import threading
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MEMORY_OPTIMIZATION = os.getenv("MEMORY_OPTIMIZATION", "True").lower() == "true"
+MEMORY_LIMIT_MB = int(os.getenv("MEMORY_LIMIT_MB", "512"))
+MEMORY_CHECK_INTERVAL = float(os.getenv("MEMORY_CHECK_INTERVAL", "5"))  # seconds
+MEMORY_RECOVER_MARGIN = float(os.getenv("MEMORY_RECOVER_MARGIN", "0.05"))  # fraction of MEMORY_LIMIT_MB
+MEMORY_RECYCLE_AFTER = float(os.getenv("MEMORY_RECYCLE_AFTER", "120"))  # seconds, 0 = never
+GC_INTERVAL = int(os.getenv("GC_INTERVAL", "300"))  # seconds, 0 = never; the model's idle unload is VECTOR_IDLE_TIMEOUT
+
+# Pressure levels in increasing order, with the fraction of MEMORY_LIMIT_MB that enters each
+LEVELS = ("ok", "shrink", "unload", "shed")
+THRESHOLDS = {
+    "shrink": float(os.getenv("MEMORY_SHRINK_AT", "0.75")),
+    "unload": float(os.getenv("MEMORY_UNLOAD_AT", "0.85")),
+    "shed": float(os.getenv("MEMORY_SHED_AT", "0.95"))
+}
+
+_responses = {level: [] for level in LEVELS[1:]}
+
+def register_response(level, response):
+    """Call response() whenever memory pressure reaches level ("shrink", "unload" or "shed")."""
+    _responses[level].append(response)
+    return response
+
+def _rss():
+    import psutil
+
+    return psutil.Process().memory_info().rss
+
+class MemoryGovernor:
+    """Samples RSS and runs the registered responses for the current pressure level."""
+
+    def __init__(self, limit_mb=MEMORY_LIMIT_MB, thresholds=THRESHOLDS, enabled=MEMORY_OPTIMIZATION):
+        self.limit = limit_mb * 1024 * 1024
+        self.thresholds = dict(thresholds)
+        self.enabled = enabled
+        self.rss = 0
+        self.level = "ok"
+        self.recycle = None  # Set where something replaces this process when it exits (gunicorn.conf.py)
+        self._acted = set()  # Levels whose responses ran since RSS last recovered below them
+        self._pressure_since = None  # When RSS reached "unload" without recovering since
+        self._recycling = False
+        self._last_gc = time.monotonic()
+        self._lock = threading.Lock()
+        self._pid = None  # Process the sampling thread was started in
+        self._stats = {"samples": 0, "collections": 0, "shed_turns": 0, "recycles": 0}
+        self._stats.update({f"{level}_actions": 0 for level in LEVELS[1:]})
+
+    def _level_for(self, rss, current="ok"):
+        level = "ok"
+        for name in LEVELS[1:]:
+            if rss >= self.limit * self.thresholds[name]:
+                level = name
+        # Stay at a higher level until RSS is a margin below its threshold, so it does not flap
+        for name in LEVELS[LEVELS.index(level) + 1:LEVELS.index(current) + 1]:
+            if rss >= self.limit * (self.thresholds[name] - MEMORY_RECOVER_MARGIN):
+                level = name
+        return level
+
+    def sample(self):
+        """Measure RSS, update the level and run the responses that are due; returns the level."""
+        try:
+            rss = _rss()
+        except Exception as e:
+            logger.warning(f"Could not read process memory: {str(e)}")
+            return self.level
+
+        now = time.monotonic()
+        with self._lock:
+            previous = self.level
+            self.rss = rss
+            self.level = self._level_for(rss, previous)
+            self._stats["samples"] += 1
+            reached = LEVELS[1:LEVELS.index(self.level) + 1]
+            # Responses run once per crossing; a level left behind runs them again when re-entered
+            self._acted.intersection_update(reached)
+            due = [name for name in reached if name not in self._acted]
+            self._acted.update(due)
+            for name in due:
+                self._stats[f"{name}_actions"] += 1
+
+            recycle = False
+            if self.level in ("unload", "shed"):
+                if self._pressure_since is None:
+                    self._pressure_since = now
+                recycle = (self.recycle is not None and not self._recycling and MEMORY_RECYCLE_AFTER > 0
+                           and now - self._pressure_since >= MEMORY_RECYCLE_AFTER)
+                if recycle:
+                    self._recycling = True
+                    self._stats["recycles"] += 1
+            else:
+                self._pressure_since = None
+
+        if self.level != previous:
+            log = logger.warning if LEVELS.index(self.level) > LEVELS.index(previous) else logger.info
+            log(f"Memory pressure {previous} -> {self.level} (RSS {rss / 1024 / 1024:.0f} MB of {self.limit / 1024 / 1024:.0f} MB)")
+
+        for name in due:
+            for response in _responses[name]:
+                try:
+                    response()
+                except Exception as e:
+                    logger.error(f"Memory response {getattr(response, '__name__', response)} failed: {str(e)}")
+        if due:
+            self._collect()
+
+        if recycle:
+            logger.warning(f"Memory pressure for {MEMORY_RECYCLE_AFTER:.0f}s (RSS {rss / 1024 / 1024:.0f} MB), recycling worker {os.getpid()}")
+            try:
+                self.recycle()
+            except Exception as e:
+                logger.error(f"Could not recycle worker: {str(e)}")
+        return self.level
+
+    def _collect(self):
+        gc.collect()
+        with self._lock:
+            self._last_gc = time.monotonic()
+            self._stats["collections"] += 1
+
+    def _run(self):
+        while True:
+            time.sleep(MEMORY_CHECK_INTERVAL)
+            self.sample()
+            if GC_INTERVAL > 0 and time.monotonic() - self._last_gc >= GC_INTERVAL:
+                self._collect()
+
+    def start(self):
+        """Start sampling in this process (threads do not survive a gunicorn fork, so call per worker)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Pressure seen by the parent before a fork is not this process's
+            self._pressure_since = None
+            self._recycling = False
+
+        threading.Thread(target=self._run, name="memory-governor", daemon=True).start()
+        logger.info(f"Memory governor started (limit {self.limit // (1024 * 1024)} MB, pid {os.getpid()})")
+
+    def at_least(self, level):
+        """Whether the last sampled pressure is level or higher."""
+        return self.enabled and LEVELS.index(self.level) >= LEVELS.index(level)
+
+    def shedding(self):
+        """Whether new heavy work (retrieval, LLM calls) should be refused, as of the last sample."""
+        if not self.enabled:
+            return False
+        # Sampling (and the responses it may run) stays on the background thread
+        self.start()
+        if self.level != "shed":
+            return False
+        with self._lock:
+            self._stats["shed_turns"] += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "enabled": self.enabled,
+                "level": self.level,
+                "rss_bytes": self.rss,
+                "limit_bytes": self.limit
+            })
+        return stats
+
+# Shared by everything in this process
+memory_governor = MemoryGovernor()
@@ -0,0 +1,146 @@
+"""
+Latency histograms and counters, exposed in the Prometheus text format.
+
+Modules record into metrics declared here:
+
+    with UPSTREAM_SECONDS.time(host="api.groq.com", method="POST") as labels:
+        ...
+        labels["status"] = response.status_code
+
+and app.py serves render() at /metrics, together with gauges from the
+collectors registered with register_collector (cache hit rates, model state,
+queue depth, RSS). /metrics is only served when METRICS_TOKEN is set, to
+scrapers that send it as a Bearer token.
+
+Metrics are per process. gunicorn.conf.py runs a single worker by default,
+so one scrape covers the app. With more workers each scrape sees whichever
+worker answered.
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+_collectors = []
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+class Histogram:
+    """Cumulative-bucket latency histogram per label set, in seconds."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, seconds, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += seconds
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block; labels may be filled in inside it."""
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, values):
+                lines.append(f"{self.name}_bucket{_format_labels(dict(labels, le=_format_value(float(bound))))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(dict(labels, le='+Inf'))} {values[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {values[-2]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {round(values[-1], 6)}")
+        return lines
+
+class Counter:
+    """Monotonic count per label set."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+def register_collector(collector):
+    """Add a function returning [(name, documentation, type, [(labels, value), ...]), ...], called per scrape."""
+    _collectors.append(collector)
+    return collector
+
+def render():
+    """All metrics and collected values in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, documentation, kind, samples in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if value is not None:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+# Shared metrics, recorded by the modules they name
+CHAT_STAGE_SECONDS = Histogram("chat_stage_seconds", "Duration of each chat turn stage.", ["stage"])
+CHAT_STAGE_DEGRADED = Counter(
+    "chat_stage_degraded_total", "Chat turn stages that failed or missed their deadline.", ["stage"]
+)
+VECTOR_SEARCH_SECONDS = Histogram(
+    "vector_search_seconds", "Vector search steps: model load, query encode and index search.", ["step"]
+)
+VECTOR_SEARCH_BATCH_SIZE = Histogram(
+    "vector_search_batch_size", "Queries per batched encode and search.", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_seconds", "Outbound API calls per attempt, by host, method and status.",
+    ["host", "method", "status"]
+)
+SESSION_SECONDS = Histogram("session_seconds", "Session load and save, including serialization.", ["op", "backend"])
+REQUEST_SECONDS = Histogram("http_request_seconds", "Requests served, by endpoint and status.", ["endpoint", "status"])
@@ -0,0 +1,245 @@
+"""
+Server-side Flask sessions.
+
+The session cookie carries only an opaque random id; the session data (user
+info and the conversation) lives in a backend chosen with SESSION_BACKEND:
+
+    sqlite   a local SQLite file shared by all gunicorn workers (default)
+    memory   an in-process LRU, for single-process deployments and development
+    redis    any Redis-compatible server at SESSION_REDIS_URL (needs the redis package)
+    cookie   Flask's signed cookie sessions, as before
+
+Entries expire after PERMANENT_SESSION_LIFETIME seconds without a write.
+The conversation is stored as a bounded list of structured turns, see
+chatbot/conversation.py.
+"""
+import os
+import json
+import time
+import sqlite3
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from utils.metrics import SESSION_SECONDS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite").lower()
+SESSION_SQLITE_PATH = os.getenv(
+    "SESSION_SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sessions.sqlite3")
+)
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_MEMORY_MAX = int(os.getenv("SESSION_MEMORY_MAX", "10000"))  # sessions kept by the memory backend
+
+class MemorySessionStore:
+    """In-process LRU of session data with per-entry expiry."""
+
+    name = "memory"
+
+    def __init__(self, max_entries=SESSION_MEMORY_MAX):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            data, expires = entry
+            if expires < time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            # Callers mutate the returned dict; keep the stored copy intact
+            return json.loads(data)
+
+    def set(self, sid, data, ttl):
+        with self._lock:
+            self._entries[sid] = (json.dumps(data), time.time() + ttl)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+class SqliteSessionStore:
+    """Session data in a SQLite table, shared by every process on the host."""
+
+    name = "sqlite"
+    PURGE_INTERVAL = 300  # seconds between sweeps of expired sessions
+
+    def __init__(self, path=SESSION_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._last_purge = 0.0
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, sid):
+        row = self._connect().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires >= ?", (sid, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, sid, data, ttl):
+        now = time.time()
+        connection = self._connect()
+        connection.execute(
+            "INSERT INTO sessions (sid, data, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (sid) DO UPDATE SET data = excluded.data, expires = excluded.expires",
+            (sid, json.dumps(data), now + ttl)
+        )
+        if now - self._last_purge > self.PURGE_INTERVAL:
+            self._last_purge = now
+            connection.execute("DELETE FROM sessions WHERE expires < ?", (now,))
+
+    def delete(self, sid):
+        self._connect().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+class RedisSessionStore:
+    """Session data in Redis (or anything speaking its protocol), expired by Redis itself."""
+
+    name = "redis"
+
+    def __init__(self, url=SESSION_REDIS_URL, prefix="session:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, sid):
+        data = self.client.get(self.prefix + sid)
+        return json.loads(data) if data else None
+
+    def set(self, sid, data, ttl):
+        self.client.set(self.prefix + sid, json.dumps(data), ex=max(1, int(ttl)))
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+STORES = {
+    "memory": MemorySessionStore,
+    "sqlite": SqliteSessionStore,
+    "redis": RedisSessionStore
+}
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its id and whether it changed."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+class ServerSideSessionInterface(SessionInterface):
+    """Keeps session data in a store; the cookie only holds the session id."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def _ttl(self, app):
+        return app.permanent_session_lifetime.total_seconds()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.config["SESSION_COOKIE_NAME"])
+        if sid:
+            try:
+                with SESSION_SECONDS.time(op="open", backend=self.store.name):
+                    data = self.store.get(sid)
+            except Exception as e:
+                logger.error(f"Could not load session: {str(e)}")
+                data = None
+            if data is not None:
+                return ServerSideSession(data, sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def persist(self, session, app):
+        """Write the session to the store now, e.g. after a streamed response has started."""
+        with SESSION_SECONDS.time(op="save", backend=self.store.name):
+            self.store.set(session.sid, dict(session), self._ttl(app))
+        session.modified = False
+
+    def save_session(self, app, session, response):
+        name = app.config["SESSION_COOKIE_NAME"]
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified:
+            try:
+                self.persist(session, app)
+            except Exception as e:
+                logger.error(f"Could not save session: {str(e)}")
+                return
+
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+
+class CookieSessionInterface(SecureCookieSessionInterface):
+    """Flask's signed cookie sessions, timed like the server-side ones."""
+
+    def open_session(self, app, request):
+        with SESSION_SECONDS.time(op="open", backend="cookie"):
+            return super().open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with SESSION_SECONDS.time(op="save", backend="cookie"):
+            return super().save_session(app, session, response)
+
+def init_session(app, backend=None):
+    """Install the configured session backend on a Flask app; returns the store (None for cookies)."""
+    backend = (backend or SESSION_BACKEND).lower()
+    if backend == "cookie":
+        app.session_interface = CookieSessionInterface()
+        return None
+    if backend not in STORES:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend} (expected cookie or one of {', '.join(STORES)})")
+
+    try:
+        store = STORES[backend]()
+    except Exception as e:
+        logger.error(f"Could not start {backend} session store, using sqlite: {str(e)}")
+        backend, store = "sqlite", SqliteSessionStore()
+
+    app.session_interface = ServerSideSessionInterface(store)
+    logger.info(f"Using {backend} server-side sessions")
+    return store